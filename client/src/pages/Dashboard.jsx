@@ -254,6 +254,7 @@ function Dashboard() {
   const [allFiles, setAllFiles] = useState([]);
   const [loading, setLoading] = useState(true);
   const [currentView, setCurrentView] = useState("active"); // 'active', 'trashed', 'archived'
+  const [nextCursor, setNextCursor] = useState(null); // Cursor for the next page of files
   const [isUploadOpen, setIsUploadOpen] = useState(false);
   const [shareDialogOpen, setShareDialogOpen] = useState(false);
   const [generatedLink, setGeneratedLink] = useState("");
@@ -263,14 +264,17 @@ function Dashboard() {
   const [userEmail, setUserEmail] = useState("Loading...");
   const navigate = useNavigate();
 
-  const fetchData = async () => {
+  // Loads the first page of the current view, or the next page when a cursor is given
+  const fetchData = async (cursor = null) => {
     setLoading(true);
     try {
       const token = localStorage.getItem("access_token");
       const response = await axios.get("http://localhost:5002/files/my-files", {
         headers: { Authorization: `Bearer ${token}` },
+        params: { status: currentView, ...(cursor && { cursor }) },
       });
-      setAllFiles(response.data);
+      setAllFiles((files) => (cursor ? [...files, ...response.data] : response.data));
+      setNextCursor(response.headers["x-next-cursor"] || null);
     } catch (error) {
       toast.error("Could not fetch your files.");
     } finally {
@@ -298,9 +302,12 @@ function Dashboard() {
     };
 
     fetchUserEmail();
-    fetchData();
   }, []);
 
+  useEffect(() => {
+    fetchData();
+  }, [currentView]);
+
   const handleStatusChange = async (fileId, newStatus) => {
     try {
       const token = localStorage.getItem("access_token");
@@ -565,6 +572,11 @@ function Dashboard() {
               This folder is empty.
             </Typography>
           )}
+          {nextCursor && !loading && (
+            <Box sx={{ p: 2, textAlign: "center" }}>
+              <Button onClick={() => fetchData(nextCursor)}>Load more</Button>
+            </Box>
+          )}
         </Paper>
       </Box>
 
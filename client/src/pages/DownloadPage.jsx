@@ -59,20 +59,25 @@ function DownloadPage() {
 
     const fetchLinkDetails = async () => {
       try {
-        // Step 1: Get the wrapped key and file_id from the access control service
-        const detailsRes = await axios.get(`http://localhost:5003/access/link/details/${shareId}`);
-        const { file_id, wrapped_key } = detailsRes.data;
-
-        // Step 2: Get the public file metadata from the file service
-        // NOTE: This endpoint needs to be created in your file_service
-        // For now, we'll just use a placeholder name
-        const metaRes = await axios.get(`http://localhost:5002/files/public-meta/${file_id}`);
+        // One request: consumes the link and returns the wrapped key,
+        // the file's metadata and where to download the blob from
+        const resolveRes = await axios.get(`http://localhost:5003/access/link/resolve/${shareId}`);
+        const { file_id, wrapped_key, download_url } = resolveRes.data;
+        let { filename, size } = resolveRes.data;
+
+        // The access service leaves the metadata out when it can't reach the
+        // file service; the link is already used, so look it up directly
+        if (!filename) {
+          const metaRes = await axios.get(`http://localhost:5002/files/public-meta/${file_id}`);
+          ({ filename, size } = metaRes.data);
+        }
 
         setFileInfo({
           file_id,
           wrapped_key,
-          filename: metaRes.data.filename,
-          size: metaRes.data.size,
+          filename,
+          size,
+          download_url,
         });
         setStatus('ready');
       } catch (err) {
@@ -92,11 +97,17 @@ function DownloadPage() {
         const fileKey = await unwrapFileKey(fileInfo.wrapped_key, linkSecret);
         if (!fileKey) throw new Error("Decryption key is invalid. The link secret may be wrong.");
 
-        // Step 2: Download the encrypted file blob
-        // NOTE: This endpoint needs to be created in your file_service
-        const fileRes = await axios.get(`http://localhost:5002/files/download/${fileInfo.file_id}`, {
-            responseType: 'blob',
-        });
+        // Step 2: Download the encrypted file blob from the URL the link resolved to.
+        // A signed storage URL may have expired if the page sat open; the file
+        // service can always serve the blob itself.
+        let fileRes;
+        try {
+            fileRes = await axios.get(fileInfo.download_url, { responseType: 'blob' });
+        } catch (error) {
+            fileRes = await axios.get(`http://localhost:5002/files/download/${fileInfo.file_id}`, {
+                responseType: 'blob',
+            });
+        }
         const encryptedBlob = fileRes.data;
 
         // Step 3: Decrypt the blob
@@ -22,6 +22,48 @@ function UploadFile({ onUploadComplete }) {
     }
   };
 
+  // Returns the new file record, or null if the server can't do direct uploads
+  const uploadDirect = async (encryptedFileBlob, token) => {
+    const authHeaders = { 'Authorization': `Bearer ${token}` };
+    let session;
+    try {
+      session = await axios.post('http://localhost:5002/files/direct-uploads', {
+        filename: file.name,
+        contentType: file.type,
+        size: encryptedFileBlob.size
+      }, { headers: authHeaders });
+    } catch (error) {
+      if (error.response?.status === 501) {
+        return null;
+      }
+      throw error;
+    }
+
+    await axios.put(session.data.upload_url, encryptedFileBlob, {
+      headers: { 'Content-Type': 'application/octet-stream' }
+    });
+
+    const response = await axios.post(
+      `http://localhost:5002/files/uploads/${session.data.upload.id}/confirm`, null, { headers: authHeaders }
+    );
+    return response.data.file;
+  };
+
+  const uploadThroughService = async (encryptedFileBlob, token) => {
+    const formData = new FormData();
+    formData.append('file', encryptedFileBlob);
+    formData.append('filename', file.name);
+    formData.append('contentType', file.type);
+    formData.append('size', encryptedFileBlob.size);
+
+    const response = await axios.post('http://localhost:5002/files/upload', formData, {
+      headers: {
+        'Authorization': `Bearer ${token}`
+      },
+    });
+    return response.data.file;
+  };
+
   const handleUpload = async () => {
     if (!file) {
       toast.error('Please select a file first.');
@@ -64,21 +106,11 @@ function UploadFile({ onUploadComplete }) {
       
       const encryptedFileBlob = new Blob([iv, new Uint8Array(encryptedFileBuffer)], { type: 'application/octet-stream' });
 
-      // 4. Prepare metadata and upload
-      const formData = new FormData();
-      formData.append('file', encryptedFileBlob);
-      formData.append('filename', file.name);
-      formData.append('contentType', file.type);
-      formData.append('size', encryptedFileBlob.size);
-      
-      const response = await axios.post('http://localhost:5002/files/upload', formData, {
-        headers: {
-          'Authorization': `Bearer ${token}`
-        },
-      });
+      // 4. Upload straight to object storage when the server supports it,
+      //    otherwise send the blob through the file service
+      const newFile = await uploadDirect(encryptedFileBlob, token) || await uploadThroughService(encryptedFileBlob, token);
 
       // 5. Securely store the new file key in IndexedDB
-      const newFile = response.data.file;
       await storeFileKey(newFile.id, aesKey)
 
       setShowSuccessDialog(true);
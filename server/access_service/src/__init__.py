@@ -3,9 +3,17 @@ from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from flask_redis import FlaskRedis
 from src.config import config
+from src.file_service import FileServiceClient
+from src.redis_provider import RedisProvider, redis_options
+from src.rate_limit import RateLimiter
+from src.negative_cache import UnknownLinkCache
 
 jwt = JWTManager()
-redis_client = FlaskRedis()
+# Standalone, Sentinel or Cluster, per REDIS_MODE
+redis_client = FlaskRedis.from_custom_provider(RedisProvider)
+file_service = FileServiceClient()
+rate_limiter = RateLimiter()
+unknown_links = UnknownLinkCache()
 
 def create_app(config_name='default'):
     app = Flask(__name__)
@@ -13,12 +21,23 @@ def create_app(config_name='default'):
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
     
-    CORS(app, resources={r"/*": {"origins": "*"}})
+    CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=["Retry-After"])
      
     jwt.init_app(app)
-    redis_client.init_app(app)
+    redis_client.init_app(app, **redis_options(app.config))
+    file_service.init_app(app)
+    rate_limiter.init_app(app, redis=redis_client)
+    unknown_links.init_app(app)
 
     from src.routes import access_bp
     app.register_blueprint(access_bp)
 
+    from src.migrate_keys import migrate_redis_keys_command
+    app.cli.add_command(migrate_redis_keys_command)
+
+    from src.events import aggregate_link_events_command, watch_link_expiry_command, link_stats_command
+    app.cli.add_command(aggregate_link_events_command)
+    app.cli.add_command(watch_link_expiry_command)
+    app.cli.add_command(link_stats_command)
+
     return app
\ No newline at end of file
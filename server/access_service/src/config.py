@@ -7,6 +7,54 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY')
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY')
     REDIS_URL = os.environ.get('REDIS_URL')
+    # 'standalone' (REDIS_URL), 'sentinel' (REDIS_SENTINELS, with REDIS_URL
+    # only for db/credentials) or 'cluster' (REDIS_URL of any cluster node)
+    REDIS_MODE = os.environ.get('REDIS_MODE', 'standalone')
+    REDIS_SENTINELS = os.environ.get('REDIS_SENTINELS') # "host:26379,host2:26379"
+    REDIS_SENTINEL_SERVICE = os.environ.get('REDIS_SENTINEL_SERVICE', 'mymaster')
+    REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 50))
+    REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 2))
+    # Retries of a command that hit a dropped connection, e.g. during failover
+    REDIS_RETRIES = int(os.environ.get('REDIS_RETRIES', 3))
+
+    # file_service as reached from inside the cluster, for share resolution
+    FILE_SERVICE_INTERNAL_URL = os.environ.get('FILE_SERVICE_INTERNAL_URL', 'http://file_service:8000')
+    # file_service as browsers reach it, for download URLs
+    FILE_SERVICE_PUBLIC_URL = os.environ.get('FILE_SERVICE_PUBLIC_URL', 'http://localhost:5002')
+    # Shared secret for service-to-service calls (must match file_service)
+    INTERNAL_API_TOKEN = os.environ.get('INTERNAL_API_TOKEN')
+    FILE_SERVICE_TIMEOUT = float(os.environ.get('FILE_SERVICE_TIMEOUT', 2))
+
+    # Most links a single /link/create-bulk request may create
+    BULK_MAX_LINKS = int(os.environ.get('BULK_MAX_LINKS', 1000))
+
+    # Page size of /access/links, the owner's list of active links
+    LINKS_PAGE_SIZE = int(os.environ.get('LINKS_PAGE_SIZE', 50))
+    LINKS_MAX_PAGE_SIZE = int(os.environ.get('LINKS_MAX_PAGE_SIZE', 200))
+
+    # Keys the owner tag in share IDs (see keys.py). Changing it splits each
+    # owner's existing links from their new ones in /access/links.
+    SHARE_TAG_KEY = os.environ.get('SHARE_TAG_KEY') or SECRET_KEY
+
+    # Link lifecycle events (see events.py) and the hourly counters made from them
+    LINK_EVENTS_ENABLED = os.environ.get('LINK_EVENTS_ENABLED', 'true').lower() in ['true', 'on', '1']
+    LINK_EVENTS_STREAM = os.environ.get('LINK_EVENTS_STREAM', 'link-events')
+    # Approximate length the stream is trimmed to
+    LINK_EVENTS_MAXLEN = int(os.environ.get('LINK_EVENTS_MAXLEN', 1000000))
+    LINK_STATS_RETENTION_DAYS = int(os.environ.get('LINK_STATS_RETENTION_DAYS', 90))
+
+    # In-process cache of share IDs Redis has no link for (see negative_cache.py)
+    UNKNOWN_LINK_CACHE_ENABLED = os.environ.get('UNKNOWN_LINK_CACHE_ENABLED', 'true').lower() in ['true', 'on', '1']
+    UNKNOWN_LINK_CACHE_TTL = int(os.environ.get('UNKNOWN_LINK_CACHE_TTL', 60))
+    UNKNOWN_LINK_CACHE_MAX_ENTRIES = int(os.environ.get('UNKNOWN_LINK_CACHE_MAX_ENTRIES', 100000))
+
+    # Rate limit of the public link endpoints (details and resolve),
+    # '<requests>/<seconds>' ('' for none), counted per 'ip', 'user' or 'id'
+    # (see rate_limit.py)
+    RATE_LIMIT_LINK_DETAILS = os.environ.get('RATE_LIMIT_LINK_DETAILS', '20/60')
+    RATE_LIMIT_LINK_DETAILS_BY = os.environ.get('RATE_LIMIT_LINK_DETAILS_BY', 'ip')
+    # Proxies in front of the service that append to X-Forwarded-For
+    RATE_LIMIT_TRUSTED_PROXIES = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', 0))
     
     @staticmethod
     def init_app(app):
@@ -21,6 +69,12 @@ class TestingConfig(Config):
     TESTING = True
     # For testing, you might want a separate test database
     WTF_CSRF_ENABLED = False 
+    # Tests swap in their own Redis; the ones that need limits set them
+    RATE_LIMIT_LINK_DETAILS = ''
+    # Each test starts with an empty Redis, so remembered misses would leak between tests
+    UNKNOWN_LINK_CACHE_ENABLED = False
+    # Calls to file_service are mocked, but only made with a token configured
+    INTERNAL_API_TOKEN = 'test-internal-token'
 
 class ProductionConfig(Config):
     """Configuration for production."""
@@ -0,0 +1,242 @@
+import socket
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from redis.exceptions import ResponseError
+from src import redis_client
+from src.keys import share_id_from_key
+
+# Lifecycle events of share links, appended to a Redis Stream:
+#   created   /link/create and /link/create-bulk stored the link
+#   consumed  a use of the link was taken; used_up=1 if it was the last one,
+#             expires_at its expiry (Unix time; empty for links older than that field)
+#   revoked   its owner deleted it
+#   expired   Redis expired its hash (keyspace notifications, watch-link-expiry)
+# Each entry has the event, the share_id and, where known, the owner_id;
+# the entry ID carries the time. The stream is a key of its own, written
+# after the link's own transaction, so failing to publish never fails a
+# request; the event is lost instead.
+
+STATS_GROUP = 'link-stats'
+
+
+def stream_name():
+    return current_app.config.get('LINK_EVENTS_STREAM', 'link-events')
+
+
+def publish_link_events(events):
+    """Appends (event, share_id, fields) tuples to the stream in one round trip."""
+    config = current_app.config
+    if not events or not config.get('LINK_EVENTS_ENABLED', True):
+        return
+    try:
+        with redis_client.pipeline(transaction=False) as pipe:
+            for event, share_id, fields in events:
+                pipe.xadd(
+                    stream_name(), {"event": event, "share_id": share_id, **fields},
+                    maxlen=config.get('LINK_EVENTS_MAXLEN', 1000000), approximate=True
+                )
+            pipe.execute()
+    except Exception as e:
+        print(f"Error publishing link events: {e}")
+
+
+def publish_link_event(event, share_id, **fields):
+    publish_link_events([(event, share_id, fields)])
+
+
+def stats_key(hour):
+    return f"link-stats:{hour}"
+
+
+def entry_time(entry_id):
+    """'1700000000000-0' (a stream entry ID, in ms) -> 1700000000, in Unix seconds."""
+    return int(entry_id.decode('utf-8').partition('-')[0]) // 1000
+
+
+def entry_hour(entry_id):
+    """'1700000000000-0' (a stream entry ID) -> '2023-11-14T22', the UTC hour."""
+    return datetime.fromtimestamp(entry_time(entry_id), tz=timezone.utc).strftime('%Y-%m-%dT%H')
+
+
+class LinkStatsAggregator:
+    """
+    One consumer of the stream's consumer group; workers can run side by
+    side and share the events. Each batch is folded into hourly counters,
+    one hash per hour (link-stats:<YYYY-MM-DDTHH>) with a field per event,
+    plus used_up and expired_unused. Whatever its size, a batch costs three
+    round trips: the read, the used-up bookkeeping and the counters together
+    with the acknowledgement.
+
+    To tell links that expired unused from ones that were used up first,
+    used-up links wait in a sorted set (link-stats:used-up) scored by their
+    expiry. Each batch trims the ones that expired more than USED_UP_GRACE
+    seconds ago, so markers whose expired event was never published (no
+    watcher running) don't pile up.
+
+    Delivery is at-least-once: a batch that was counted but not acknowledged
+    before a worker died is claimed by another worker and counted again.
+    """
+
+    USED_UP_KEY = 'link-stats:used-up'
+    # How long a marker outlives its link, for expired events read late
+    USED_UP_GRACE = 86400
+
+    def __init__(self, redis, stream, consumer, batch_size=500, block_ms=5000,
+                 claim_idle_ms=60000, retention_days=90):
+        self.redis = redis
+        self.stream = stream
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.retention = int(timedelta(days=retention_days).total_seconds())
+
+    def ensure_group(self):
+        try:
+            # From the start of the stream, so events published before the
+            # first worker ran are counted too
+            self.redis.xgroup_create(self.stream, STATS_GROUP, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def read_batch(self):
+        # Batches a dead worker left unacknowledged come first
+        claimed = self.redis.xautoclaim(
+            self.stream, STATS_GROUP, self.consumer,
+            min_idle_time=self.claim_idle_ms, start_id='0-0', count=self.batch_size
+        )[1]
+        if claimed:
+            return claimed
+        response = self.redis.xreadgroup(
+            STATS_GROUP, self.consumer, {self.stream: '>'}, count=self.batch_size, block=self.block_ms
+        )
+        return response[0][1] if response else []
+
+    def process(self, entries):
+        """Counts a batch of (entry_id, fields) and acknowledges it."""
+        counts = Counter()
+        expired = []
+        with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(self.USED_UP_KEY, '-inf', time.time() - self.USED_UP_GRACE)
+            # Used-up bookkeeping, in event order; ZREM tells an expired
+            # link that had been used up from one that never was
+            for entry_id, fields in entries:
+                if not fields:
+                    continue # Trimmed from the stream before it was read
+                event = fields[b'event'].decode('utf-8')
+                share_id = fields[b'share_id']
+                hour = entry_hour(entry_id)
+                counts[(hour, event)] += 1
+                if event == 'consumed' and fields.get(b'used_up') == b'1':
+                    counts[(hour, 'used_up')] += 1
+                    # Links without a known expiry are kept as long as the counters
+                    expires_at = int(fields.get(b'expires_at') or 0) or entry_time(entry_id) + self.retention
+                    pipe.zadd(self.USED_UP_KEY, {share_id: expires_at})
+                elif event == 'revoked':
+                    pipe.zrem(self.USED_UP_KEY, share_id)
+                elif event == 'expired':
+                    pipe.zrem(self.USED_UP_KEY, share_id)
+                    expired.append((len(pipe), hour))
+            results = pipe.execute()
+
+        for position, hour in expired:
+            if not results[position - 1]:
+                counts[(hour, 'expired_unused')] += 1
+
+        with self.redis.pipeline(transaction=False) as pipe:
+            for (hour, field), count in counts.items():
+                pipe.hincrby(stats_key(hour), field, count)
+            for hour in {hour for hour, _ in counts}:
+                pipe.expire(stats_key(hour), self.retention)
+            if entries:
+                pipe.xack(self.stream, STATS_GROUP, *[entry_id for entry_id, _ in entries])
+            pipe.execute()
+        return len(entries)
+
+    def run_once(self):
+        return self.process(self.read_batch())
+
+
+def link_stats(redis, hours, now=None):
+    """Totals of the hourly counters over the last `hours` hours."""
+    now = now or datetime.now(timezone.utc)
+    keys = [stats_key((now - timedelta(hours=i)).strftime('%Y-%m-%dT%H')) for i in range(hours)]
+    with redis.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.hgetall(key)
+        counters = pipe.execute()
+    totals = Counter()
+    for counter in counters:
+        totals.update({field.decode('utf-8'): int(value) for field, value in counter.items()})
+    return totals
+
+
+@click.command('aggregate-link-events')
+@click.option('--consumer', default=socket.gethostname, help='Name of this worker in the consumer group.')
+@click.option('--batch-size', default=500, help='Most events folded into the counters at once.')
+@with_appcontext
+def aggregate_link_events_command(consumer, batch_size):
+    """Folds link lifecycle events into hourly counters, until stopped."""
+    aggregator = LinkStatsAggregator(
+        redis_client, stream_name(), consumer, batch_size=batch_size,
+        retention_days=current_app.config.get('LINK_STATS_RETENTION_DAYS', 90)
+    )
+    aggregator.ensure_group()
+    click.echo(f"Aggregating {stream_name()} as {consumer}")
+    while True:
+        try:
+            aggregator.run_once()
+        except Exception as e:
+            # Redis failing over; the unacknowledged batch is read again
+            print(f"Error aggregating link events: {e}")
+            time.sleep(1)
+
+
+@click.command('watch-link-expiry')
+@click.option('--configure', is_flag=True,
+              help='Turn on expiry notifications first (CONFIG SET notify-keyspace-events Ex).')
+@with_appcontext
+def watch_link_expiry_command(configure):
+    """
+    Publishes an 'expired' event for each share link Redis expires. Run
+    exactly one: every watcher receives every notification. Notifications
+    aren't queued, so links expiring while no watcher runs aren't counted.
+    """
+    # In a cluster every primary notifies only about its own keys
+    if hasattr(redis_client, 'get_primaries'):
+        clients = [redis_client.get_redis_connection(node) for node in redis_client.get_primaries()]
+    else:
+        clients = [redis_client]
+
+    pubsubs = []
+    for client in clients:
+        if configure:
+            client.config_set('notify-keyspace-events', 'Ex')
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe('__keyevent@*__:expired')
+        pubsubs.append(pubsub)
+    click.echo(f"Watching {len(pubsubs)} Redis node(s) for expired links")
+
+    while True:
+        events = []
+        for pubsub in pubsubs:
+            message = pubsub.get_message(timeout=1.0 / len(pubsubs))
+            share_id = share_id_from_key(message['data'].decode('utf-8')) if message else None
+            if share_id:
+                events.append(('expired', share_id, {}))
+        publish_link_events(events)
+
+
+@click.command('link-stats')
+@click.option('--hours', default=24, help='How many hours back to total.')
+@with_appcontext
+def link_stats_command(hours):
+    """Prints link lifecycle counts for the last hours."""
+    totals = link_stats(redis_client, hours)
+    for field in ('created', 'consumed', 'used_up', 'revoked', 'expired', 'expired_unused'):
+        click.echo(f"{field}: {totals.get(field, 0)}")
@@ -0,0 +1,52 @@
+import requests
+
+
+class FileServiceError(Exception):
+    """file_service could not be reached or answered with an unexpected error."""
+
+
+class FileServiceClient:
+    """
+    Flask extension for the internal calls access_service makes to file_service.
+    One keep-alive HTTP session is reused, so a call costs a single
+    in-cluster round trip rather than a new connection each time.
+    """
+
+    def __init__(self, app=None):
+        self.session = requests.Session()
+        self.base_url = None
+        self.token = None
+        self.timeout = 2
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.base_url = (app.config.get('FILE_SERVICE_INTERNAL_URL') or '').rstrip('/')
+        self.token = app.config.get('INTERNAL_API_TOKEN')
+        self.timeout = app.config.get('FILE_SERVICE_TIMEOUT', 2)
+        app.extensions['file_service'] = self
+
+    @property
+    def enabled(self):
+        """False when no internal URL or token is configured; file_service would refuse the call."""
+        return bool(self.base_url and self.token)
+
+    def get_share_meta(self, file_id):
+        """
+        Returns the metadata and download URL of a shared file,
+        or None if the file no longer exists.
+        """
+        try:
+            response = self.session.get(
+                f"{self.base_url}/files/internal/share-meta/{file_id}",
+                headers={"X-Internal-Token": self.token or ''},
+                timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            raise FileServiceError(str(e)) from e
+
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise FileServiceError(f"file_service answered {response.status_code}")
+        return response.json()
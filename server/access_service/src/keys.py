@@ -0,0 +1,58 @@
+import hashlib
+import hmac
+import uuid
+from src.config import Config
+
+# Redis Cluster picks a key's slot from the part inside {...} (the hash tag)
+# when there is one. A link's hash and its owner's index carry the same tag,
+# derived from the owner, so they always live on the same node: the scripts
+# and MULTI blocks that touch both keep working in a cluster, and so does a
+# bulk create, whose links all belong to one owner.
+#
+# The tag is also the first part of the share ID (<tag>.<uuid>), so the
+# recipient's request can be routed without knowing who the owner is. It is
+# an HMAC rather than a plain hash so that share IDs don't give the owner away.
+#
+# Links created before tagging have plain UUIDs as IDs and keep their
+# untagged hash (share:<uuid>) until they expire.
+
+SHARE_TAG_KEY = (Config.SHARE_TAG_KEY or '').encode('utf-8')
+
+
+def owner_tag(owner_id):
+    """The hash tag shared by an owner's links and their index."""
+    return hmac.new(SHARE_TAG_KEY, str(owner_id).encode('utf-8'), hashlib.sha256).hexdigest()[:8]
+
+
+def new_share_id(owner_id):
+    return f"{owner_tag(owner_id)}.{uuid.uuid4()}"
+
+
+def link_tag(share_id):
+    """The hash tag in a share ID, or None for an untagged (older) link."""
+    tag, dot, _ = share_id.partition('.')
+    return tag if dot and tag else None
+
+
+def link_key(share_id):
+    """The hash holding a link's data."""
+    tag = link_tag(share_id)
+    if tag is None:
+        return f"share:{share_id}"
+    return f"share:{{{tag}}}:{share_id.partition('.')[2]}"
+
+
+def share_id_from_key(key):
+    """Inverse of link_key; None for keys that aren't link hashes."""
+    if not key.startswith('share:'):
+        return None
+    name = key[len('share:'):]
+    if name.startswith('{'):
+        tag, _, rest = name[1:].partition('}:')
+        return f"{tag}.{rest}" if tag and rest else None
+    return name or None
+
+
+def owner_index_key(owner_id):
+    """Sorted set of an owner's active share IDs, scored by expiry (see scripts.py)."""
+    return f"share-owner:{{{owner_tag(owner_id)}}}:{owner_id}"
@@ -0,0 +1,57 @@
+import click
+import redis
+from flask.cli import with_appcontext
+from src import redis_client
+from src.keys import owner_index_key
+
+
+def untagged_keys(source, pattern):
+    """Names of keys matching pattern that carry no hash tag (written before tagging)."""
+    for key in source.scan_iter(match=pattern, count=500):
+        name = key.decode('utf-8')
+        if '{' not in name:
+            yield name
+
+
+def copy_key(source, old_name, new_name):
+    """
+    Copies a key to redis_client under new_name with DUMP/RESTORE, keeping
+    its remaining TTL. Returns False if the key expired in the meantime.
+    """
+    dumped = source.dump(old_name)
+    if dumped is None:
+        return False
+    ttl = source.pttl(old_name)
+    redis_client.restore(new_name, max(ttl, 0), dumped, replace=True)
+    return True
+
+
+@click.command('migrate-redis-keys')
+@click.option('--source-url', default=None,
+              help='Redis to copy from, e.g. the standalone server being replaced by a cluster. '
+                   'Defaults to the configured Redis, which is migrated in place.')
+@with_appcontext
+def migrate_redis_keys_command(source_url):
+    """
+    Moves owner indexes written before hash tags to their tagged names (see
+    keys.py). Untagged links keep their names; with --source-url they are
+    copied over too. Safe to run more than once.
+    """
+    in_place = source_url is None
+    source = redis_client if in_place else redis.Redis.from_url(source_url)
+    links = indexes = 0
+
+    if not in_place:
+        for name in untagged_keys(source, 'share:*'):
+            links += copy_key(source, name, name)
+
+    for name in untagged_keys(source, 'share-owner:*'):
+        owner_id = name.partition(':')[2]
+        entries = source.zrange(name, 0, -1, withscores=True)
+        if entries:
+            redis_client.zadd(owner_index_key(owner_id), dict(entries))
+        if in_place:
+            redis_client.delete(name)
+        indexes += 1
+
+    click.echo(f"Copied {links} links and moved {indexes} owner indexes.")
@@ -0,0 +1,51 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class UnknownLinkCache:
+    """
+    In-process LRU of share IDs that Redis had no link for, so repeated
+    lookups of made-up or long-gone IDs (scrapers, stale bookmarks) are
+    answered without a Redis round trip.
+
+    Only IDs whose hash doesn't exist at all are remembered: never issued,
+    expired or revoked. None of those can become valid again (new links get
+    fresh random IDs), so the cache can't deny a working link. Entries
+    expire anyway after a short TTL, which bounds the damage of anything
+    unforeseen, such as links copied in by migrate-redis-keys after a miss.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.ttl = 60
+        self.max_entries = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('UNKNOWN_LINK_CACHE_ENABLED', True)
+        self.ttl = app.config.get('UNKNOWN_LINK_CACHE_TTL', 60)
+        self.max_entries = app.config.get('UNKNOWN_LINK_CACHE_MAX_ENTRIES', 100000)
+        app.extensions['unknown_links'] = self
+
+    def __contains__(self, share_id):
+        if not self.enabled:
+            return False
+        with self._lock:
+            expires_at = self._entries.get(share_id)
+            if expires_at is None:
+                return False
+            if expires_at <= time.monotonic():
+                del self._entries[share_id]
+                return False
+            return True
+
+    def add(self, share_id):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[share_id] = time.monotonic() + self.ttl
+            self._entries.move_to_end(share_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
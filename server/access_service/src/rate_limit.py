@@ -0,0 +1,107 @@
+import math
+from functools import wraps
+from flask import current_app, jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+# KEYS[1] = bucket, ARGV[1] = requests allowed per period, ARGV[2] = period (ms)
+# GCRA, a token bucket kept as a single timestamp: the "theoretical arrival
+# time" at which the bucket would be full again. Each request pushes it
+# forward by period/limit; a request that would push it more than one period
+# past now is refused. Returns 0 if allowed, else milliseconds to wait.
+# The key expires once the bucket is full, so idle clients cost nothing.
+GCRA = """
+local limit = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local interval = period / limit
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or now), now)
+local new_tat = tat + interval
+local wait = new_tat - period - now
+if wait > 0 then
+    return math.ceil(wait)
+end
+redis.call('SET', KEYS[1], math.ceil(new_tat), 'PX', math.ceil(new_tat - now))
+return 0
+"""
+
+
+def parse_rate(rate):
+    """'30/60' -> (30, 60): 30 requests per 60 seconds. '' or '0' -> None (no limit)."""
+    if not rate or rate == '0':
+        return None
+    count, _, seconds = rate.partition('/')
+    return int(count), int(seconds or 1)
+
+
+class RateLimiter:
+    """
+    Per-endpoint rate limits shared by all workers, kept in Redis.
+
+    Each limit is configured as RATE_LIMIT_<NAME> ('<requests>/<seconds>') and
+    RATE_LIMIT_<NAME>_BY, what is counted: 'ip', 'user' (the JWT identity,
+    or the IP for anonymous requests) or 'id' (the share or file ID in the
+    URL, across all clients). A check is one EVALSHA round trip. Requests over
+    the limit get a 429 with Retry-After.
+
+    Limiting fails open: without Redis, or when Redis errors, requests
+    go through rather than failing.
+    """
+
+    def __init__(self):
+        self.redis = None
+        self.trusted_proxies = 0
+
+    def init_app(self, app, redis=None):
+        self.redis = redis
+        # Proxies in front of the service (e.g. the ingress) that append the
+        # client's address to X-Forwarded-For; 0 trusts the socket address only
+        self.trusted_proxies = app.config.get('RATE_LIMIT_TRUSTED_PROXIES', 0)
+        app.extensions['rate_limiter'] = self
+
+    def client_ip(self):
+        forwarded = request.access_route
+        if self.trusted_proxies and len(forwarded) >= self.trusted_proxies:
+            return forwarded[-self.trusted_proxies]
+        return request.remote_addr
+
+    def subject(self, by):
+        if by == 'user':
+            verify_jwt_in_request(optional=True)
+            identity = get_jwt_identity()
+            if identity is not None:
+                return f"user:{identity}"
+        if by == 'id':
+            return f"id:{next(iter(request.view_args.values()), '')}"
+        return f"ip:{self.client_ip()}"
+
+    def hit(self, name, by, rate):
+        """Counts a request; returns 0 if allowed, else the seconds to wait."""
+        if self.redis is None:
+            return 0
+        limit, seconds = rate
+        try:
+            check = self.redis.register_script(GCRA)
+            wait_ms = check(keys=[f"rate:{name}:{self.subject(by)}"], args=[limit, seconds * 1000])
+        except Exception as e:
+            print(f"Error checking rate limit {name}: {e}")
+            return 0
+        return math.ceil(int(wait_ms) / 1000)
+
+    def limit(self, name):
+        """Decorator applying the RATE_LIMIT_<NAME> limit to a view."""
+        setting = f"RATE_LIMIT_{name.upper().replace('-', '_')}"
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                rate = parse_rate(current_app.config.get(setting))
+                if rate is not None:
+                    retry_after = self.hit(name, current_app.config.get(f"{setting}_BY", 'ip'), rate)
+                    if retry_after:
+                        response = jsonify({"msg": "Too many requests. Please try again later."})
+                        response.headers['Retry-After'] = str(retry_after)
+                        return response, 429
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
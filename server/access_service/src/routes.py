@@ -1,79 +1,293 @@
 from flask import request, jsonify, Blueprint
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from src import redis_client
-import uuid
+from src import redis_client, file_service, rate_limiter, unknown_links
+from src.file_service import FileServiceError
+from src.config import Config
+from src.scripts import CONSUME_LINK, REVOKE_LINK, LIST_LINKS
+from src.keys import new_share_id, owner_tag, link_tag, link_key, owner_index_key
+from src.events import publish_link_event, publish_link_events
+import time
+from functools import wraps
 
 access_bp = Blueprint('access', __name__, url_prefix='/access')
 
-@access_bp.route('/link/create', methods=['POST'])
-@jwt_required()
-def create_share_link():
+FILE_SERVICE_PUBLIC_URL = Config.FILE_SERVICE_PUBLIC_URL.rstrip('/')
+BULK_MAX_LINKS = Config.BULK_MAX_LINKS
+LINKS_PAGE_SIZE = Config.LINKS_PAGE_SIZE
+LINKS_MAX_PAGE_SIZE = Config.LINKS_MAX_PAGE_SIZE
+
+
+def build_share_link(data, owner_id):
     """
-    The file owner calls this to create a shareable link.
-    The owner's client provides the file_id and the wrapped (encrypted) file key.
+    Validates one link request (file_id, wrapped_key, optional expires_in and
+    max_uses) and returns (share_id, fields, ttl), or an error message string.
     """
-    current_user_id = int(get_jwt_identity())
-    data = request.get_json()
+    if not isinstance(data, dict):
+        return "Each link must be an object"
     file_id = data.get('file_id')
     wrapped_key = data.get('wrapped_key') # The AES key, encrypted with the link_secret
-
     expires_in_seconds = data.get('expires_in', 86400)
+    max_uses = data.get('max_uses') # Optional; links are single-use by default
 
     if not all([file_id, wrapped_key]):
-        return jsonify({"msg": "Missing file_id or wrapped_key"}), 400
+        return "Missing file_id or wrapped_key"
+
+    if not isinstance(expires_in_seconds, int) or expires_in_seconds < 1:
+        return "expires_in must be a positive integer"
+
+    if max_uses is not None and (not isinstance(max_uses, int) or max_uses < 1):
+        return "max_uses must be a positive integer"
 
-    share_id = str(uuid.uuid4())
-    
-    # Store the mapping in Redis. It will expire in 24 hours.
     # We use a Redis Hash to store all related info together.
-    redis_key = f"share:{share_id}"
-    redis_client.hset(redis_key, mapping={
+    fields = {
         "file_id": file_id,
-        "owner_id": current_user_id,
+        "owner_id": owner_id,
         "wrapped_key": wrapped_key,
         "valid": "true" # Flag to check if the link has been used
-    })
-    redis_client.expire(redis_key, expires_in_seconds) # 24-hour expiry
+    }
+    if max_uses is not None:
+        fields["uses_left"] = max_uses # Counted down atomically by CONSUME_LINK
+    return new_share_id(owner_id), fields, expires_in_seconds
+
+
+def store_share_links(links):
+    """
+    Writes (share_id, fields, ttl) links to Redis in one MULTI/EXEC round trip,
+    so every hash gets its expiry and its entry in the owner's index;
+    none can be left behind without a TTL. The links all belong to one owner,
+    so in a Redis Cluster every key written here is in the same slot.
+    """
+    now = int(time.time())
+    with redis_client.pipeline(transaction=True) as pipe:
+        for share_id, fields, ttl in links:
+            redis_key = link_key(share_id)
+            # expires_at travels with the link's events (see events.py)
+            pipe.hset(redis_key, mapping={**fields, "expires_at": now + ttl})
+            pipe.expire(redis_key, ttl)
+            pipe.zadd(owner_index_key(fields["owner_id"]), {share_id: now + ttl})
+        pipe.execute()
+
+    publish_link_events([('created', share_id, {"owner_id": fields["owner_id"]}) for share_id, fields, _ in links])
+
+
+@access_bp.route('/link/create', methods=['POST'])
+@jwt_required()
+def create_share_link():
+    """
+    The file owner calls this to create a shareable link.
+    The owner's client provides the file_id and the wrapped (encrypted) file key.
+    """
+    current_user_id = int(get_jwt_identity())
+    link = build_share_link(request.get_json(), current_user_id)
+    if isinstance(link, str):
+        return jsonify({"msg": link}), 400
+
+    store_share_links([link])
+
+    return jsonify({"share_id": link[0]}), 201
+
+
+@access_bp.route('/link/create-bulk', methods=['POST'])
+@jwt_required()
+def create_share_links_bulk():
+    """
+    Creates links for many files at once (e.g. sharing a folder).
+    Takes {"links": [{file_id, wrapped_key, expires_in?, max_uses?}, ...]} and
+    returns the share IDs in the same order. All links are created, or none.
+    """
+    current_user_id = int(get_jwt_identity())
+    data = request.get_json() or {}
+    requested = data.get('links')
+
+    if not isinstance(requested, list) or not requested or len(requested) > BULK_MAX_LINKS:
+        return jsonify({"msg": f"links must be a list of 1 to {BULK_MAX_LINKS} links"}), 400
+
+    links = []
+    for index, item in enumerate(requested):
+        link = build_share_link(item, current_user_id)
+        if isinstance(link, str):
+            return jsonify({"msg": link, "index": index}), 400
+        links.append(link)
+
+    store_share_links(links)
 
-    return jsonify({"share_id": share_id}), 201
+    return jsonify({"share_ids": [share_id for share_id, _, _ in links]}), 201
+
+
+def rejects_unknown_links(view):
+    """
+    Answers share IDs that Redis is known not to have straight away, before
+    the rate limiter, so a scraper's repeated misses cost no Redis call at all.
+    """
+    @wraps(view)
+    def wrapper(share_id, *args, **kwargs):
+        if share_id in unknown_links:
+            return jsonify({"msg": "Link is invalid, expired, or has already been used"}), 404
+        return view(share_id, *args, **kwargs)
+    return wrapper
+
+
+def consume_share_link(share_id):
+    """
+    Atomically checks a share link and uses it up (one use of a multi-use link).
+    Returns its data as a dict of strings, or None if the link is invalid,
+    expired or already used. Redis errors are raised to the caller.
+    """
+    consume = redis_client.register_script(CONSUME_LINK)
+    fields = consume(keys=[link_key(share_id)])
+    if not isinstance(fields, list):
+        if fields == 0:
+            # No such link, now or ever again: don't ask Redis next time
+            unknown_links.add(share_id)
+        return None
+    # HGETALL comes back from Lua as [field, value, field, value, ...]
+    share_data = {fields[i].decode('utf-8'): fields[i + 1].decode('utf-8') for i in range(0, len(fields), 2)}
+    publish_link_event(
+        'consumed', share_id, owner_id=share_data.get('owner_id', ''),
+        used_up=1 if share_data.get('valid') == 'false' else 0,
+        expires_at=share_data.get('expires_at', '')
+    )
+    return share_data
+
+
+@access_bp.route('/links', methods=['GET'])
+@jwt_required()
+def list_my_links():
+    """
+    Lists the caller's active links, soonest to expire first, a page at a time.
+    Optional query parameters: limit and cursor. When more links remain, the
+    response carries the cursor for the next page as next_cursor; a page may
+    hold fewer than limit links when some were used up since the last listing.
+    """
+    current_user_id = int(get_jwt_identity())
+    limit = max(1, min(request.args.get('limit', LINKS_PAGE_SIZE, type=int), LINKS_MAX_PAGE_SIZE))
+
+    cursor_id, cursor_expiry = '', 0
+    cursor = request.args.get('cursor')
+    if cursor:
+        cursor_expiry, _, cursor_id = cursor.partition(':')
+        if not cursor_expiry.isdigit() or not cursor_id:
+            return jsonify({"msg": "Invalid cursor"}), 400
+
+    # Fetch one extra entry to learn whether there is a next page
+    list_links = redis_client.register_script(LIST_LINKS)
+    index_key = owner_index_key(current_user_id)
+    page = list_links(keys=[index_key], args=[int(time.time()), cursor_id, cursor_expiry, limit + 1])
+    entries = [(page[i].decode('utf-8'), int(float(page[i + 1]))) for i in range(0, len(page), 2)]
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    with redis_client.pipeline(transaction=False) as pipe:
+        for share_id, _ in entries:
+            pipe.hmget(link_key(share_id), "file_id", "uses_left", "valid")
+        details = pipe.execute()
+
+    links, gone = [], []
+    for (share_id, expires_at), (file_id, uses_left, valid) in zip(entries, details):
+        if file_id is None or valid != b"true":
+            # Expired a moment ago, or used up (consuming a link doesn't
+            # touch its owner's index); trim it from the index now
+            gone.append(share_id)
+            continue
+        links.append({
+            "share_id": share_id,
+            "file_id": file_id.decode('utf-8'),
+            "expires_at": expires_at,
+            "uses_left": int(uses_left) if uses_left is not None else 1
+        })
+    if gone:
+        redis_client.zrem(index_key, *gone)
+
+    next_cursor = f"{entries[-1][1]}:{entries[-1][0]}" if has_more else None
+    return jsonify({"links": links, "next_cursor": next_cursor}), 200
+
+
+@access_bp.route('/link/<string:share_id>', methods=['DELETE'])
+@jwt_required()
+def revoke_link(share_id):
+    """Revokes one of the caller's links before it is used or expires."""
+    current_user_id = int(get_jwt_identity())
+
+    index_key = owner_index_key(current_user_id)
+    tag = link_tag(share_id)
+    if tag is not None and tag != owner_tag(current_user_id):
+        # Someone else's link, in another cluster slot than the caller's index
+        return jsonify({"msg": "Link not found or access denied"}), 404
+    revoke = redis_client.register_script(REVOKE_LINK)
+    if tag is not None:
+        revoked = revoke(keys=[link_key(share_id), index_key], args=[current_user_id, share_id])
+    else:
+        # An untagged link's hash may be in another cluster slot than the index
+        revoked = revoke(keys=[link_key(share_id)], args=[current_user_id, share_id])
+        redis_client.zrem(index_key, share_id)
+    if not revoked:
+        return jsonify({"msg": "Link not found or access denied"}), 404
+
+    publish_link_event('revoked', share_id, owner_id=current_user_id)
+
+    return jsonify({"msg": "Link revoked"}), 200
 
 
 @access_bp.route('/link/details/<string:share_id>', methods=['GET'])
+@rejects_unknown_links
+@rate_limiter.limit('link-details')
 def get_link_details(share_id):
     """
     Public endpoint for a recipient to get the file_id and wrapped_key.
-    This also invalidates the link, making it one-time use.
+    This also uses up the link (or one use of a multi-use link).
+    """
+    try:
+        share_data = consume_share_link(share_id)
+    except Exception as e:
+        print(f"Error consuming share link: {e}") # Added logging
+        return jsonify({"msg": "An error occurred. Please try again."}), 500
+
+    if not share_data:
+        return jsonify({"msg": "Link is invalid, expired, or has already been used"}), 404
+
+    return jsonify({
+        "file_id": share_data.get('file_id', ''),
+        "wrapped_key": share_data.get('wrapped_key', '')
+    }), 200
+
+
+@access_bp.route('/link/resolve/<string:share_id>', methods=['GET'])
+@rejects_unknown_links
+@rate_limiter.limit('link-details')
+def resolve_link(share_id):
     """
-    redis_key = f"share:{share_id}"
-    
-    with redis_client.pipeline() as pipe:
+    Public endpoint that gives the download page everything in one request:
+    consumes the link and returns the wrapped key, the file's metadata and
+    a URL to download the encrypted blob from.
+    """
+    try:
+        share_data = consume_share_link(share_id)
+    except Exception as e:
+        print(f"Error consuming share link: {e}")
+        return jsonify({"msg": "An error occurred. Please try again."}), 500
+
+    if not share_data:
+        return jsonify({"msg": "Link is invalid, expired, or has already been used"}), 404
+
+    file_id = share_data.get('file_id', '')
+    # Without metadata the download page still works: it gets the key and the
+    # plain download endpoint, and looks the filename up itself
+    file_meta = {}
+    if file_service.enabled:
         try:
-            pipe.watch(redis_key)
-            
-            # We check the 'valid' flag first.
-            is_valid = pipe.hget(redis_key, "valid")
-            if not is_valid or is_valid.decode('utf-8') != 'true':
-                return jsonify({"msg": "Link is invalid, expired, or has already been used"}), 404
-
-            # If it's valid, we get all the data and invalidate it in one transaction.
-            pipe.multi()
-            pipe.hgetall(redis_key) # Queue command to get all data
-            pipe.hset(redis_key, "valid", "false") # Queue command to invalidate
-            
-            results = pipe.execute()
-            share_data = results[0] # The result of hgetall is the first item in the results
-
-            if not share_data: # Should not happen if watch/multi worked, but a good safeguard
-                return jsonify({"msg": "Link data could not be retrieved"}), 404
-
-            # Decode the data for the JSON response
-            return jsonify({
-                "file_id": share_data.get(b'file_id', b'').decode('utf-8'),
-                "wrapped_key": share_data.get(b'wrapped_key', b'').decode('utf-8')
-            }), 200
-            
-           
-            
-        except Exception as e:
-            print(f"Error in Redis transaction: {e}") # Added logging
-            return jsonify({"msg": "An error occurred. Please try again."}), 500
\ No newline at end of file
+            file_meta = file_service.get_share_meta(file_id)
+        except FileServiceError as e:
+            print(f"Error fetching shared file metadata: {e}")
+            file_meta = {}
+
+    if file_meta is None:
+        return jsonify({"msg": "The shared file no longer exists"}), 404
+
+    return jsonify({
+        "file_id": file_id,
+        "wrapped_key": share_data.get('wrapped_key', ''),
+        "filename": file_meta.get('filename'),
+        "size": file_meta.get('size'),
+        "content_type": file_meta.get('content_type'),
+        "download_url": file_meta.get('download_url') or f"{FILE_SERVICE_PUBLIC_URL}/files/download/{file_id}"
+    }), 200
@@ -0,0 +1,65 @@
+# Lua scripts for share links. Each runs atomically inside Redis in a single
+# round trip; redis-py sends them with EVALSHA and only uploads the source
+# the first time a server doesn't know them (NOSCRIPT).
+
+# Besides its hash, every link is listed in its owner's index, a sorted set
+# of share IDs scored by expiry time (key names are in keys.py). Every key a
+# script touches is passed in KEYS, as Redis Cluster requires. A recipient
+# only has the share ID, which doesn't name the owner, so consuming a link
+# touches its hash alone; a used-up link is trimmed from the index when its
+# owner next lists it (see list_my_links).
+
+# KEYS[1] = share hash
+# Uses up one use of the link and returns all its fields (as a flat list).
+# Otherwise returns 1 if the link is used up, or 0 if it doesn't exist
+# (never did, expired or was revoked), which is final.
+# Links with a 'uses_left' field allow that many uses; others allow one.
+CONSUME_LINK = """
+if redis.call('HGET', KEYS[1], 'valid') ~= 'true' then
+    return redis.call('EXISTS', KEYS[1])
+end
+local used_up = true
+if redis.call('HEXISTS', KEYS[1], 'uses_left') == 1 then
+    used_up = redis.call('HINCRBY', KEYS[1], 'uses_left', -1) <= 0
+end
+if used_up then
+    redis.call('HSET', KEYS[1], 'valid', 'false')
+end
+return redis.call('HGETALL', KEYS[1])
+"""
+
+# KEYS[1] = share hash, KEYS[2] = owner's index (optional), ARGV[1] = owner ID,
+# ARGV[2] = share ID
+# Deletes the link if it belongs to the owner. Returns 1 if deleted, else 0.
+# Untagged links are in another slot than the index, so the caller leaves
+# KEYS[2] out and updates the index itself.
+REVOKE_LINK = """
+local owned = redis.call('HGET', KEYS[1], 'owner_id') == ARGV[1]
+if owned then
+    redis.call('DEL', KEYS[1])
+end
+if KEYS[2] then
+    redis.call('ZREM', KEYS[2], ARGV[2])
+end
+return owned and 1 or 0
+"""
+
+# KEYS[1] = owner's index, ARGV[1] = now, ARGV[2] = cursor share ID ('' for
+# the first page), ARGV[3] = cursor expiry, ARGV[4] = page size
+# Trims links that have expired, then returns the next page after the cursor
+# as a flat list [share ID, expiry, ...], soonest to expire first.
+# Finding the cursor is a rank lookup, so a page costs O(log n + page).
+LIST_LINKS = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local start = 0
+if ARGV[2] ~= '' then
+    local rank = redis.call('ZRANK', KEYS[1], ARGV[2])
+    if rank then
+        start = rank + 1
+    else
+        -- The cursor link is gone (revoked or used up): continue from its expiry
+        start = redis.call('ZCOUNT', KEYS[1], '-inf', '(' .. ARGV[3])
+    end
+end
+return redis.call('ZRANGE', KEYS[1], start, start + tonumber(ARGV[4]) - 1, 'WITHSCORES')
+"""
@@ -1,4 +1,5 @@
 import pytest
+import fakeredis
 from src import create_app
 
 @pytest.fixture(scope='module')
@@ -18,3 +19,14 @@ def test_client(test_app):
     A new client is created for each test function to ensure isolation.
     """
     return test_app.test_client()
+
+@pytest.fixture(scope='function')
+def fake_redis(mocker):
+    """
+    An in-memory Redis (with Lua scripting) in place of the real one,
+    so the link scripts run for real. Fresh and empty for every test.
+    """
+    redis = fakeredis.FakeRedis()
+    mocker.patch('src.routes.redis_client', redis)
+    mocker.patch('src.events.redis_client', redis)
+    return redis
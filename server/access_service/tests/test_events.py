@@ -0,0 +1,60 @@
+from flask_jwt_extended import create_access_token
+from src.events import LinkStatsAggregator, publish_link_event, link_stats
+from src.keys import link_key, share_id_from_key
+
+
+def test_lifecycle_events_are_aggregated_into_counters(test_client, fake_redis):
+    """
+    GIVEN three links: one used up, one revoked and one left alone
+    WHEN the used-up and untouched links expire and the aggregator runs
+    THEN the hourly counters should count each event, and only the untouched link as expired unused.
+    """
+    headers = {'Authorization': f'Bearer {create_access_token(identity="1")}'}
+    used, revoked, untouched = test_client.post('/access/link/create-bulk', headers=headers, json={'links': [
+        {'file_id': f'f{i}', 'wrapped_key': 'k'} for i in range(3)
+    ]}).json['share_ids']
+    assert test_client.get(f'/access/link/details/{used}').status_code == 200
+    assert test_client.delete(f'/access/link/{revoked}', headers=headers).status_code == 200
+
+    # 1. What watch-link-expiry publishes when Redis expires the two hashes
+    for share_id in (used, untouched):
+        assert share_id_from_key(link_key(share_id)) == share_id
+        publish_link_event('expired', share_id)
+
+    # 2. One batch folds all of it into the counters and acknowledges it
+    aggregator = LinkStatsAggregator(fake_redis, 'link-events', 'worker-1', block_ms=None)
+    aggregator.ensure_group()
+    assert aggregator.run_once() == 7
+    assert aggregator.run_once() == 0
+
+    totals = link_stats(fake_redis, hours=1)
+    assert {field: totals[field] for field in ('created', 'consumed', 'used_up', 'revoked', 'expired', 'expired_unused')} == {
+        'created': 3, 'consumed': 1, 'used_up': 1, 'revoked': 1, 'expired': 2, 'expired_unused': 1
+    }
+    assert fake_redis.zcard(LinkStatsAggregator.USED_UP_KEY) == 0
+
+
+def test_used_up_markers_are_trimmed_after_their_links_expire(test_client, fake_redis, mocker):
+    """
+    GIVEN two used-up links, one whose expired event will never come
+    WHEN the aggregator runs long after that link's expiry
+    THEN its marker should be scored by the link's expiry and trimmed, and the other kept.
+    """
+    headers = {'Authorization': f'Bearer {create_access_token(identity="1")}'}
+    stale, fresh = test_client.post('/access/link/create-bulk', headers=headers, json={'links': [
+        {'file_id': 'f1', 'wrapped_key': 'k', 'expires_in': 60},
+        {'file_id': 'f2', 'wrapped_key': 'k', 'expires_in': 3 * 86400}
+    ]}).json['share_ids']
+    for share_id in (stale, fresh):
+        assert test_client.get(f'/access/link/details/{share_id}').status_code == 200
+
+    aggregator = LinkStatsAggregator(fake_redis, 'link-events', 'worker-1', block_ms=None)
+    aggregator.ensure_group()
+    aggregator.run_once()
+    expires_at = int(fake_redis.hget(link_key(stale), 'expires_at'))
+    assert fake_redis.zscore(LinkStatsAggregator.USED_UP_KEY, stale) == expires_at
+
+    # The next batch, a couple of days on, drops the marker nobody will remove
+    mocker.patch('src.events.time.time', return_value=expires_at + 2 * 86400)
+    aggregator.run_once()
+    assert fake_redis.zrange(LinkStatsAggregator.USED_UP_KEY, 0, -1) == [fresh.encode('utf-8')]
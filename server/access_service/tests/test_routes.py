@@ -1,15 +1,15 @@
 import json
-from unittest.mock import MagicMock
 from flask_jwt_extended import create_access_token
+from redis.crc import key_slot
+from src.keys import link_key, owner_index_key
 
-def test_create_share_link_success(test_client, mocker):
+def test_create_share_link_success(test_client, fake_redis):
     """
     GIVEN an authenticated user and valid data
     WHEN the '/access/link/create' endpoint is called
     THEN it should return a 201 status and a new share_id.
     """
-    # 1. Mock the redis_client used in the routes
-    mock_redis = mocker.patch('src.routes.redis_client')
+    # 1. Redis is the in-memory fake_redis
     
     # 2. Setup authentication
     user_id = 1
@@ -32,31 +32,54 @@ def test_create_share_link_success(test_client, mocker):
     assert response.status_code == 201
     assert 'share_id' in response.json
     
-    # 6. Assert that our mocks were called correctly
-    mock_redis.hset.assert_called_once()
-    mock_redis.expire.assert_called_once()
+    # 6. The link was stored together with its default 24 hour expiry
+    redis_key = link_key(response.json['share_id'])
+    assert fake_redis.hget(redis_key, 'file_id') == b'file-123-abc'
+    assert 0 < fake_redis.ttl(redis_key) <= 86400
 
 
-def test_get_link_details_success(test_client, mocker):
+def test_create_share_links_bulk(test_client, fake_redis):
+    """
+    GIVEN an authenticated user sharing several files at once
+    WHEN the '/access/link/create-bulk' endpoint is called
+    THEN every link should be stored with its own expiry, or none if any is invalid.
+    """
+    headers = {'Authorization': f'Bearer {create_access_token(identity="1")}'}
+
+    # 1. Three links, one with its own expiry and use count
+    response = test_client.post('/access/link/create-bulk', headers=headers, json={'links': [
+        {'file_id': 'f1', 'wrapped_key': 'k1'},
+        {'file_id': 'f2', 'wrapped_key': 'k2', 'expires_in': 60, 'max_uses': 3},
+        {'file_id': 'f3', 'wrapped_key': 'k3'},
+    ]})
+    assert response.status_code == 201
+    share_ids = response.json['share_ids']
+    assert len(set(share_ids)) == 3
+    assert [fake_redis.hget(link_key(share_id), 'file_id') for share_id in share_ids] == [b'f1', b'f2', b'f3']
+    assert 0 < fake_redis.ttl(link_key(share_ids[1])) <= 60
+    assert fake_redis.hget(link_key(share_ids[1]), 'uses_left') == b'3'
+
+    # 2. One bad link rejects the whole batch
+    response = test_client.post('/access/link/create-bulk', headers=headers, json={'links': [
+        {'file_id': 'f4', 'wrapped_key': 'k4'},
+        {'file_id': 'f5'},
+    ]})
+    assert response.status_code == 400
+    assert response.json['index'] == 1
+    assert len(fake_redis.keys('share:*')) == 3
+
+
+def test_get_link_details_success(test_client, fake_redis):
     """
     GIVEN a valid and unused share_id
     WHEN the '/access/link/details/<share_id>' endpoint is called
     THEN it should return the file details and invalidate the link.
     """
-    # 1. Mock the redis_client and its pipeline
-    mock_pipeline = MagicMock()
-    
-    # Simulate the return values from the transactional pipeline
-    mock_pipeline.hget.return_value = b'true' # is_valid check
-    mock_pipeline.execute.return_value = [ # This is the 'results' list
-        { # This is the share_data dictionary from hgetall
-            b'file_id': b'file-123-abc',
-            b'wrapped_key': b'a-very-long-encrypted-key-string'
-        }
-    ]
-    
-    mock_redis = mocker.patch('src.routes.redis_client')
-    mock_redis.pipeline.return_value.__enter__.return_value = mock_pipeline
+    # 1. A single-use link in Redis
+    fake_redis.hset("share:some-valid-share-id", mapping={
+        "file_id": "file-123-abc", "owner_id": 1,
+        "wrapped_key": "a-very-long-encrypted-key-string", "valid": "true"
+    })
 
     # 2. Make the request
     response = test_client.get('/access/link/details/some-valid-share-id')
@@ -65,33 +88,266 @@ def test_get_link_details_success(test_client, mocker):
     assert response.status_code == 200
     assert response.json['file_id'] == 'file-123-abc'
     assert response.json['wrapped_key'] == 'a-very-long-encrypted-key-string'
-    
-    # 4. Assert that the transaction was handled correctly
-    mock_pipeline.watch.assert_called_once()
-    mock_pipeline.multi.assert_called_once()
-    mock_pipeline.hgetall.assert_called_once()
-    mock_pipeline.hset.assert_called_once_with(f"share:some-valid-share-id", "valid", "false")
-    mock_pipeline.execute.assert_called_once()
+
+    # 4. The link has been used up
+    assert fake_redis.hget("share:some-valid-share-id", "valid") == b'false'
+    assert test_client.get('/access/link/details/some-valid-share-id').status_code == 404
 
 
-def test_get_link_details_invalid_or_used(test_client, mocker):
+def test_get_link_details_invalid_or_used(test_client, fake_redis):
     """
     GIVEN an invalid or already used share_id
     WHEN the '/access/link/details/<share_id>' endpoint is called
     THEN it should return a 404 Not Found error.
     """
-    # 1. Mock the redis_client and its pipeline
-    mock_pipeline = MagicMock()
-    
-    # Simulate the is_valid check returning false
-    mock_pipeline.hget.return_value = b'false' 
-    
-    mock_redis = mocker.patch('src.routes.redis_client')
-    mock_redis.pipeline.return_value.__enter__.return_value = mock_pipeline
-    
-    # 2. Make the request
-    response = test_client.get('/access/link/details/some-invalid-share-id')
+    # 1. One used link; the other ID doesn't exist at all
+    fake_redis.hset("share:some-used-share-id", mapping={"file_id": "f", "owner_id": 1, "wrapped_key": "k", "valid": "false"})
 
-    # 3. Assert the outcome
-    assert response.status_code == 404
-    assert response.json['msg'] == "Link is invalid, expired, or has already been used"
+    for share_id in ['some-used-share-id', 'some-invalid-share-id']:
+        # 2. Make the request
+        response = test_client.get(f'/access/link/details/{share_id}')
+
+        # 3. Assert the outcome
+        assert response.status_code == 404
+        assert response.json['msg'] == "Link is invalid, expired, or has already been used"
+
+
+def test_multi_use_link_under_contention(test_app, fake_redis):
+    """
+    GIVEN a link that may be used 5 times
+    WHEN 20 recipients open it at the same moment
+    THEN exactly 5 should get the details and the rest a 404, never a 500.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    # 1. Create the link through the API
+    headers = {'Authorization': f'Bearer {create_access_token(identity="1")}'}
+    response = test_app.test_client().post('/access/link/create', headers=headers, json={
+        'file_id': 'file-123-abc', 'wrapped_key': 'wrapped', 'max_uses': 5
+    })
+    share_id = response.json['share_id']
+
+    # 2. Hit it concurrently
+    def open_link(_):
+        return test_app.test_client().get(f'/access/link/details/{share_id}').status_code
+
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        statuses = list(pool.map(open_link, range(20)))
+
+    # 3. Exactly max_uses successes
+    assert statuses.count(200) == 5
+    assert statuses.count(404) == 15
+
+
+def test_resolve_link_returns_everything_in_one_response(test_client, fake_redis, mocker):
+    """
+    GIVEN a valid share link whose file exists
+    WHEN the '/access/link/resolve/<share_id>' endpoint is called
+    THEN it should consume the link and return the wrapped key, file metadata and a download URL.
+    """
+    fake_redis.hset('share:some-valid-share-id', mapping={'file_id': 'file-123-abc', 'owner_id': 1, 'wrapped_key': 'wrapped', 'valid': 'true'})
+    fake_redis.expire('share:some-valid-share-id', 3600)
+    get_share_meta = mocker.patch('src.routes.file_service.get_share_meta', return_value={
+        'filename': 'report.pdf', 'size': 1234, 'content_type': 'application/pdf', 'download_url': None
+    })
+
+    response = test_client.get('/access/link/resolve/some-valid-share-id')
+
+    assert response.status_code == 200
+    assert response.json['wrapped_key'] == 'wrapped'
+    assert response.json['filename'] == 'report.pdf' and response.json['size'] == 1234
+    # No signed URL from storage, so the file_service download endpoint is used
+    assert response.json['download_url'].endswith('/files/download/file-123-abc')
+    get_share_meta.assert_called_once_with('file-123-abc')
+
+
+def test_resolve_link_falls_back_to_the_download_endpoint(test_client, fake_redis, mocker):
+    """
+    GIVEN valid share links, with file_service failing, then with no internal token configured
+    WHEN the '/access/link/resolve/<share_id>' endpoint is called
+    THEN it should still answer 200 with the wrapped key and the plain download URL, leaving the filename to the client.
+    """
+    from src.file_service import FileServiceError
+    from src.routes import file_service
+    for share_id in ('share-one', 'share-two'):
+        fake_redis.hset(f'share:{share_id}', mapping={'file_id': 'file-123-abc', 'owner_id': 1, 'wrapped_key': 'wrapped', 'valid': 'true'})
+        fake_redis.expire(f'share:{share_id}', 3600)
+    get_share_meta = mocker.patch('src.routes.file_service.get_share_meta', side_effect=FileServiceError('timeout'))
+
+    failed = test_client.get('/access/link/resolve/share-one')
+    mocker.patch.object(file_service, 'token', None)
+    unconfigured = test_client.get('/access/link/resolve/share-two')
+
+    for response in (failed, unconfigured):
+        assert response.status_code == 200
+        assert response.json['wrapped_key'] == 'wrapped'
+        assert response.json['filename'] is None
+        assert response.json['download_url'].endswith('/files/download/file-123-abc')
+    # No token, no call that file_service would refuse anyway
+    get_share_meta.assert_called_once_with('file-123-abc')
+
+
+def test_consuming_a_link_is_one_round_trip(test_client, fake_redis, mocker):
+    """
+    GIVEN two valid links
+    WHEN the second is looked up, once the script is loaded by the first
+    THEN the lookup should cost a single Redis command (the lifecycle event is pipelined separately).
+    """
+    headers = {'Authorization': f'Bearer {create_access_token(identity="1")}'}
+    first, second = test_client.post('/access/link/create-bulk', headers=headers, json={'links': [
+        {'file_id': f'f{i}', 'wrapped_key': 'k'} for i in range(2)
+    ]}).json['share_ids']
+    assert test_client.get(f'/access/link/details/{first}').status_code == 200
+    calls = mocker.spy(fake_redis, 'execute_command')
+
+    assert test_client.get(f'/access/link/details/{second}').status_code == 200
+    assert [call.args[0] for call in calls.call_args_list] == ['EVALSHA']
+
+
+def test_list_and_revoke_my_links(test_client, fake_redis, mocker):
+    """
+    GIVEN an owner with several links, one of them used up, and another owner's link
+    WHEN the owner pages through '/access/links' and revokes a link
+    THEN only their active links should be listed, soonest to expire first, and revoking should remove one.
+    """
+    alice = {'Authorization': f'Bearer {create_access_token(identity="1")}'}
+    bob = {'Authorization': f'Bearer {create_access_token(identity="2")}'}
+
+    # 1. Alice has four links with different expiries; Bob has one
+    response = test_client.post('/access/link/create-bulk', headers=alice, json={'links': [
+        {'file_id': f'f{i}', 'wrapped_key': 'k', 'expires_in': 100 * (i + 1)} for i in range(4)
+    ]})
+    share_ids = response.json['share_ids']
+    test_client.post('/access/link/create', headers=bob, json={'file_id': 'b', 'wrapped_key': 'k'})
+
+    # 2. A recipient uses up Alice's second link
+    assert test_client.get(f'/access/link/details/{share_ids[1]}').status_code == 200
+
+    # 3. Page through Alice's links two at a time
+    listed, cursor = [], None
+    while True:
+        response = test_client.get('/access/links', headers=alice, query_string={'limit': 2, **({'cursor': cursor} if cursor else {})})
+        assert response.status_code == 200
+        listed.extend(link['file_id'] for link in response.json['links'])
+        cursor = response.json['next_cursor']
+        if not cursor:
+            break
+    assert listed == ['f0', 'f2', 'f3']
+
+    # 4. Bob can't revoke Alice's link, and his attempt never reaches Redis
+    #    (in a cluster the two keys would be in different slots); Alice can
+    evalsha = mocker.spy(fake_redis, 'evalsha')
+    assert test_client.delete(f'/access/link/{share_ids[0]}', headers=bob).status_code == 404
+    evalsha.assert_not_called()
+    assert test_client.delete(f'/access/link/{share_ids[0]}', headers=alice).status_code == 200
+    assert test_client.get(f'/access/link/details/{share_ids[0]}').status_code == 404
+    assert [link['file_id'] for link in test_client.get('/access/links', headers=alice).json['links']] == ['f2', 'f3']
+
+
+def test_link_keys_share_a_cluster_slot_with_their_owner_index(test_client, fake_redis):
+    """
+    GIVEN links created by two owners, and an untagged link from before hash tags
+    WHEN their keys are compared and the older link is used up
+    THEN each new link should hash to its owner's index slot, and the older link should still work.
+    """
+    headers = {'Authorization': f'Bearer {create_access_token(identity="7")}'}
+    share_ids = test_client.post('/access/link/create-bulk', headers=headers, json={'links': [
+        {'file_id': 'f1', 'wrapped_key': 'k'}, {'file_id': 'f2', 'wrapped_key': 'k'}
+    ]}).json['share_ids']
+
+    # 1. Every key a bulk create writes is in one slot, so its MULTI is valid in a cluster
+    slots = {key_slot(link_key(share_id).encode()) for share_id in share_ids}
+    assert slots == {key_slot(owner_index_key(7).encode())}
+
+    # 2. An untagged link, listed in the owner's index, keeps working
+    fake_redis.hset('share:legacy-id', mapping={'file_id': 'old', 'owner_id': 7, 'wrapped_key': 'k', 'valid': 'true'})
+    fake_redis.expire('share:legacy-id', 3600)
+    fake_redis.zadd(owner_index_key(7), {'legacy-id': 9999999999})
+    assert test_client.get('/access/link/details/legacy-id').json['file_id'] == 'old'
+
+    # 3. Used up, it is trimmed from the index the next time the owner lists links
+    assert sorted(link['file_id'] for link in test_client.get('/access/links', headers=headers).json['links']) == ['f1', 'f2']
+    assert fake_redis.zscore(owner_index_key(7), 'legacy-id') is None
+
+
+def test_migrate_redis_keys_moves_owner_indexes(test_app, fake_redis, mocker):
+    """
+    GIVEN an owner index written under its old, untagged name
+    WHEN the 'migrate-redis-keys' command runs in place
+    THEN the entries should move to the tagged index and the old key should be gone.
+    """
+    mocker.patch('src.migrate_keys.redis_client', fake_redis)
+    fake_redis.zadd('share-owner:7', {'legacy-id': 9999999999})
+
+    result = test_app.test_cli_runner().invoke(args=['migrate-redis-keys'])
+
+    assert result.exit_code == 0
+    assert fake_redis.zscore(owner_index_key(7), 'legacy-id') == 9999999999
+    assert not fake_redis.exists('share-owner:7')
+
+
+def test_link_details_rate_limited(test_app, test_client, fake_redis, mocker):
+    """
+    GIVEN a limit of 3 link lookups per minute per IP
+    WHEN a client tries a fourth (unknown) share ID
+    THEN it should get a 429 with Retry-After instead of a 404.
+    """
+    from src import rate_limiter
+    mocker.patch.object(rate_limiter, 'redis', fake_redis)
+    mocker.patch.dict(test_app.config, {'RATE_LIMIT_LINK_DETAILS': '3/60'})
+
+    statuses = [test_client.get(f'/access/link/details/guess-{i}').status_code for i in range(4)]
+
+    assert statuses == [404, 404, 404, 429]
+    response = test_client.get('/access/link/resolve/guess-5')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+
+
+def test_unknown_share_ids_are_rejected_without_redis(test_client, fake_redis, mocker):
+    """
+    GIVEN the unknown-link cache is on, a used-up link and an ID that never existed
+    WHEN each is looked up twice
+    THEN the unknown ID should reach Redis only once, and the used-up link shouldn't be remembered.
+    """
+    from collections import OrderedDict
+    from src import unknown_links
+    mocker.patch.object(unknown_links, 'enabled', True)
+    mocker.patch.object(unknown_links, '_entries', OrderedDict())
+    fake_redis.hset('share:used-id', mapping={'file_id': 'f', 'owner_id': 1, 'wrapped_key': 'k', 'valid': 'false'})
+    fake_redis.expire('share:used-id', 3600)
+    calls = mocker.spy(fake_redis, 'execute_command')
+
+    # 1. The unknown ID is remembered after one Redis lookup
+    assert test_client.get('/access/link/details/never-existed').status_code == 404
+    lookups = calls.call_count
+    assert test_client.get('/access/link/details/never-existed').status_code == 404
+    assert calls.call_count == lookups
+    assert 'never-existed' in unknown_links
+
+    # 2. The used-up link still has its hash, so it isn't
+    assert test_client.get('/access/link/details/used-id').status_code == 404
+    assert 'used-id' not in unknown_links
+
+
+def test_known_unknown_ids_skip_the_rate_limiter(test_app, test_client, fake_redis, mocker):
+    """
+    GIVEN a share ID the unknown-link cache remembers, and a tight rate limit
+    WHEN it is looked up over and over
+    THEN every lookup should get a 404 straight from the cache, without a Redis call or using up the limit.
+    """
+    from collections import OrderedDict
+    from src import rate_limiter, unknown_links
+    mocker.patch.object(unknown_links, 'enabled', True)
+    mocker.patch.object(unknown_links, '_entries', OrderedDict())
+    mocker.patch.object(rate_limiter, 'redis', fake_redis)
+    mocker.patch.dict(test_app.config, {'RATE_LIMIT_LINK_DETAILS': '1/60'})
+    unknown_links.add('never-existed')
+    calls = mocker.spy(fake_redis, 'execute_command')
+
+    statuses = [test_client.get(f'/access/link/{endpoint}/never-existed').status_code
+                for endpoint in ('details', 'resolve', 'details')]
+
+    assert statuses == [404, 404, 404]
+    assert calls.call_count == 0
+    assert test_client.get('/access/link/details/some-other-id').status_code == 404
@@ -0,0 +1,15 @@
+import os
+
+# Gunicorn settings for auth_service.
+#
+# Password hashing runs in a process pool of its own (see src/hashing.py),
+# so each worker runs threads: a request waiting on a hash only holds a
+# thread, and cheap endpoints like /auth/refresh keep being served by the
+# others. CPU spent on hashing is bounded by PASSWORD_HASH_WORKERS per worker.
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
@@ -9,12 +9,19 @@ from flask_cors import CORS
 from src.config import config  # Use relative import
 from flask_redis import FlaskRedis
 import redis
+from src.db_routing import RoutingSession, ReplicaRouter
+from src.redis_provider import RedisProvider, redis_options
+from src.hashing import PasswordHasher
     
 # Initialize extensions without attaching them to a specific app instance yet.
-db = SQLAlchemy()
+# Read-only views may be routed to read replicas (see db_routing)
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 jwt = JWTManager()
 mail = Mail()
-redis_client = FlaskRedis()
+# Standalone, Sentinel or Cluster, per REDIS_MODE
+redis_client = FlaskRedis.from_custom_provider(RedisProvider)
+replica_router = ReplicaRouter()
+password_hasher = PasswordHasher()
 
 def create_app(config_name='default'):
     """
@@ -36,13 +43,21 @@ def create_app(config_name='default'):
     db.init_app(app)
     jwt.init_app(app)
     mail.init_app(app)
-    redis_client.init_app(app)
+    redis_client.init_app(app, **redis_options(app.config))
+    replica_router.init_app(app, redis=redis_client)
+    password_hasher.init_app(app)
     
 
     # Import and register the blueprint from the routes module
     # Use a relative import here as well
     from src.routes import auth_bp
     app.register_blueprint(auth_bp)
+
+    from src.migrate_keys import migrate_redis_keys_command
+    app.cli.add_command(migrate_redis_keys_command)
+
+    from src.mail_queue import send_otp_emails_command
+    app.cli.add_command(send_otp_emails_command)
     
     # Create database tables if they don't exist within the app context
     with app.app_context():
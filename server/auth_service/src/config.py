@@ -24,6 +24,12 @@ def get_postgres_uri():
     
     return f"postgresql://{user}:{password}@{host}:{port}/{db_name}"
 
+# Helper function to build SQLALCHEMY_BINDS entries for the read replicas
+def get_replica_binds():
+    urls = os.environ.get('DATABASE_REPLICA_URLS', '')
+    replicas = [url.strip() for url in urls.split(',') if url.strip()]
+    return {f"replica_{i}": url for i, url in enumerate(replicas)}
+
 class Config:
     """
     Base configuration class. Contains default settings and settings
@@ -32,6 +38,20 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Connection pool of each worker process. pre_ping replaces connections the
+    # server (or a proxy) closed; recycle keeps them from outliving idle timeouts.
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ['true', 'on', '1'],
+    }
+    # Read replicas (comma-separated DATABASE_REPLICA_URLS) for the read-only endpoints
+    SQLALCHEMY_BINDS = get_replica_binds()
+    # After a user writes, their reads stay on the primary this long (replication lag)
+    DB_REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 10))
+
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
@@ -42,8 +62,36 @@ class Config:
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER') or os.environ.get('MAIL_USERNAME')
+    # OTP email queue and its workers (see mail_queue.py)
+    MAIL_QUEUE_MAXLEN = int(os.environ.get('MAIL_QUEUE_MAXLEN', 100000))
+    MAIL_BATCH_SIZE = int(os.environ.get('MAIL_BATCH_SIZE', 50))
+    MAIL_MAX_ATTEMPTS = int(os.environ.get('MAIL_MAX_ATTEMPTS', 5))
+    # A failed send is retried after this many seconds, doubling each attempt
+    MAIL_RETRY_BASE_SECONDS = int(os.environ.get('MAIL_RETRY_BASE_SECONDS', 2))
+    # The SMTP connection is checked with NOOP after being idle this long
+    MAIL_SMTP_IDLE_SECONDS = int(os.environ.get('MAIL_SMTP_IDLE_SECONDS', 60))
 
     REDIS_URL = os.environ.get('REDIS_URL')
+    # 'standalone' (REDIS_URL), 'sentinel' (REDIS_SENTINELS, with REDIS_URL
+    # only for db/credentials) or 'cluster' (REDIS_URL of any cluster node)
+    REDIS_MODE = os.environ.get('REDIS_MODE', 'standalone')
+    REDIS_SENTINELS = os.environ.get('REDIS_SENTINELS') # "host:26379,host2:26379"
+    REDIS_SENTINEL_SERVICE = os.environ.get('REDIS_SENTINEL_SERVICE', 'mymaster')
+    REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 50))
+    REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 2))
+    # Retries of a command that hit a dropped connection, e.g. during failover
+    REDIS_RETRIES = int(os.environ.get('REDIS_RETRIES', 3))
+
+    # Password hashing (see hashing.py). New hashes use this werkzeug method;
+    # older ones are rehashed to it at login.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    # Processes per gunicorn worker doing the hashing (0 hashes inline)
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    # Hashes queued or running per worker before requests get a 503 (0: 4 per process)
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 0))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+    # Retry-After (seconds) sent with that 503
+    PASSWORD_HASH_RETRY_AFTER = int(os.environ.get('PASSWORD_HASH_RETRY_AFTER', 2))
     
     @staticmethod
     def init_app(app):
@@ -60,6 +108,11 @@ class TestingConfig(Config):
     # For testing, you might want a separate test database
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or 'sqlite://' # Or a test postgres DB
     WTF_CSRF_ENABLED = False 
+    # sqlite's in-memory pool takes no pool settings, and there are no replicas
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    SQLALCHEMY_BINDS = {}
+    # Hash inline rather than spawning a process pool per test app
+    PASSWORD_HASH_WORKERS = 0
 
 class ProductionConfig(Config):
     """Configuration for production."""
@@ -0,0 +1,86 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hash queue is full; the request should be retried later."""
+
+
+class PasswordHasher:
+    """
+    Runs password hashing (a deliberately slow KDF) in a small process pool
+    of its own, so a login storm keeps only those processes busy. The
+    request threads just wait, and cheap endpoints like /auth/refresh keep
+    being served.
+
+    Admission is bounded: when PASSWORD_HASH_MAX_PENDING hashes are already
+    queued or running in this worker, PasswordHasherBusy is raised straight
+    away (answered with 503 and Retry-After) rather than letting latency grow.
+
+    New hashes use PASSWORD_HASH_METHOD (werkzeug's method string, e.g.
+    'scrypt:32768:8:1'); needs_rehash tells which stored hashes use other
+    parameters, so they can be upgraded at login. With PASSWORD_HASH_WORKERS=0
+    hashing runs inline.
+    """
+
+    def __init__(self):
+        self.method = 'scrypt:32768:8:1'
+        self.workers = 0
+        self.max_pending = 0
+        self.timeout = 10
+        self._prefix = self.method
+        self._pool = None
+        self._pool_pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', 2)
+        self.max_pending = app.config.get('PASSWORD_HASH_MAX_PENDING', 0) or self.workers * 4
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', 10)
+        self._slots = threading.BoundedSemaphore(self.max_pending) if self.workers else None
+        # The method as it appears in hashes ('pbkdf2:sha256' fills in its default iterations)
+        self._prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        app.extensions['password_hasher'] = self
+
+    def _get_pool(self):
+        # Created on first use in each gunicorn worker, never before the fork.
+        # 'spawn' keeps the pool's processes free of the worker's sockets.
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _run(self, function, *args):
+        if not self.workers:
+            return function(*args)
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            future = self._get_pool().submit(function, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        # The slot is held until the hash is done, even if we stop waiting
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise PasswordHasherBusy()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True if the hash was made with other KDF parameters than PASSWORD_HASH_METHOD."""
+        return password_hash.split('$', 1)[0] != self._prefix
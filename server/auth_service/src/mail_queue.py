@@ -0,0 +1,203 @@
+import smtplib
+import socket
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from flask_mail import Connection
+from redis.exceptions import ResponseError
+from src import redis_client
+from src.utils import otp_key, otp_message
+
+# OTP emails are sent by worker processes (flask send-otp-emails), not by
+# the request. /auth/send-otp stores the OTP and appends a job to a Redis
+# Stream; workers read jobs as a consumer group, so each is sent once, and
+# a job left unacknowledged by a crashed worker is claimed by another.
+# Jobs carry only the address: the worker reads the OTP at send time, so no
+# codes sit in the queue, and a job whose OTP has already expired is dropped.
+# Failed sends wait in a sorted set, scored by when to retry.
+# Both keys share a hash tag, so the retry script works in a cluster.
+
+QUEUE_KEY = '{otp-mail}:queue'
+RETRY_KEY = '{otp-mail}:retry'
+GROUP = 'otp-mail'
+
+# KEYS[1] = retry set, KEYS[2] = queue, ARGV[1] = now, ARGV[2] = most jobs to move
+# Moves retries that are due back onto the queue. Members are
+# '<attempts>:<minutes>:<email>'.
+PROMOTE_RETRIES = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, job in ipairs(due) do
+    local attempts, minutes, email = string.match(job, '^(%d+):(%d+):(.*)$')
+    redis.call('ZREM', KEYS[1], job)
+    redis.call('XADD', KEYS[2], '*', 'email', email, 'minutes', minutes, 'attempts', attempts)
+end
+return #due
+"""
+
+
+def enqueue_otp_email(email, otp_expiration_minutes):
+    """Queues the email with the OTP currently stored for this address."""
+    redis_client.xadd(
+        QUEUE_KEY, {"email": email, "minutes": otp_expiration_minutes, "attempts": 0},
+        maxlen=current_app.config.get('MAIL_QUEUE_MAXLEN', 100000), approximate=True
+    )
+
+
+class SMTPSession:
+    """
+    One SMTP connection kept open across batches, so a message costs a
+    single SMTP transaction rather than connect, STARTTLS and login each
+    time. A connection idle for longer than idle_seconds is checked with
+    NOOP first; one the server dropped is reopened and the send retried once.
+    """
+
+    def __init__(self, mail_state, idle_seconds=60):
+        self.mail = mail_state
+        self.idle_seconds = idle_seconds
+        self.connection = None
+        self.last_used = 0
+
+    def _open(self):
+        self.close()
+        self.connection = Connection(self.mail)
+        # MAIL_SUPPRESS_SEND (on when testing) records messages without sending
+        self.connection.host = None if self.mail.suppress else self.connection.configure_host()
+
+    def _alive(self):
+        if self.connection.host is None or time.monotonic() - self.last_used < self.idle_seconds:
+            return True
+        try:
+            return self.connection.host.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def send(self, message):
+        if self.connection is None or not self._alive():
+            self._open()
+        try:
+            self.connection.send(message)
+        except smtplib.SMTPServerDisconnected:
+            self._open()
+            self.connection.send(message)
+        self.last_used = time.monotonic()
+
+    def close(self):
+        if self.connection is not None and self.connection.host is not None:
+            try:
+                self.connection.host.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+        self.connection = None
+
+
+class OTPMailWorker:
+    """
+    Sends queued OTP emails in batches over one SMTP session. Failed sends
+    are retried after retry_base_seconds * 2^attempt, up to max_attempts.
+    """
+
+    def __init__(self, redis, session, consumer, batch_size=50, block_ms=5000,
+                 claim_idle_ms=60000, max_attempts=5, retry_base_seconds=2):
+        self.redis = redis
+        self.session = session
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+
+    def ensure_group(self):
+        try:
+            self.redis.xgroup_create(QUEUE_KEY, GROUP, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def read_batch(self):
+        promote = self.redis.register_script(PROMOTE_RETRIES)
+        promote(keys=[RETRY_KEY, QUEUE_KEY], args=[time.time(), self.batch_size])
+        # Jobs a dead worker left unacknowledged come first
+        claimed = self.redis.xautoclaim(
+            QUEUE_KEY, GROUP, self.consumer,
+            min_idle_time=self.claim_idle_ms, start_id='0-0', count=self.batch_size
+        )[1]
+        if claimed:
+            return claimed
+        response = self.redis.xreadgroup(GROUP, self.consumer, {QUEUE_KEY: '>'}, count=self.batch_size, block=self.block_ms)
+        return response[0][1] if response else []
+
+    def process(self, entries):
+        """
+        Sends a batch of (entry_id, fields) jobs; returns how many emails went out.
+        A job that can't be parsed or sent is dropped (or scheduled for retry),
+        never left to stall the batch: every entry read is acknowledged.
+        """
+        jobs = []
+        for entry_id, fields in entries:
+            if not fields:
+                continue # Deleted while pending
+            try:
+                jobs.append((fields[b'email'].decode('utf-8'), int(fields[b'minutes']), int(fields.get(b'attempts', 0))))
+            except Exception as e:
+                print(f"Dropping malformed OTP email job {entry_id}: {e}")
+
+        with self.redis.pipeline(transaction=False) as pipe:
+            for email, _, _ in jobs:
+                pipe.get(otp_key(email))
+            otps = pipe.execute()
+
+        sent, retries = 0, {}
+        for (email, minutes, attempts), otp in zip(jobs, otps):
+            if otp is None:
+                continue # Expired or already used: the email would be useless
+            try:
+                self.session.send(otp_message(email, otp.decode('utf-8'), minutes, sender=self.session.mail.default_sender))
+                sent += 1
+            except (smtplib.SMTPException, OSError) as e:
+                print(f"Error sending email: {e}")
+                self.session.close()
+                attempts += 1
+                if attempts < self.max_attempts:
+                    retries[f"{attempts}:{minutes}:{email}"] = time.time() + self.retry_base_seconds * 2 ** attempts
+            except Exception as e:
+                # The message itself is bad (e.g. the address); retrying won't help
+                print(f"Dropping OTP email to {email!r}: {e}")
+
+        with self.redis.pipeline(transaction=False) as pipe:
+            if retries:
+                pipe.zadd(RETRY_KEY, retries)
+            if entries:
+                ids = [entry_id for entry_id, _ in entries]
+                pipe.xack(QUEUE_KEY, GROUP, *ids)
+                pipe.xdel(QUEUE_KEY, *ids)
+            pipe.execute()
+        return sent
+
+    def run_once(self):
+        return self.process(self.read_batch())
+
+
+@click.command('send-otp-emails')
+@click.option('--consumer', default=socket.gethostname, help='Name of this worker in the consumer group.')
+@with_appcontext
+def send_otp_emails_command(consumer):
+    """Sends queued OTP emails, until stopped."""
+    config = current_app.config
+    session = SMTPSession(current_app.extensions['mail'], idle_seconds=config.get('MAIL_SMTP_IDLE_SECONDS', 60))
+    worker = OTPMailWorker(
+        redis_client, session, consumer,
+        batch_size=config.get('MAIL_BATCH_SIZE', 50),
+        max_attempts=config.get('MAIL_MAX_ATTEMPTS', 5),
+        retry_base_seconds=config.get('MAIL_RETRY_BASE_SECONDS', 2)
+    )
+    worker.ensure_group()
+    click.echo(f"Sending OTP emails as {consumer}")
+    while True:
+        try:
+            worker.run_once()
+        except Exception as e:
+            # Redis failing over; unacknowledged jobs are read again
+            print(f"Error processing OTP emails: {e}")
+            time.sleep(1)
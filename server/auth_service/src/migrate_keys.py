@@ -0,0 +1,57 @@
+import click
+import redis
+from flask.cli import with_appcontext
+from src import redis_client
+from src.utils import otp_key, verified_email_key
+
+# Key prefix -> function giving the current (hash-tagged) name for an email
+KEY_NAMES = {
+    'otp:': otp_key,
+    'verified-email:': verified_email_key,
+}
+
+
+def untagged_keys(source, pattern):
+    """Names of keys matching pattern that carry no hash tag (written before tagging)."""
+    for key in source.scan_iter(match=pattern, count=500):
+        name = key.decode('utf-8')
+        if '{' not in name:
+            yield name
+
+
+def copy_key(source, old_name, new_name):
+    """
+    Copies a key to redis_client under new_name with DUMP/RESTORE, keeping
+    its remaining TTL. Returns False if the key expired in the meantime.
+    """
+    dumped = source.dump(old_name)
+    if dumped is None:
+        return False
+    ttl = source.pttl(old_name)
+    redis_client.restore(new_name, max(ttl, 0), dumped, replace=True)
+    return True
+
+
+@click.command('migrate-redis-keys')
+@click.option('--source-url', default=None,
+              help='Redis to copy from, e.g. the standalone server being replaced by a cluster. '
+                   'Defaults to the configured Redis, which is migrated in place.')
+@with_appcontext
+def migrate_redis_keys_command(source_url):
+    """
+    Renames sign-up keys (OTPs, verified emails) written before hash tags
+    to their tagged names, so sign-ups in progress survive the switch.
+    Safe to run more than once.
+    """
+    in_place = source_url is None
+    source = redis_client if in_place else redis.Redis.from_url(source_url)
+    moved = 0
+
+    for prefix, key_name in KEY_NAMES.items():
+        for name in untagged_keys(source, f"{prefix}*"):
+            if copy_key(source, name, key_name(name[len(prefix):])):
+                moved += 1
+            if in_place:
+                redis_client.delete(name)
+
+    click.echo(f"Moved {moved} keys.")
@@ -1,8 +1,7 @@
 # auth_service/models.py
 # This file contains the database models for the application.
 
-from src import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from src import db, password_hasher
 from datetime import datetime
 
 class User(db.Model):
@@ -18,10 +17,14 @@ class User(db.Model):
         return f'<User {self.email}>'
 
     def set_password(self, password):
-        """Hashes and sets the user's password."""
-        self.password_hash = generate_password_hash(password)
+        """Hashes and sets the user's password (in the hashing pool; may raise PasswordHasherBusy)."""
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        """Checks if the provided password matches the stored hash."""
-        return check_password_hash(self.password_hash, password)
+        """Checks if the provided password matches the stored hash (may raise PasswordHasherBusy)."""
+        return password_hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        """True if the stored hash uses other KDF parameters than PASSWORD_HASH_METHOD."""
+        return password_hasher.needs_rehash(self.password_hash)
 
@@ -1,32 +1,46 @@
 # auth_service/routes.py
 # This file contains the API routes for the authentication service.
 
-from flask import request, jsonify, Blueprint
+from flask import request, jsonify, Blueprint, current_app
 from src import db
 from src.models import User
-from src.utils import send_otp_email, generate_otp
+from src.utils import generate_otp, is_valid_email, otp_key, verified_email_key
+from src.mail_queue import enqueue_otp_email
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
 from src import redis_client
+from src.db_routing import read_only, read_or_primary
+from src.hashing import PasswordHasherBusy
 
 # Create a Blueprint
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
 
+@auth_bp.errorhandler(PasswordHasherBusy)
+def password_hasher_busy(e):
+    """Too many password hashes queued in this worker: shed the request early."""
+    response = jsonify({"msg": "The server is busy. Please try again shortly."})
+    response.headers['Retry-After'] = str(current_app.config.get('PASSWORD_HASH_RETRY_AFTER', 2))
+    return response, 503
+
+
 @auth_bp.route('/send-otp', methods=['POST'])
 def send_otp():
     # This route remains the same. It works perfectly.
     email = request.get_json().get('email')
     if not email:
         return jsonify({"msg": "Email is required"}), 400
+    if not is_valid_email(email):
+        return jsonify({"msg": "Invalid email address"}), 400
 
     if User.query.filter_by(email=email).first():
         return jsonify({"msg": "An account with this email already exists"}), 409
 
     otp = generate_otp()
     otp_expiration_minutes = 5
-    redis_client.set(f"otp:{email}", otp, ex=otp_expiration_minutes * 60)
-    send_otp_email(email, otp, otp_expiration_minutes)
+    redis_client.set(otp_key(email), otp, ex=otp_expiration_minutes * 60)
+    # Sent by a mail worker (see mail_queue), so the request doesn't wait on SMTP
+    enqueue_otp_email(email, otp_expiration_minutes)
     return jsonify({"msg": f"OTP sent to {email}."}), 200
 
 
@@ -42,16 +56,17 @@ def verify_otp():
     if not email or not otp_provided:
         return jsonify({"msg": "Email and OTP are required"}), 400
 
-    stored_otp_bytes = redis_client.get(f"otp:{email}")
+    stored_otp_bytes = redis_client.get(otp_key(email))
     if not stored_otp_bytes or stored_otp_bytes.decode('utf-8') != otp_provided:
         return jsonify({"msg": "Invalid or expired OTP"}), 400
 
     # <-- CHANGE: Instead of creating a token, set a verified status in Redis
-    # This status will expire in 10 minutes.
-    redis_client.set(f"verified-email:{email}", "true", ex=600)
-    
-    # Clean up the used OTP
-    redis_client.delete(f"otp:{email}")
+    # This status will expire in 10 minutes. The used OTP is cleaned up in
+    # the same transaction.
+    with redis_client.pipeline(transaction=True) as pipe:
+        pipe.set(verified_email_key(email), "true", ex=600)
+        pipe.delete(otp_key(email))
+        pipe.execute()
 
     return jsonify({"msg": "Email verified successfully. You can now set your password."}), 200
 
@@ -69,7 +84,7 @@ def set_password():
         return jsonify({"msg": "Email and password are required"}), 400
 
     # <-- CHANGE: Check Redis to ensure the email was actually verified
-    is_verified_in_redis = redis_client.get(f"verified-email:{email}")
+    is_verified_in_redis = redis_client.get(verified_email_key(email))
     if not is_verified_in_redis:
         return jsonify({"msg": "Email not verified or session expired. Please start over."}), 403
 
@@ -82,13 +97,14 @@ def set_password():
     db.session.commit()
     
     # Clean up the verification status from Redis
-    redis_client.delete(f"verified-email:{email}")
+    redis_client.delete(verified_email_key(email))
 
     return jsonify({"msg": "User account created successfully! Please log in."}), 201
 
 
 
 @auth_bp.route('/login', methods=['POST'])
+@read_only
 def login():
     data = request.get_json()
     email = data.get('email')
@@ -97,13 +113,26 @@ def login():
     if not email or not password:
         return jsonify({"msg": "Email and password are required"}), 400
 
-    user = User.query.filter_by(email=email).first()
+    # A user who just signed up may not have reached the replica yet
+    user = read_or_primary(lambda: User.query.filter_by(email=email).first())
 
     if not user or not user.check_password(password):
         return jsonify({"msg": "Bad email or password"}), 401
     if not user.is_verified:
         return jsonify({"msg": "Account not verified"}), 403
 
+    # Upgrade hashes made with older KDF parameters while we have the password.
+    # Best effort: a busy hashing pool or a failed write must not fail the login.
+    if user.password_needs_rehash():
+        try:
+            user.set_password(password)
+            db.session.commit()
+        except PasswordHasherBusy:
+            pass
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error rehashing password: {e}")
+
     access_token = create_access_token(identity=str(user.id))
     refresh_token = create_refresh_token(identity=str(user.id))
 
@@ -120,7 +149,8 @@ def refresh():
 
 @auth_bp.route('/protected', methods=['GET'])
 @jwt_required()
+@read_only
 def protected():
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    user = read_or_primary(lambda: User.query.get(current_user_id))
     return jsonify(logged_in_as=user.email), 200
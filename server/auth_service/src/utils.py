@@ -1,20 +1,29 @@
 # In utils.py
 
 import random
+import re
 from flask_mail import Message
-from src import mail
+
+# One @, no whitespace (so no header injection through newlines), a dot in the domain
+EMAIL_PATTERN = re.compile(r'[^@\s]+@[^@\s]+\.[^@\s]+')
+
+# The email is the hash tag of its sign-up keys, so in a Redis Cluster
+# both are in one slot and can be updated in a single MULTI/EXEC.
+def otp_key(email):
+    return f"otp:{{{email}}}"
+
+def verified_email_key(email):
+    return f"verified-email:{{{email}}}"
+
+def is_valid_email(email):
+    return isinstance(email, str) and len(email) <= 254 and EMAIL_PATTERN.fullmatch(email) is not None
 
 def generate_otp(length=6):
     """Generates a random 6-digit OTP."""
     return "".join([str(random.randint(0, 9)) for _ in range(length)])
 
-def send_otp_email(user_email, otp, otp_expiration_minutes):
-    """Sends an OTP to the user's email address."""
-    try:
-        msg = Message('Your E2EE Share Verification Code', recipients=[user_email])
-        msg.body = f'Your verification code is: {otp}\nThis code will expire in {otp_expiration_minutes} minutes.'
-        mail.send(msg)
-        return True
-    except Exception as e:
-        print(f"Error sending email: {e}")
-        return False
\ No newline at end of file
+def otp_message(user_email, otp, otp_expiration_minutes, sender=None):
+    """The email carrying an OTP to the user's address (sent by mail_queue's workers)."""
+    msg = Message('Your E2EE Share Verification Code', recipients=[user_email], sender=sender)
+    msg.body = f'Your verification code is: {otp}\nThis code will expire in {otp_expiration_minutes} minutes.'
+    return msg
\ No newline at end of file
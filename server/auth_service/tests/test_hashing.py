@@ -0,0 +1,62 @@
+import threading
+from types import SimpleNamespace
+from werkzeug.security import generate_password_hash
+from src import db, password_hasher
+from src.hashing import PasswordHasher
+from src.models import User
+
+
+def test_hashing_runs_in_the_process_pool():
+    """
+    GIVEN a hasher with a one-process pool
+    WHEN a password is hashed and checked
+    THEN the hash should use the configured method and verify correctly.
+    """
+    hasher = PasswordHasher()
+    hasher.init_app(SimpleNamespace(config={'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000', 'PASSWORD_HASH_WORKERS': 1}, extensions={}))
+
+    password_hash = hasher.hash('correct horse')
+
+    assert password_hash.startswith('pbkdf2:sha256:1000$')
+    assert hasher.verify(password_hash, 'correct horse')
+    assert not hasher.verify(password_hash, 'wrong')
+    assert not hasher.needs_rehash(password_hash)
+
+
+def test_login_rehashes_to_current_parameters(test_app, test_client):
+    """
+    GIVEN a user whose password was hashed with older KDF parameters
+    WHEN they log in
+    THEN the login should succeed and the stored hash should be upgraded.
+    """
+    user = User(email='old@example.com', is_verified=True,
+                password_hash=generate_password_hash('password123', 'pbkdf2:sha256:1000'))
+    db.session.add(user)
+    db.session.commit()
+
+    response = test_client.post('/auth/login', json={'email': 'old@example.com', 'password': 'password123'})
+
+    assert response.status_code == 200
+    db.session.refresh(user)
+    assert user.password_hash.startswith('scrypt:32768:8:1$')
+    assert not user.password_needs_rehash()
+
+
+def test_login_is_shed_when_the_hash_queue_is_full(test_client, mocker):
+    """
+    GIVEN a hashing pool whose queue is full
+    WHEN someone logs in
+    THEN they should get a 503 with Retry-After instead of waiting.
+    """
+    full = threading.BoundedSemaphore(1)
+    full.acquire()
+    mocker.patch.object(password_hasher, 'workers', 1)
+    mocker.patch.object(password_hasher, '_slots', full)
+    mock_user = mocker.MagicMock(password_hash='scrypt:32768:8:1$salt$hash', is_verified=True)
+    mock_user.check_password = lambda password: User.check_password(mock_user, password)
+    mocker.patch('src.models.User.query').filter_by.return_value.first.return_value = mock_user
+
+    response = test_client.post('/auth/login', json={'email': 'user@example.com', 'password': 'password123'})
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '2'
@@ -0,0 +1,140 @@
+import socketserver
+import threading
+import fakeredis
+from flask_mail import Mail
+from src.mail_queue import OTPMailWorker, SMTPSession, enqueue_otp_email, RETRY_KEY
+from src.utils import otp_key
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """A local SMTP server that just records the messages it is given."""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, port=0):
+        super().__init__(('127.0.0.1', port), SMTPHandler)
+        self.messages = []
+        self.connections = 0
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 stand-in ready')
+        while True:
+            line = self.rfile.readline().decode().strip()
+            command = line[:4].upper()
+            if not line or command == 'QUIT':
+                self.reply('221 bye')
+                return
+            if command == 'EHLO':
+                self.reply('250 stand-in')
+            elif command == 'DATA':
+                self.reply('354 go ahead')
+                data = []
+                while (chunk := self.rfile.readline()) not in (b'.\r\n', b''):
+                    data.append(chunk.decode())
+                self.server.messages.append(''.join(data))
+                self.reply('250 queued')
+            else:
+                self.reply('250 ok')
+
+
+def start_smtp_stand_in(port=0):
+    server = SMTPStandIn(port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_worker(redis, port, retry_base_seconds=2):
+    mail_state = Mail().init_mail({
+        'MAIL_SERVER': '127.0.0.1', 'MAIL_PORT': port, 'MAIL_DEFAULT_SENDER': 'noreply@e2ee.local'
+    })
+    worker = OTPMailWorker(redis, SMTPSession(mail_state), 'worker-1', block_ms=None, retry_base_seconds=retry_base_seconds)
+    worker.ensure_group()
+    return worker
+
+
+def test_queued_otps_are_sent_over_one_connection(test_app, mocker):
+    """
+    GIVEN three queued OTP emails, one of whose OTP has already expired
+    WHEN a worker processes the queue in two batches
+    THEN the two live OTPs should be delivered over a single SMTP connection and the expired one dropped.
+    """
+    redis = fakeredis.FakeRedis()
+    mocker.patch('src.mail_queue.redis_client', redis)
+    smtp = start_smtp_stand_in()
+    worker = make_worker(redis, smtp.server_address[1])
+
+    redis.set(otp_key('a@example.com'), '111111')
+    enqueue_otp_email('a@example.com', 5)
+    enqueue_otp_email('expired@example.com', 5)
+    assert worker.run_once() == 1
+
+    redis.set(otp_key('b@example.com'), '222222')
+    enqueue_otp_email('b@example.com', 5)
+    assert worker.run_once() == 1
+    assert worker.run_once() == 0
+
+    assert smtp.connections == 1
+    assert len(smtp.messages) == 2
+    assert 'Your verification code is: 111111' in smtp.messages[0]
+    assert 'Your verification code is: 222222' in smtp.messages[1]
+    smtp.shutdown()
+
+
+def test_failed_sends_are_retried_with_backoff(test_app, mocker):
+    """
+    GIVEN a queued OTP email and a mail server that is down
+    WHEN the worker tries to send it, and again once the server is back
+    THEN the job should wait in the retry set and be delivered on the later attempt.
+    """
+    redis = fakeredis.FakeRedis()
+    mocker.patch('src.mail_queue.redis_client', redis)
+    smtp = start_smtp_stand_in()
+    port = smtp.server_address[1]
+    smtp.shutdown()
+    smtp.server_close()
+
+    worker = make_worker(redis, port, retry_base_seconds=0)
+    redis.set(otp_key('a@example.com'), '333333')
+    enqueue_otp_email('a@example.com', 5)
+
+    assert worker.run_once() == 0
+    assert redis.zrange(RETRY_KEY, 0, -1) == [b'1:5:a@example.com']
+
+    smtp = start_smtp_stand_in(port)
+
+    assert worker.run_once() == 1
+    assert redis.zcard(RETRY_KEY) == 0
+    assert 'Your verification code is: 333333' in smtp.messages[0]
+    smtp.shutdown()
+
+
+def test_bad_jobs_are_dropped_without_stalling_the_batch(test_app, mocker):
+    """
+    GIVEN a batch with a malformed job and an address the mail server rejects, followed by a good job
+    WHEN the worker processes it
+    THEN the good email should still go out, and every job should be acknowledged and removed from the queue.
+    """
+    from src.mail_queue import QUEUE_KEY, GROUP
+    redis = fakeredis.FakeRedis()
+    mocker.patch('src.mail_queue.redis_client', redis)
+    smtp = start_smtp_stand_in()
+    worker = make_worker(redis, smtp.server_address[1])
+    redis.xadd(QUEUE_KEY, {'email': 'a@example.com', 'minutes': 'five'})
+    # Queued before send-otp validated addresses: a newline makes a bad header
+    redis.set(otp_key('bad\n@example.com'), '111111')
+    enqueue_otp_email('bad\n@example.com', 5)
+    redis.set(otp_key('b@example.com'), '222222')
+    enqueue_otp_email('b@example.com', 5)
+
+    assert worker.run_once() == 1
+    assert 'Your verification code is: 222222' in smtp.messages[0]
+    assert redis.xlen(QUEUE_KEY) == 0
+    assert redis.xpending(QUEUE_KEY, GROUP)['pending'] == 0
+    smtp.shutdown()
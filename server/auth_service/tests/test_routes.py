@@ -16,7 +16,7 @@ def test_send_otp_for_new_user(test_client, mocker):
 
     # We also mock the other dependencies for this test
     mocker.patch('src.models.User.query').filter_by.return_value.first.return_value = None
-    mocker.patch('src.routes.send_otp_email')
+    mock_enqueue = mocker.patch('src.routes.enqueue_otp_email')
 
     email = "test@example.com"
     response = test_client.post('/auth/send-otp', json={'email': email})
@@ -27,6 +27,26 @@ def test_send_otp_for_new_user(test_client, mocker):
     
     # We can even check if our MOCK was used correctly.
     mock_redis.set.assert_called_once()
+    # The email itself is left to the mail workers
+    mock_enqueue.assert_called_once_with(email, 5)
+
+
+
+def test_send_otp_rejects_malformed_email(test_client, mocker):
+    """
+    GIVEN email addresses that are malformed or carry a newline
+    WHEN the '/auth/send-otp' endpoint is hit
+    THEN it should answer 400 without storing an OTP or queueing an email.
+    """
+    mock_redis = mocker.patch('src.routes.redis_client')
+    mock_enqueue = mocker.patch('src.routes.enqueue_otp_email')
+
+    for email in ('not-an-email', 'a@b@example.com', 'user@example.com\nBcc: x@example.com', ['user@example.com']):
+        response = test_client.post('/auth/send-otp', json={'email': email})
+        assert response.status_code == 400
+
+    mock_redis.set.assert_not_called()
+    mock_enqueue.assert_not_called()
 
 
 def test_verify_otp_correct(test_client, mocker):
@@ -44,9 +64,12 @@ def test_verify_otp_correct(test_client, mocker):
 
     assert response.status_code == 200
     assert response.json['msg'] == "Email verified successfully. You can now set your password."
-    # Check that it tried to use our mock to set the verified status and delete the old OTP
-    mock_redis.set.assert_called_once_with('verified-email:test@example.com', 'true', ex=600)
-    mock_redis.delete.assert_called_once_with('otp:test@example.com')
+    # Check that it tried to use our mock to set the verified status and delete the old OTP, in one transaction
+    mock_redis.get.assert_called_once_with('otp:{test@example.com}')
+    mock_pipe = mock_redis.pipeline.return_value.__enter__.return_value
+    mock_pipe.set.assert_called_once_with('verified-email:{test@example.com}', 'true', ex=600)
+    mock_pipe.delete.assert_called_once_with('otp:{test@example.com}')
+    mock_pipe.execute.assert_called_once()
 
 
 def test_set_password_successful(test_client, mocker):
@@ -68,7 +91,7 @@ def test_set_password_successful(test_client, mocker):
     assert response.status_code == 201
     mock_db_session.add.assert_called_once()
     mock_db_session.commit.assert_called_once()
-    mock_redis.delete.assert_called_once_with('verified-email:test@example.com')
+    mock_redis.delete.assert_called_once_with('verified-email:{test@example.com}')
 
 
 # --- Login Flow Test (No Redis involved, so no Redis mock needed) ---
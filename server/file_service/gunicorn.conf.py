@@ -0,0 +1,28 @@
+import os
+
+# Gunicorn settings for file_service.
+#
+# Uploads and downloads spend almost all their time waiting on the client or
+# on Swift, so by default each worker runs gevent: every request gets a
+# greenlet instead of a whole worker, and sockets (including swiftclient's)
+# are patched to be non-blocking. Concurrent transfers are then limited by
+# bandwidth and GUNICORN_WORKER_CONNECTIONS, not by the number of workers.
+# Set GUNICORN_WORKER_CLASS=sync to go back to one request per worker.
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+workers = int(os.environ.get('GUNICORN_WORKERS', (os.cpu_count() or 1) + 1))
+# Greenlets (concurrent requests) per gevent worker
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 2000))
+# For gevent workers this only bounds how long a worker may stop responding,
+# not how long a single transfer may take
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        # psycopg2 is a C extension that gevent can't patch; this makes its
+        # waits on Postgres yield to other greenlets too.
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
@@ -2,10 +2,22 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
+from flask_redis import FlaskRedis
 from src.config import config
+from src.storage import Storage
+from src.cache import FileMetadataCache
+from src.rate_limit import RateLimiter
+from src.migrations import migrate_db_command
+from src.db_routing import RoutingSession, ReplicaRouter
+from src.redis_provider import RedisProvider, redis_options
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 jwt = JWTManager()
+storage = Storage()
+redis_client = FlaskRedis.from_custom_provider(RedisProvider)
+file_cache = FileMetadataCache()
+rate_limiter = RateLimiter()
+replica_router = ReplicaRouter()
 
 def create_app(config_name='default'):
     app = Flask(__name__)
@@ -24,14 +36,41 @@ def create_app(config_name='default'):
         origins=allowed_origins,
         methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
         allow_headers=["Content-Type", "Authorization"],
+        expose_headers=["X-Next-Cursor", "Repr-Digest", "Retry-After"], # Pagination cursor for /files/my-files, download digest, rate limits
         supports_credentials=True # Important for sending auth tokens
     )
 
     db.init_app(app)
     jwt.init_app(app)
+    storage.init_app(app)
+
+    # Redis is optional here; without it the metadata cache is in-process only
+    if app.config.get('REDIS_URL') or app.config.get('REDIS_SENTINELS'):
+        redis_client.init_app(app, **redis_options(app.config))
+        file_cache.init_app(app, redis=redis_client)
+        replica_router.init_app(app, redis=redis_client)
+        rate_limiter.init_app(app, redis=redis_client)
+    else:
+        file_cache.init_app(app)
+        replica_router.init_app(app)
+        rate_limiter.init_app(app)
 
     from src.routes import file_bp
     app.register_blueprint(file_bp)
+
+    from src.reconcile import reconcile_storage_command, clean_uploads_command
+    app.cli.add_command(reconcile_storage_command)
+    app.cli.add_command(clean_uploads_command)
+
+    from src.integrity import verify_storage_command
+    app.cli.add_command(verify_storage_command)
+
+    from src.swift import ensure_swift_container_command
+    app.cli.add_command(ensure_swift_container_command)
+
+    # Schema changes to existing tables are left to 'flask migrate-db', run once
+    # per deploy, rather than raced by every worker at boot
+    app.cli.add_command(migrate_db_command)
     
     with app.app_context():
         db.create_all()
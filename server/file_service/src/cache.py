@@ -0,0 +1,126 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Stands in for "not cached" so a cached None (file does not exist) can be told apart
+MISSING = object()
+
+
+class LRUCache:
+    """A small thread-safe LRU cache whose entries expire after a per-entry TTL."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class FileMetadataCache:
+    """
+    Read-through cache for file metadata used by the public endpoints.
+
+    Lookups go to an in-process LRU first, then Redis, then the loader
+    (the database). Missing files are cached too, for a shorter time, so
+    scans of unknown IDs don't all reach Postgres. The local tier has a short
+    TTL because other workers can't invalidate it; writers invalidate Redis.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.redis = None
+        self.local = LRUCache(0)
+
+    def init_app(self, app, redis=None):
+        self.enabled = app.config.get('METADATA_CACHE_ENABLED', True)
+        self.redis = redis
+        self.local_ttl = app.config.get('METADATA_CACHE_LOCAL_TTL', 5)
+        self.redis_ttl = app.config.get('METADATA_CACHE_REDIS_TTL', 300)
+        self.negative_ttl = app.config.get('METADATA_CACHE_NEGATIVE_TTL', 5)
+        self.local = LRUCache(app.config.get('METADATA_CACHE_MAX_ENTRIES', 10000))
+        app.extensions['file_cache'] = self
+
+    @staticmethod
+    def _key(file_id):
+        return f"file-meta:{file_id}"
+
+    def get(self, file_id, loader):
+        """Returns the cached metadata dict for file_id (or None), calling loader(file_id) on a miss."""
+        if not self.enabled:
+            return loader(file_id)
+
+        value = self.local.get(file_id)
+        if value is not MISSING:
+            return value
+
+        value = self._redis_get(file_id)
+        if value is MISSING:
+            value = loader(file_id)
+            self._redis_set(file_id, value)
+
+        self.local.set(file_id, value, self.local_ttl if value is not None else min(self.local_ttl, self.negative_ttl))
+        return value
+
+    def invalidate(self, file_id):
+        """Drops file_id from both tiers; call after changing or deleting the row."""
+        self.local.delete(file_id)
+        if self.redis is None:
+            return
+        try:
+            self.redis.delete(self._key(file_id))
+        except Exception as e:
+            print(f"Error invalidating file metadata cache: {e}")
+
+    def invalidate_many(self, file_ids):
+        """Like invalidate, with a single Redis round trip for all IDs."""
+        for file_id in file_ids:
+            self.local.delete(file_id)
+        if self.redis is None or not file_ids:
+            return
+        try:
+            self.redis.delete(*[self._key(file_id) for file_id in file_ids])
+        except Exception as e:
+            print(f"Error invalidating file metadata cache: {e}")
+
+    def _redis_get(self, file_id):
+        if self.redis is None:
+            return MISSING
+        try:
+            raw = self.redis.get(self._key(file_id))
+        except Exception as e:
+            # The cache must never take the endpoint down; fall back to the database
+            print(f"Error reading file metadata cache: {e}")
+            return MISSING
+        return MISSING if raw is None else json.loads(raw)
+
+    def _redis_set(self, file_id, value):
+        if self.redis is None:
+            return
+        ttl = self.redis_ttl if value is not None else self.negative_ttl
+        try:
+            self.redis.set(self._key(file_id), json.dumps(value), ex=ttl)
+        except Exception as e:
+            print(f"Error writing file metadata cache: {e}")
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -15,18 +16,119 @@ def get_postgres_uri():
     
     return f"postgresql://{user}:{password}@{host}:{port}/{db_name}"
 
+def get_replica_binds():
+    urls = os.environ.get('DATABASE_REPLICA_URLS', '')
+    replicas = [url.strip() for url in urls.split(',') if url.strip()]
+    return {f"replica_{i}": url for i, url in enumerate(replicas)}
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY')
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') # Must match the auth service
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_DATABASE_URI = get_postgres_uri()
+    # Shared secret access_service sends on internal calls (see /files/internal/*)
+    INTERNAL_API_TOKEN = os.environ.get('INTERNAL_API_TOKEN')
+
+    # Connection pool of each worker process. pre_ping replaces connections the
+    # server (or a proxy) closed; recycle keeps them from outliving idle timeouts.
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ['true', 'on', '1'],
+    }
+    # Read replicas (comma-separated DATABASE_REPLICA_URLS) for the read-only endpoints
+    SQLALCHEMY_BINDS = get_replica_binds()
+    # After a user writes, their reads stay on the primary this long (replication lag)
+    DB_REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 10))
 
     # Swift Object Storage Configuration
     SWIFT_AUTH_URL = os.environ.get('SWIFT_AUTH_URL') # e.g., 'http://YOUR_VM_IP/identity/v3'
     SWIFT_USER = os.environ.get('SWIFT_USER')
     SWIFT_KEY = os.environ.get('SWIFT_KEY') # This is the password
     SWIFT_CONTAINER = os.environ.get('SWIFT_CONTAINER')
-    
+    REDIS_URL = os.environ.get('REDIS_URL')
+    # 'standalone' (REDIS_URL), 'sentinel' (REDIS_SENTINELS, with REDIS_URL
+    # only for db/credentials) or 'cluster' (REDIS_URL of any cluster node)
+    REDIS_MODE = os.environ.get('REDIS_MODE', 'standalone')
+    REDIS_SENTINELS = os.environ.get('REDIS_SENTINELS') # "host:26379,host2:26379"
+    REDIS_SENTINEL_SERVICE = os.environ.get('REDIS_SENTINEL_SERVICE', 'mymaster')
+    REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 50))
+    REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 2))
+    # Retries of a command that hit a dropped connection, e.g. during failover
+    REDIS_RETRIES = int(os.environ.get('REDIS_RETRIES', 3))
+    # Read-through cache for file metadata on the public endpoints (local LRU + Redis)
+    METADATA_CACHE_ENABLED = os.environ.get('METADATA_CACHE_ENABLED', 'true').lower() in ['true', 'on', '1']
+    METADATA_CACHE_LOCAL_TTL = int(os.environ.get('METADATA_CACHE_LOCAL_TTL', 5))
+    METADATA_CACHE_REDIS_TTL = int(os.environ.get('METADATA_CACHE_REDIS_TTL', 300))
+    METADATA_CACHE_NEGATIVE_TTL = int(os.environ.get('METADATA_CACHE_NEGATIVE_TTL', 5))
+    METADATA_CACHE_MAX_ENTRIES = int(os.environ.get('METADATA_CACHE_MAX_ENTRIES', 10000))
+    # Rate limits of the public endpoints, '<requests>/<seconds>' ('' for none),
+    # counted per 'ip', 'user' or 'id' (see rate_limit.py). Needs Redis.
+    RATE_LIMIT_PUBLIC_META = os.environ.get('RATE_LIMIT_PUBLIC_META', '60/60')
+    RATE_LIMIT_PUBLIC_META_BY = os.environ.get('RATE_LIMIT_PUBLIC_META_BY', 'ip')
+    RATE_LIMIT_DOWNLOAD = os.environ.get('RATE_LIMIT_DOWNLOAD', '120/60')
+    RATE_LIMIT_DOWNLOAD_BY = os.environ.get('RATE_LIMIT_DOWNLOAD_BY', 'ip')
+    # Proxies in front of the service that append to X-Forwarded-For
+    RATE_LIMIT_TRUSTED_PROXIES = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', 0))
+
+    # Page size for /files/my-files (clients may ask for up to the max)
+    MY_FILES_PAGE_SIZE = int(os.environ.get('MY_FILES_PAGE_SIZE', 50))
+    MY_FILES_MAX_PAGE_SIZE = int(os.environ.get('MY_FILES_MAX_PAGE_SIZE', 200))
+
+    # Most files a single bulk status/delete request may touch
+    BULK_MAX_FILES = int(os.environ.get('BULK_MAX_FILES', 1000))
+    # Parallel blob deletes per bulk delete request
+    STORAGE_DELETE_CONCURRENCY = int(os.environ.get('STORAGE_DELETE_CONCURRENCY', 8))
+
+    # Cache-Control max-age for downloads. Blobs are immutable ciphertext, so
+    # browsers, nginx and CDNs may keep them; the key never leaves the client.
+    DOWNLOAD_CACHE_MAX_AGE = int(os.environ.get('DOWNLOAD_CACHE_MAX_AGE', 31536000))
+
+    # Bytes each user may store across all statuses (trashed files still count).
+    # Off (0) unless set, so existing accounts above any limit aren't locked out of uploading.
+    USER_QUOTA_BYTES = int(os.environ.get('USER_QUOTA_BYTES', 0))
+
+    # Where encrypted blobs are stored: 'swift' or 'local'
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'swift')
+    # Size of each chunk read from storage and written to the client on download
+    STORAGE_CHUNK_SIZE = int(os.environ.get('STORAGE_CHUNK_SIZE', 64 * 1024))
+    # Local backend: directory holding the blobs
+    LOCAL_STORAGE_PATH = os.environ.get('LOCAL_STORAGE_PATH') or os.path.abspath('uploads')
+    # Local backend: if set (e.g. '/protected-uploads'), downloads are handed to nginx
+    # with X-Accel-Redirect to this `internal` location instead of being sent by gunicorn
+    LOCAL_STORAGE_ACCEL_PREFIX = os.environ.get('LOCAL_STORAGE_ACCEL_PREFIX')
+
+    # Retry/backoff for 401s and connection resets (handled by swiftclient)
+    SWIFT_RETRIES = int(os.environ.get('SWIFT_RETRIES', 5))
+    SWIFT_STARTING_BACKOFF = float(os.environ.get('SWIFT_STARTING_BACKOFF', 1))
+    SWIFT_MAX_BACKOFF = float(os.environ.get('SWIFT_MAX_BACKOFF', 16))
+    SWIFT_TIMEOUT = float(os.environ.get('SWIFT_TIMEOUT', 30))
+    # Most Swift connections a worker holds open; requests beyond that wait
+    # up to SWIFT_POOL_TIMEOUT seconds for one. A download holds its connection
+    # while it streams, so this bounds concurrent transfers per worker; every
+    # worker of every replica opens up to this many to the Swift proxies.
+    SWIFT_POOL_SIZE = int(os.environ.get('SWIFT_POOL_SIZE', 100))
+    SWIFT_POOL_TIMEOUT = float(os.environ.get('SWIFT_POOL_TIMEOUT', 30))
+    # Auth tokens are reused until this many seconds after they were issued
+    SWIFT_TOKEN_TTL = int(os.environ.get('SWIFT_TOKEN_TTL', 3600))
+    # Swift's SLO middleware accepts at most 1000 segments per manifest by default
+    UPLOAD_MAX_SEGMENTS = int(os.environ.get('UPLOAD_MAX_SEGMENTS', 1000))
+    # Seconds an unfinished upload session (and its stored segments) is kept;
+    # after that it is refused and 'clean-uploads' deletes it
+    UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL', 24 * 3600))
+    # Secret for signing TempURLs, which let browsers PUT/GET blobs directly in Swift.
+    # Stored as the container's Temp-URL-Key by 'ensure-swift-container'; unset disables direct transfers.
+    SWIFT_TEMPURL_KEY = os.environ.get('SWIFT_TEMPURL_KEY')
+    # Seconds a TempURL stays valid; it only has to last until the transfer starts
+    SWIFT_TEMPURL_TTL = int(os.environ.get('SWIFT_TEMPURL_TTL', 300))
+    # Swift as browsers reach it (scheme://host[:port]), if not the storage URL's host
+    SWIFT_PUBLIC_URL = os.environ.get('SWIFT_PUBLIC_URL')
+    # Origin allowed to call Swift directly from the browser (set as container CORS metadata)
+    SWIFT_CORS_ALLOW_ORIGIN = os.environ.get('SWIFT_CORS_ALLOW_ORIGIN')
+    # File used to share the auth token between gunicorn workers
+    SWIFT_TOKEN_CACHE_FILE = os.environ.get('SWIFT_TOKEN_CACHE_FILE') or os.path.join(tempfile.gettempdir(), 'e2ee-swift-token.json')
     
     @staticmethod
     def init_app(app):
@@ -43,6 +145,17 @@ class TestingConfig(Config):
     # For testing, you might want a separate test database
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or 'sqlite://' # Or a test postgres DB
     WTF_CSRF_ENABLED = False 
+    # Tests mock File.query per test, so cached rows would leak between tests
+    METADATA_CACHE_ENABLED = False
+    # Tests use real files on disk instead of a Swift cluster
+    STORAGE_BACKEND = 'local'
+    LOCAL_STORAGE_PATH = os.path.join(tempfile.gettempdir(), 'e2ee-share-test-uploads')
+    # sqlite's in-memory pool takes no pool settings, and there are no replicas
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    SQLALCHEMY_BINDS = {}
+    # There is no Redis to count in; tests that need limits set them
+    RATE_LIMIT_PUBLIC_META = ''
+    RATE_LIMIT_DOWNLOAD = ''
 
 class ProductionConfig(Config):
     """Configuration for production."""
@@ -0,0 +1,163 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app, g, has_request_context
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+# SQLALCHEMY_BINDS keys of the read replicas (see get_replica_binds in config.py)
+REPLICA_BIND_PREFIX = 'replica_'
+
+
+class RoutingSession(Session):
+    """
+    Session that sends the queries of read-only views to a read replica and
+    everything else to the primary.
+
+    A request starts reading from a replica only if its view is marked with
+    @read_only and its user hasn't written anything recently; as soon as the
+    request flushes a write, the rest of it uses the primary too.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and use_replica():
+            replica = pick_replica(self._db)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _after_flush(session, flush_context):
+    if has_request_context():
+        g.db_wrote = True
+        g.db_primary = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _after_commit(session):
+    if has_request_context() and g.pop('db_wrote', False):
+        router = current_app.extensions.get('replica_router')
+        if router is not None and router.enabled:
+            router.mark_wrote(current_identity())
+
+
+def use_replica():
+    return has_request_context() and g.get('db_read_only', False) and not g.get('db_primary', False)
+
+
+def pick_replica(db):
+    """The replica engine this request reads from (picked once per request), or None."""
+    if 'db_replica' not in g:
+        replicas = [engine for key, engine in db.engines.items()
+                    if key and key.startswith(REPLICA_BIND_PREFIX)]
+        g.db_replica = random.choice(replicas) if replicas else None
+    return g.db_replica
+
+
+def current_identity():
+    """The JWT identity of the request, or None for anonymous requests."""
+    try:
+        return get_jwt_identity()
+    except RuntimeError:
+        return None
+
+
+def read_only(view):
+    """
+    Marks a view as read-only, so its queries may go to a read replica.
+    Put it below @jwt_required so the user's recent writes can be honoured.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        router = current_app.extensions.get('replica_router')
+        if router is not None and router.enabled:
+            g.db_read_only = True
+            if router.recently_wrote(current_identity()):
+                g.db_primary = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def on_primary():
+    """Runs the enclosed queries on the primary, even in a read-only view."""
+    previous = g.get('db_primary', False)
+    g.db_primary = True
+    try:
+        yield
+    finally:
+        g.db_primary = previous
+
+
+def read_or_primary(load):
+    """
+    Calls load(); if it found nothing on a replica, calls it again on the
+    primary, since the row may simply not have replicated yet.
+    """
+    result = load()
+    if result is None and g.get('db_replica') is not None and use_replica():
+        with on_primary():
+            result = load()
+    return result
+
+
+class ReplicaRouter:
+    """
+    Flask extension that remembers which users wrote recently, so their
+    reads stay on the primary until replicas have caught up (read-your-writes).
+    The marks live in Redis when available, so all workers see them,
+    and in a small in-process table otherwise.
+    """
+
+    MAX_LOCAL_MARKS = 10000
+
+    def __init__(self):
+        self.enabled = False
+        self.redis = None
+        self.sticky_seconds = 0
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app, redis=None):
+        self.enabled = any(key.startswith(REPLICA_BIND_PREFIX) for key in app.config.get('SQLALCHEMY_BINDS') or {})
+        self.redis = redis
+        self.sticky_seconds = app.config.get('DB_REPLICA_STICKY_SECONDS', 10)
+        app.extensions['replica_router'] = self
+
+    @staticmethod
+    def _key(identity):
+        return f"db-sticky:{identity}"
+
+    def mark_wrote(self, identity):
+        if identity is None or not self.sticky_seconds:
+            return
+        if self.redis is not None:
+            try:
+                self.redis.set(self._key(identity), 1, ex=self.sticky_seconds)
+                return
+            except Exception as e:
+                print(f"Error recording recent write: {e}")
+        with self._lock:
+            self._local[identity] = time.monotonic() + self.sticky_seconds
+            self._local.move_to_end(identity)
+            while len(self._local) > self.MAX_LOCAL_MARKS:
+                self._local.popitem(last=False)
+
+    def recently_wrote(self, identity):
+        if identity is None or not self.sticky_seconds:
+            return False
+        if self.redis is not None:
+            try:
+                return bool(self.redis.exists(self._key(identity)))
+            except Exception as e:
+                # Can't tell, so play safe and read from the primary
+                print(f"Error checking recent writes: {e}")
+                return True
+        with self._lock:
+            expires_at = self._local.get(identity)
+        return expires_at is not None and expires_at > time.monotonic()
@@ -0,0 +1,106 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask.cli import with_appcontext
+from src import db, storage
+from src.models import File
+from src.storage import ObjectNotFound
+
+
+class HashingReader:
+    """
+    Wraps a readable stream and computes the SHA-256 and byte count of
+    everything read through it, so an upload is hashed as it passes through
+    to storage instead of being buffered first.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.sha256 = hashlib.sha256()
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = self.stream.read(size)
+        self.update(chunk)
+        return chunk
+
+    def update(self, chunk):
+        self.sha256.update(chunk)
+        self.bytes_read += len(chunk)
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
+
+def object_sha256(name):
+    """Streams a stored object and returns (sha256 hex digest, size)."""
+    _, _, body = storage.get(name)
+    reader = HashingReader(None)
+    try:
+        for chunk in body:
+            reader.update(chunk)
+    finally:
+        body.close()
+    return reader.hexdigest(), reader.bytes_read
+
+
+class Verifier:
+    """
+    Re-reads stored objects and checks them against the SHA-256 and size
+    recorded at upload. Objects are hashed by a pool of threads; rows are
+    fetched a batch at a time, so memory stays bounded.
+    """
+
+    def __init__(self, workers=8, batch_size=100, echo=print):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.echo = echo
+        self.stats = {"checked": 0, "corrupt": 0, "missing": 0, "errors": 0}
+
+    def run(self):
+        query = db.session.query(File.id, File.storage_path, File.size, File.sha256) \
+            .filter(File.sha256.isnot(None)).order_by(File.id).yield_per(self.batch_size)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='verify') as pool:
+            batch = []
+            for row in query:
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    self._check_batch(pool, batch)
+                    batch = []
+            self._check_batch(pool, batch)
+        return self.stats
+
+    def _check_batch(self, pool, rows):
+        for row, (outcome, detail) in zip(rows, pool.map(self._check, rows)):
+            self.stats["checked"] += 1
+            if outcome is not None:
+                self.stats[outcome] += 1
+                self.echo(f"{outcome}: {row.id} ({row.storage_path}){detail}")
+
+    @staticmethod
+    def _check(row):
+        """Runs in a pool thread; returns (None, '') if the object is intact, else what is wrong."""
+        try:
+            sha256, size = object_sha256(row.storage_path)
+        except ObjectNotFound:
+            return "missing", ""
+        except Exception as e:
+            return "errors", f": {e}"
+        if sha256 != row.sha256 or size != row.size:
+            return "corrupt", ""
+        return None, ""
+
+
+@click.command('verify-storage')
+@click.option('--workers', default=8, show_default=True, help='Objects hashed in parallel.')
+@click.option('--batch-size', default=100, show_default=True, help='Rows per database fetch.')
+@with_appcontext
+def verify_storage_command(workers, batch_size):
+    """Re-hash stored objects and report any whose SHA-256 or size no longer matches."""
+    stats = Verifier(workers, batch_size, echo=click.echo).run()
+    click.echo(
+        f"Checked {stats['checked']} files: {stats['corrupt']} corrupt, "
+        f"{stats['missing']} missing, {stats['errors']} errors."
+    )
+    if stats['corrupt'] or stats['missing'] or stats['errors']:
+        raise SystemExit(1)
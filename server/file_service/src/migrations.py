@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, inspect, select, text
+
+
+def ensure_columns(db, model):
+    """
+    Adds columns declared on a model that its existing table is missing.
+    Only nullable columns can be added this way; existing rows get NULL.
+    """
+    engine = db.engine
+    table = model.__tablename__
+    existing = {column['name'] for column in inspect(engine).get_columns(table)}
+
+    for column in model.__table__.columns:
+        if column.name in existing:
+            continue
+        column_type = column.type.compile(dialect=engine.dialect)
+        with engine.begin() as conn:
+            conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column.name} {column_type}'))
+
+
+def invalid_indexes(engine, table):
+    """
+    Names of a table's indexes Postgres marks invalid: a CREATE INDEX
+    CONCURRENTLY that failed or was interrupted leaves one behind, which
+    is never used for queries but still slows down every write.
+    """
+    if engine.dialect.name != 'postgresql':
+        return set()
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            'SELECT index_class.relname FROM pg_index '
+            'JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid '
+            'JOIN pg_class table_class ON table_class.oid = pg_index.indrelid '
+            'WHERE table_class.relname = :table AND NOT pg_index.indisvalid'
+        ), {'table': table})
+        return {row[0] for row in rows}
+
+
+def ensure_indexes(db, model):
+    """
+    Creates the indexes declared on a model that its existing table is missing,
+    and rebuilds any left invalid by an earlier, failed build.
+    db.create_all() only creates indexes together with new tables, so indexes
+    added to a model later are applied here.
+    """
+    engine = db.engine
+    table = model.__tablename__
+    invalid = invalid_indexes(engine, table)
+    existing = {index['name'] for index in inspect(engine).get_indexes(table)} - invalid
+
+    for index in model.__table__.indexes:
+        if index.name in existing:
+            continue
+        if engine.dialect.name == 'postgresql':
+            # CONCURRENTLY doesn't block writes on a large, live table,
+            # but it can't run inside a transaction.
+            columns = ', '.join(column.name for column in index.columns)
+            with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                if index.name in invalid:
+                    conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {index.name}'))
+                conn.execute(text(f'CREATE INDEX CONCURRENTLY {index.name} ON {table} ({columns})'))
+        else:
+            index.create(bind=engine, checkfirst=True)
+
+
+def backfill_usage(db):
+    """
+    Fills an empty storage_usage table from the files table, so users who
+    uploaded before usage was tracked start out with correct numbers.
+    Runs once: afterwards the table is never empty while files exist.
+    """
+    from src.models import File, StorageUsage
+    if StorageUsage.query.first() is not None or File.query.first() is None:
+        return
+    db.session.execute(StorageUsage.__table__.insert().from_select(
+        ['owner_user_id', 'status', 'bytes', 'file_count'],
+        select(File.owner_user_id, File.status, func.sum(File.size), func.count(File.id))
+        .group_by(File.owner_user_id, File.status)
+    ))
+    db.session.commit()
+
+
+def backfill_session_expiry(db):
+    """
+    Gives upload sessions started before sessions expired an expiry
+    UPLOAD_SESSION_TTL after they were created, so they get cleaned up too.
+    """
+    from src.config import Config
+    from src.models import UploadSession
+    sessions = UploadSession.query.filter(UploadSession.expires_at.is_(None)).all()
+    for upload in sessions:
+        upload.expires_at = (upload.created_at or datetime.utcnow()) + timedelta(seconds=Config.UPLOAD_SESSION_TTL)
+    db.session.commit()
+
+
+def upgrade(db):
+    """Brings an existing database up to date with the models."""
+    from src.models import File, UploadSession
+    for model in (File, UploadSession):
+        ensure_columns(db, model)
+        ensure_indexes(db, model)
+    backfill_usage(db)
+    backfill_session_expiry(db)
+
+
+
+@click.command('migrate-db')
+@with_appcontext
+def migrate_db_command():
+    """
+    Creates missing tables, columns and indexes and backfills derived data.
+    Run once per deploy, before the new version serves traffic; safe to run again.
+    """
+    from src import db
+    db.create_all()
+    upgrade(db)
+    click.echo("Database is up to date.")
@@ -1,9 +1,17 @@
 from src import db
-from datetime import datetime
+from src.config import Config
+from datetime import datetime, timedelta
 import uuid
 
+# Segments of segmented uploads are stored as SEGMENT_PREFIX + "<storage_path>/<number>"
+SEGMENT_PREFIX = 'segments/'
+
 class File(db.Model):
     __tablename__ = 'files'
+    __table_args__ = (
+        # Serves /my-files: one owner, one status, newest first, keyset on (created_at, id)
+        db.Index('ix_files_owner_status_created', 'owner_user_id', 'status', 'created_at', 'id'),
+    )
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     owner_user_id = db.Column(db.Integer, nullable=False, index=True)
@@ -15,6 +23,13 @@ class File(db.Model):
     # Placeholder for actual storage location (e.g., S3 path or local path)
     storage_path = db.Column(db.String(1024), nullable=False)
 
+    # Storage etag of the (immutable) blob, served as the download ETag
+    etag = db.Column(db.String(64), nullable=True)
+
+    # SHA-256 (hex) of the encrypted blob, computed while it was uploaded.
+    # NULL for segmented uploads and files uploaded before digests were stored.
+    sha256 = db.Column(db.String(64), nullable=True)
+
     # For soft delete and archiving
     status = db.Column(db.String(20), default='active', nullable=False) # active, trashed, archived
 
@@ -25,5 +40,68 @@ class File(db.Model):
             "filename": self.filename,
             "size": self.size,
             "created_at": self.created_at.isoformat(),
-            "status": self.status
-        }
\ No newline at end of file
+            "status": self.status,
+            "sha256": self.sha256
+        }
+
+class UploadSession(db.Model):
+    """
+    A resumable, segmented upload in progress.
+    Segments are stored as separate objects and joined by the storage backend
+    (an SLO manifest on Swift) on completion, when the File row is created.
+    """
+    __tablename__ = 'upload_sessions'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    owner_user_id = db.Column(db.Integer, nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    content_type = db.Column(db.String(100), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False) # Expected total size in bytes
+    segment_count = db.Column(db.Integer, nullable=False)
+    storage_path = db.Column(db.String(1024), nullable=False) # Object name of the final manifest
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Unfinished sessions are refused after this and deleted by 'clean-uploads'
+    expires_at = db.Column(db.DateTime, nullable=True, index=True,
+                           default=lambda: datetime.utcnow() + timedelta(seconds=Config.UPLOAD_SESSION_TTL))
+
+    segments = db.relationship('UploadSegment', backref='session', lazy='dynamic',
+                               cascade='all, delete-orphan')
+
+    def segment_path(self, number):
+        """Object name of a single segment; zero-padded so listings sort by number."""
+        return f"{SEGMENT_PREFIX}{self.storage_path}/{number:08d}"
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "size": self.size,
+            "segment_count": self.segment_count,
+            "received_segments": sorted(segment.number for segment in self.segments),
+            "created_at": self.created_at.isoformat(),
+            "expires_at": self.expires_at.isoformat() if self.expires_at else None
+        }
+
+
+class UploadSegment(db.Model):
+    """A segment that has been stored in Swift for an UploadSession."""
+    __tablename__ = 'upload_segments'
+
+    session_id = db.Column(db.String(36), db.ForeignKey('upload_sessions.id'), primary_key=True)
+    number = db.Column(db.Integer, primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    etag = db.Column(db.String(64), nullable=False)
+
+
+class StorageUsage(db.Model):
+    """
+    Materialized per-user storage usage, one row per (owner, status).
+    Kept in step with the files table in the same transaction as every
+    change, so quota checks never have to SUM over a user's files.
+    """
+    __tablename__ = 'storage_usage'
+
+    owner_user_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    file_count = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,205 @@
+import heapq
+from collections import defaultdict
+from datetime import datetime, timedelta
+import click
+from flask.cli import with_appcontext
+from src import db, storage, file_cache
+from src.models import File, UploadSession, UploadSegment, SEGMENT_PREFIX
+from src.usage import adjust_usage_for_files
+
+
+def sorted_paths(column):
+    """
+    Orders a storage_path column the way object listings are ordered (byte-wise).
+    Postgres would otherwise sort by the database's locale collation.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        return column.collate('C')
+    return column
+
+
+def segment_parent(name):
+    """storage_path a segment object belongs to: 'segments/<parent>/<n>' -> '<parent>'."""
+    return name[len(SEGMENT_PREFIX):].split('/', 1)[0]
+
+
+class Reconciler:
+    """
+    Finds (and optionally repairs) mismatches between stored objects and the
+    files table: objects nothing points to, and rows whose blob is gone.
+    Objects of unexpired upload sessions (segments, unconfirmed direct
+    uploads) are still wanted; those of expired sessions are orphans.
+
+    The object listing and the table are both walked in storage_path order and
+    merged like two sorted files, so memory stays bounded no matter how many
+    objects there are. Anything newer than the grace period is left alone,
+    since an upload writes its blob before it commits its row.
+    """
+
+    def __init__(self, grace, repair=False, batch_size=1000, echo=print):
+        self.now = datetime.utcnow()
+        self.cutoff = self.now - grace
+        self.repair = repair
+        self.batch_size = batch_size
+        self.echo = echo
+        self.orphan_batch = []
+        self.dangling_rows = []
+        self.stats = {"objects": 0, "rows": 0, "orphaned_objects": 0, "dangling_rows": 0}
+
+    def run(self):
+        self._check_objects()
+        self._check_segments()
+        self._flush_orphans()
+        self._delete_dangling_rows()
+        return self.stats
+
+    def _files(self):
+        query = db.session.query(File.id, File.storage_path, File.created_at, File.owner_user_id, File.status, File.size)
+        return query.order_by(sorted_paths(File.storage_path)).yield_per(self.batch_size)
+
+    def _sessions(self):
+        """storage_paths of unexpired upload sessions; anything of an expired one is an orphan."""
+        query = db.session.query(UploadSession.storage_path).filter(UploadSession.expires_at > self.now)
+        rows = query.order_by(sorted_paths(UploadSession.storage_path)).yield_per(self.batch_size)
+        return (row.storage_path for row in rows)
+
+    def _check_objects(self):
+        """
+        Merges whole objects (not segments) against files rows. An object with
+        no row may be a direct upload that hasn't been confirmed yet, so it is
+        also looked up in the (sorted) upload sessions.
+        """
+        objects = (obj for obj in storage.list_objects() if not obj.name.startswith(SEGMENT_PREFIX))
+        rows = iter(self._files())
+        sessions = self._sessions()
+        obj, row, session = next(objects, None), next(rows, None), next(sessions, None)
+
+        while obj is not None or row is not None:
+            if row is None or (obj is not None and obj.name < row.storage_path):
+                self.stats["objects"] += 1
+                while session is not None and session < obj.name:
+                    session = next(sessions, None)
+                if session != obj.name:
+                    self._orphaned_object(obj)
+                obj = next(objects, None)
+            elif obj is None or row.storage_path < obj.name:
+                self.stats["rows"] += 1
+                self._dangling_row(row)
+                row = next(rows, None)
+            else:
+                self.stats["objects"] += 1
+                self.stats["rows"] += 1
+                obj, row = next(objects, None), next(rows, None)
+
+    def _check_segments(self):
+        """
+        Merges segment objects against the files and unexpired upload sessions
+        they belong to; segments of expired sessions are orphans.
+        Relies on storage paths never containing characters that sort before '/'
+        (they are "<uuid>.enc"), so segment listings are in parent order.
+        """
+        files = (row.storage_path for row in self._files())
+        parents = heapq.merge(files, self._sessions())
+        parent = next(parents, None)
+
+        for obj in storage.list_objects(prefix=SEGMENT_PREFIX):
+            self.stats["objects"] += 1
+            name = segment_parent(obj.name)
+            while parent is not None and parent < name:
+                parent = next(parents, None)
+            if parent != name:
+                self._orphaned_object(obj)
+
+    def _orphaned_object(self, obj):
+        if obj.last_modified > self.cutoff:
+            return
+        self.stats["orphaned_objects"] += 1
+        self.echo(f"orphaned object: {obj.name}")
+        if self.repair:
+            self.orphan_batch.append(obj.name)
+            if len(self.orphan_batch) >= self.batch_size:
+                self._flush_orphans()
+
+    def _dangling_row(self, row):
+        if row.created_at and row.created_at > self.cutoff:
+            return
+        self.stats["dangling_rows"] += 1
+        self.echo(f"dangling row: {row.id} ({row.storage_path})")
+        if self.repair:
+            self.dangling_rows.append(row)
+
+    def _flush_orphans(self):
+        if not self.orphan_batch:
+            return
+        for name, error in storage.delete_many(self.orphan_batch).items():
+            if error is not None:
+                self.echo(f"error deleting {name}: {error}")
+        self.orphan_batch = []
+
+    def _delete_dangling_rows(self):
+        # Done after the merge so the streaming query isn't disturbed by commits;
+        # dangling rows are rare, so holding them is cheap.
+        for start in range(0, len(self.dangling_rows), self.batch_size):
+            batch = self.dangling_rows[start:start + self.batch_size]
+            ids = [row.id for row in batch]
+            File.query.filter(File.id.in_(ids)).delete(synchronize_session=False)
+            by_owner = defaultdict(list)
+            for row in batch:
+                by_owner[row.owner_user_id].append(row)
+            for owner_user_id, rows in by_owner.items():
+                adjust_usage_for_files(owner_user_id, rows, -1)
+            db.session.commit()
+            file_cache.invalidate_many(ids)
+
+
+def delete_expired_uploads(batch_size=1000, echo=print):
+    """
+    Deletes upload sessions past their expiry together with everything they
+    stored: their segments and, for direct uploads, the unconfirmed blob.
+    Returns the number of sessions deleted.
+    """
+    now = datetime.utcnow()
+    deleted = 0
+    while True:
+        batch = UploadSession.query.filter(UploadSession.expires_at <= now) \
+            .order_by(UploadSession.expires_at).limit(batch_size).all()
+        if not batch:
+            return deleted
+        names = []
+        for upload in batch:
+            echo(f"expired upload: {upload.id} ({upload.storage_path})")
+            names.append(upload.storage_path)
+            names.extend(obj.name for obj in storage.list_objects(prefix=f"{SEGMENT_PREFIX}{upload.storage_path}/"))
+        for name, error in storage.delete_many(names).items():
+            if error is not None:
+                echo(f"error deleting {name}: {error}")
+        # Objects that failed to delete are orphans now and left to reconcile-storage
+        ids = [upload.id for upload in batch]
+        UploadSegment.query.filter(UploadSegment.session_id.in_(ids)).delete(synchronize_session=False)
+        UploadSession.query.filter(UploadSession.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(batch)
+
+
+@click.command('clean-uploads')
+@click.option('--batch-size', default=1000, show_default=True, help='Sessions deleted per batch.')
+@with_appcontext
+def clean_uploads_command(batch_size):
+    """Delete expired upload sessions and the segments and blobs they stored."""
+    deleted = delete_expired_uploads(batch_size, echo=click.echo)
+    click.echo(f"Deleted {deleted} expired upload sessions.")
+
+
+@click.command('reconcile-storage')
+@click.option('--repair', is_flag=True, help='Delete orphaned objects and dangling rows instead of only reporting them.')
+@click.option('--grace-minutes', default=60, show_default=True, help='Ignore objects and rows newer than this.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per database fetch and objects per delete batch.')
+@with_appcontext
+def reconcile_storage_command(repair, grace_minutes, batch_size):
+    """Report (or repair) blobs without a files row and rows without a blob."""
+    stats = Reconciler(timedelta(minutes=grace_minutes), repair, batch_size, echo=click.echo).run()
+    click.echo(
+        f"Checked {stats['objects']} objects and {stats['rows']} rows: "
+        f"{stats['orphaned_objects']} orphaned objects, {stats['dangling_rows']} dangling rows"
+        f"{' (repaired)' if repair else ''}."
+    )
@@ -0,0 +1,90 @@
+import redis
+from redis.backoff import ExponentialBackoff
+from redis.cluster import RedisCluster
+from redis.connection import parse_url
+from redis.exceptions import ConnectionError, TimeoutError
+from redis.retry import Retry
+from redis.sentinel import Sentinel
+
+
+def redis_options(config):
+    """Keyword arguments for FlaskRedis.init_app, so RedisProvider gets the REDIS_* settings."""
+    return {
+        'mode': config.get('REDIS_MODE', 'standalone'),
+        'sentinels': config.get('REDIS_SENTINELS'),
+        'sentinel_service': config.get('REDIS_SENTINEL_SERVICE', 'mymaster'),
+        'max_connections': config.get('REDIS_MAX_CONNECTIONS', 50),
+        'socket_timeout': config.get('REDIS_SOCKET_TIMEOUT', 2),
+        'retries': config.get('REDIS_RETRIES', 3),
+    }
+
+
+def parse_sentinels(sentinels):
+    """'host:26379,host2:26379' -> [('host', 26379), ('host2', 26379)]"""
+    hosts = []
+    for address in (sentinels or '').split(','):
+        host, _, port = address.strip().rpartition(':')
+        if host:
+            hosts.append((host, int(port)))
+    return hosts
+
+
+class RedisProvider:
+    """
+    FlaskRedis provider (FlaskRedis.from_custom_provider) that builds the
+    client REDIS_MODE asks for:
+
+    - 'standalone': a single server at REDIS_URL.
+    - 'sentinel': the current master of REDIS_SENTINEL_SERVICE, found through
+      the REDIS_SENTINELS. After a failover, connections are re-pointed at
+      the new master.
+    - 'cluster': a Redis Cluster, discovered from the node at REDIS_URL.
+      Commands go straight to the node owning the key's slot.
+
+    Every mode retries commands that hit a dropped connection or a timeout,
+    backing off exponentially. A failover or resharding therefore shows up
+    as a slower request rather than a failed one.
+    """
+
+    @staticmethod
+    def from_url(url, mode='standalone', sentinels=None, sentinel_service='mymaster',
+                 max_connections=50, socket_timeout=2, retries=3):
+        retry = Retry(ExponentialBackoff(cap=1, base=0.05), retries)
+
+        if mode == 'cluster':
+            # The cluster client retries (and follows MOVED/ASK) itself
+            return RedisCluster.from_url(
+                url,
+                max_connections=max_connections,
+                socket_timeout=socket_timeout,
+                socket_connect_timeout=socket_timeout,
+                retry=retry
+            )
+
+        connection_options = {
+            'socket_timeout': socket_timeout,
+            'socket_connect_timeout': socket_timeout,
+            'retry': retry,
+            'retry_on_error': [ConnectionError, TimeoutError],
+            'health_check_interval': 30,
+        }
+
+        if mode == 'sentinel':
+            hosts = parse_sentinels(sentinels)
+            if not hosts:
+                raise ValueError("REDIS_MODE is 'sentinel' but REDIS_SENTINELS is not set")
+            # REDIS_URL, if set, only supplies the master's db and credentials
+            url_options = parse_url(url) if url else {}
+            sentinel = Sentinel(hosts, socket_timeout=socket_timeout)
+            return sentinel.master_for(
+                sentinel_service,
+                max_connections=max_connections,
+                db=url_options.get('db', 0),
+                username=url_options.get('username'),
+                password=url_options.get('password'),
+                **connection_options
+            )
+
+        if mode != 'standalone':
+            raise ValueError(f"Unknown REDIS_MODE: {mode}")
+        return redis.Redis.from_url(url, max_connections=max_connections, **connection_options)
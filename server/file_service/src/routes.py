@@ -1,37 +1,164 @@
-from flask import request, jsonify, Blueprint, send_from_directory
+from flask import request, jsonify, Blueprint, Response
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from src import db
-from src.models import File
+from src import db, storage, file_cache, rate_limiter
+from src.models import File, UploadSession, UploadSegment
+from src.storage import ObjectNotFound, RangeNotSatisfiable
+from src.integrity import HashingReader, object_sha256
+from src.db_routing import read_only, read_or_primary
+from src.usage import adjust_usage, adjust_usage_for_files, get_usage, total_bytes, pending_upload_bytes
 import uuid
-import os
-import swiftclient
+import hmac
+from functools import wraps
+import json
+import base64
+import binascii
+from datetime import datetime
 from src.config import Config
+from werkzeug.http import parse_date, http_date, quote_etag, is_resource_modified
 
 file_bp = Blueprint('files', __name__, url_prefix='/files')
 
-SWIFT_AUTH_URL = Config.SWIFT_AUTH_URL
-SWIFT_USER = Config.SWIFT_USER  
-SWIFT_KEY = Config.SWIFT_KEY
-SWIFT_CONTAINER = Config.SWIFT_CONTAINER
-
-def get_swift_conn():
-    """Helper to get a Swift connection."""
-    return swiftclient.Connection(
-        authurl=SWIFT_AUTH_URL,
-        user=SWIFT_USER,
-        key=SWIFT_KEY,
-        auth_version="1"
-    )
-    
-# # Configure a simple upload folder
-# UPLOAD_FOLDER = os.path.abspath('uploads')
-# os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+UPLOAD_MAX_SEGMENTS = Config.UPLOAD_MAX_SEGMENTS
+
+MY_FILES_PAGE_SIZE = Config.MY_FILES_PAGE_SIZE
+MY_FILES_MAX_PAGE_SIZE = Config.MY_FILES_MAX_PAGE_SIZE
+BULK_MAX_FILES = Config.BULK_MAX_FILES
+DOWNLOAD_CACHE_MAX_AGE = Config.DOWNLOAD_CACHE_MAX_AGE
+USER_QUOTA_BYTES = Config.USER_QUOTA_BYTES
+SWIFT_TEMPURL_TTL = Config.SWIFT_TEMPURL_TTL
+INTERNAL_API_TOKEN = Config.INTERNAL_API_TOKEN
+
+FILE_STATUSES = ['active', 'trashed', 'archived']
+
+def encode_cursor(file):
+    """Opaque pagination cursor pointing just past the given file."""
+    raw = json.dumps([file.created_at.isoformat(), file.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def get_bulk_file_ids(data):
+    """Reads and de-duplicates the file_ids list of a bulk request; returns None if invalid."""
+    file_ids = data.get('file_ids')
+    if not isinstance(file_ids, list) or not file_ids or len(file_ids) > BULK_MAX_FILES:
+        return None
+    if not all(isinstance(file_id, str) for file_id in file_ids):
+        return None
+    return list(dict.fromkeys(file_ids))
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for anything malformed."""
+    try:
+        created_at, file_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), str(file_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+# Columns the public endpoints need; cached as a plain dict
+PUBLIC_META_FIELDS = ('id', 'filename', 'content_type', 'size', 'storage_path', 'etag', 'sha256')
+
+def load_file_meta(file_id):
+    """Loads the public metadata of a file from the database, or None if it doesn't exist."""
+    file_record = read_or_primary(lambda: File.query.filter_by(id=file_id).first())
+    if not file_record:
+        return None
+    file_meta = {field: getattr(file_record, field) for field in PUBLIC_META_FIELDS}
+    file_meta['created_at'] = file_record.created_at.isoformat() if file_record.created_at else None
+    return file_meta
+
+def get_file_meta(file_id):
+    """Public metadata of a file, served from the metadata cache when possible."""
+    return file_cache.get(file_id, load_file_meta)
+
+def download_cache_headers(file_meta, etag):
+    """
+    Validators and caching headers for a download. Blobs never change after
+    upload, and they are ciphertext, so any cache may keep them for long.
+    """
+    headers = {"Cache-Control": f"public, max-age={DOWNLOAD_CACHE_MAX_AGE}, immutable, no-transform"}
+    if file_meta.get('sha256'):
+        # RFC 9530: digest of the whole blob, also on partial responses
+        digest = base64.b64encode(binascii.unhexlify(file_meta['sha256'])).decode()
+        headers["Repr-Digest"] = f"sha-256=:{digest}:"
+    if etag:
+        headers["ETag"] = quote_etag(etag)
+    if file_meta.get('created_at'):
+        headers["Last-Modified"] = http_date(datetime.fromisoformat(file_meta['created_at']))
+    return headers
+
+def if_range_matches(if_range, etag, last_modified):
+    """Checks an If-Range validator against the file's ETag or Last-Modified (strong comparison)."""
+    if if_range.etag:
+        return etag is not None and if_range.etag == etag
+    if if_range.date and last_modified:
+        return if_range.date == parse_date(http_date(last_modified))
+    return False
+
+def exceeds_quota(user_id, incoming_bytes, upload_id=None):
+    """
+    True if storing incoming_bytes more would take the user over USER_QUOTA_BYTES (0 means no quota).
+    Space reserved by the user's other unfinished uploads counts as used; upload_id is
+    the session the bytes belong to, if any, so it isn't counted twice.
+    """
+    if not USER_QUOTA_BYTES:
+        return False
+    used = total_bytes(user_id) + pending_upload_bytes(user_id, upload_id)
+    return used + incoming_bytes > USER_QUOTA_BYTES
+
+def parse_count(value):
+    """A size or count sent by the client (int or digit string) as an int, or None if it isn't a non-negative one."""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        return None
+    return number if number >= 0 else None
+
+def find_upload(upload_id, user_id):
+    """The user's upload session, unless it doesn't exist or has expired."""
+    return UploadSession.query.filter_by(id=upload_id, owner_user_id=user_id) \
+        .filter(UploadSession.expires_at > datetime.utcnow()).first()
+
+def release_db_connection():
+    """
+    Ends the request's (read-only) transaction before a long transfer, so the
+    pooled database connection isn't held while bytes trickle in from a slow
+    client. Objects already loaded stay usable.
+    """
+    db.session.close()
+
+def internal_only(view):
+    """Restricts a view to other services, which send the shared INTERNAL_API_TOKEN."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = request.headers.get('X-Internal-Token', '')
+        if not INTERNAL_API_TOKEN or not hmac.compare_digest(token, INTERNAL_API_TOKEN):
+            return jsonify({"msg": "Forbidden"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+def stream_body(body):
+    """
+    Yields an object body from storage chunk by chunk.
+    The body is always closed at the end, including when the client disconnects
+    mid-download and the WSGI server closes this generator.
+    """
+    try:
+        for chunk in body:
+            yield chunk
+    finally:
+        body.close()
 
 @file_bp.route('/upload', methods=['POST'])
 @jwt_required()
 def upload_file():
     current_user_id = int(get_jwt_identity())
 
+    # Checked before request.files is touched, so an over-quota body is never read.
+    # The multipart body is a little larger than the file, so this errs on the strict side.
+    if exceeds_quota(current_user_id, request.content_length or 0):
+        return jsonify({"msg": "Storage quota exceeded"}), 413
+    release_db_connection()
+
     if 'file' not in request.files:
         return jsonify({"msg": "No file part"}), 400
     
@@ -43,35 +170,40 @@ def upload_file():
     if not all([original_filename, content_type, file_size]):
         return jsonify({"msg": "Missing metadata"}), 400
 
+    file_size = parse_count(file_size)
+    if file_size is None:
+        return jsonify({"msg": "Invalid size"}), 400
+
     # Generate a unique path to store the encrypted file
     storage_filename = f"{uuid.uuid4()}.enc"
-    # storage_path = os.path.join(UPLOAD_FOLDER, storage_filename)
-    
-    # Save the encrypted file blob to the filesystem
-    # encrypted_file.save(storage_path)
 
-    conn = get_swift_conn()
+    # Count and hash the ciphertext on its way to storage
+    reader = HashingReader(encrypted_file.stream)
     try:
-        conn.put_container(SWIFT_CONTAINER)
-        conn.put_object(
-            SWIFT_CONTAINER,
-            storage_filename,
-            contents=encrypted_file.stream,
-            content_type=content_type
-        )
+        etag = storage.put(storage_filename, reader, content_type=content_type)
     except Exception as e:
-        return jsonify({"msg": f"Swift upload failed: {e}"}), 500
+        return jsonify({"msg": f"Storage upload failed: {e}"}), 500
+
+    if reader.bytes_read != file_size:
+        try:
+            storage.delete(storage_filename)
+        except Exception as e:
+            print(f"Error deleting from storage: {e}")
+        return jsonify({"msg": "Uploaded file does not match the declared size"}), 400
     
     # Create the metadata record for the database
     new_file = File(
         owner_user_id=current_user_id,
         filename=original_filename,
         content_type=content_type,
-        size=int(file_size),
-        storage_path=storage_filename
+        size=file_size,
+        storage_path=storage_filename,
+        etag=etag.strip('"') if etag else None,
+        sha256=reader.hexdigest()
     )
 
     db.session.add(new_file)
+    adjust_usage(current_user_id, new_file.status or 'active', new_file.size, 1)
     db.session.commit()
 
     return jsonify({
@@ -79,15 +211,308 @@ def upload_file():
         "file": new_file.to_dict()
     }), 201
     
+@file_bp.route('/uploads', methods=['POST'])
+@jwt_required()
+def create_upload_session():
+    """
+    Starts a resumable upload. The client then PUTs numbered segments
+    (in any order, possibly in parallel) and calls complete.
+    """
+    current_user_id = int(get_jwt_identity())
+    data = request.get_json() or {}
+    original_filename = data.get('filename')
+    content_type = data.get('contentType')
+    file_size = data.get('size')
+    segment_count = data.get('segmentCount')
+
+    if not all([original_filename, content_type, file_size, segment_count]):
+        return jsonify({"msg": "Missing metadata"}), 400
+
+    file_size = parse_count(file_size)
+    if file_size is None:
+        return jsonify({"msg": "Invalid size"}), 400
+
+    segment_count = parse_count(segment_count)
+    if segment_count is None or not 1 <= segment_count <= UPLOAD_MAX_SEGMENTS:
+        return jsonify({"msg": f"segmentCount must be between 1 and {UPLOAD_MAX_SEGMENTS}"}), 400
+
+    if exceeds_quota(current_user_id, file_size):
+        return jsonify({"msg": "Storage quota exceeded"}), 413
+
+    upload = UploadSession(
+        owner_user_id=current_user_id,
+        filename=original_filename,
+        content_type=content_type,
+        size=file_size,
+        segment_count=segment_count,
+        storage_path=f"{uuid.uuid4()}.enc"
+    )
+    db.session.add(upload)
+    db.session.commit()
+
+    return jsonify(upload.to_dict()), 201
+
+@file_bp.route('/uploads/<string:upload_id>', methods=['GET'])
+@jwt_required()
+def get_upload_session(upload_id):
+    """Reports which segments have arrived so a client can resume."""
+    current_user_id = int(get_jwt_identity())
+
+    upload = find_upload(upload_id, current_user_id)
+    if not upload:
+        return jsonify({"msg": "Upload not found or access denied"}), 404
+
+    return jsonify(upload.to_dict()), 200
+
+@file_bp.route('/uploads/<string:upload_id>/segments/<int:number>', methods=['PUT'])
+@jwt_required()
+def upload_segment(upload_id, number):
+    """
+    Stores one segment (raw encrypted bytes in the request body).
+    Re-sending a segment simply overwrites it, so retries are safe.
+    """
+    current_user_id = int(get_jwt_identity())
+
+    upload = find_upload(upload_id, current_user_id)
+    if not upload:
+        return jsonify({"msg": "Upload not found or access denied"}), 404
+
+    if not 1 <= number <= upload.segment_count:
+        return jsonify({"msg": "Invalid segment number"}), 400
+
+    if not request.content_length:
+        return jsonify({"msg": "Empty segment"}), 400
+
+    release_db_connection()
+
+    try:
+        etag = storage.put(
+            upload.segment_path(number),
+            request.stream,
+            content_length=request.content_length
+        )
+    except Exception as e:
+        return jsonify({"msg": f"Storage upload failed: {e}"}), 500
+
+    db.session.merge(UploadSegment(
+        session_id=upload.id,
+        number=number,
+        size=request.content_length,
+        etag=etag
+    ))
+    db.session.commit()
+
+    return jsonify({"number": number, "size": request.content_length, "etag": etag}), 200
+
+@file_bp.route('/uploads/<string:upload_id>/complete', methods=['POST'])
+@jwt_required()
+def complete_upload(upload_id):
+    """Joins all segments into the final object and creates the File record."""
+    current_user_id = int(get_jwt_identity())
+
+    upload = find_upload(upload_id, current_user_id)
+    if not upload:
+        return jsonify({"msg": "Upload not found or access denied"}), 404
+
+    segments = upload.segments.order_by(UploadSegment.number).all()
+    missing = sorted(set(range(1, upload.segment_count + 1)) - {s.number for s in segments})
+    if missing:
+        return jsonify({"msg": "Upload is missing segments", "missing_segments": missing}), 409
+
+    if sum(s.size for s in segments) != upload.size:
+        return jsonify({"msg": "Uploaded segments do not add up to the declared size"}), 409
+
+    # Checked again here: other uploads may have finished since this one started
+    if exceeds_quota(current_user_id, upload.size, upload.id):
+        return jsonify({"msg": "Storage quota exceeded"}), 413
+
+    try:
+        etag = storage.put_manifest(
+            upload.storage_path,
+            [(upload.segment_path(s.number), s.etag, s.size) for s in segments],
+            content_type=upload.content_type
+        )
+    except Exception as e:
+        return jsonify({"msg": f"Storage upload failed: {e}"}), 500
+
+    new_file = File(
+        owner_user_id=current_user_id,
+        filename=upload.filename,
+        content_type=upload.content_type,
+        size=upload.size,
+        storage_path=upload.storage_path,
+        etag=etag.strip('"') if etag else None
+    )
+    db.session.add(new_file)
+    adjust_usage(current_user_id, new_file.status or 'active', new_file.size, 1)
+    db.session.delete(upload)
+    db.session.commit()
+
+    return jsonify({
+        "msg": "File uploaded successfully",
+        "file": new_file.to_dict()
+    }), 201
+
+@file_bp.route('/direct-uploads', methods=['POST'])
+@jwt_required()
+def create_direct_upload():
+    """
+    Starts an upload that goes straight to object storage: returns a
+    short-lived signed URL the client PUTs the encrypted blob to, then the
+    client calls confirm. The session records what is expected until then.
+    """
+    current_user_id = int(get_jwt_identity())
+    data = request.get_json() or {}
+    original_filename = data.get('filename')
+    content_type = data.get('contentType')
+    file_size = data.get('size')
+
+    if not all([original_filename, content_type, file_size]):
+        return jsonify({"msg": "Missing metadata"}), 400
+
+    file_size = parse_count(file_size)
+    if file_size is None:
+        return jsonify({"msg": "Invalid size"}), 400
+
+    if exceeds_quota(current_user_id, file_size):
+        return jsonify({"msg": "Storage quota exceeded"}), 413
+
+    storage_path = f"{uuid.uuid4()}.enc"
+    upload_url = storage.temp_url(storage_path, 'PUT', SWIFT_TEMPURL_TTL)
+    if upload_url is None:
+        return jsonify({"msg": "Direct uploads are not supported by this storage backend"}), 501
+
+    upload = UploadSession(
+        owner_user_id=current_user_id,
+        filename=original_filename,
+        content_type=content_type,
+        size=file_size,
+        segment_count=1,
+        storage_path=storage_path
+    )
+    db.session.add(upload)
+    db.session.commit()
+
+    return jsonify({
+        "upload": upload.to_dict(),
+        "upload_url": upload_url,
+        "expires_in": SWIFT_TEMPURL_TTL
+    }), 201
+
+@file_bp.route('/uploads/<string:upload_id>/confirm', methods=['POST'])
+@jwt_required()
+def confirm_direct_upload(upload_id):
+    """
+    Creates the File record for a direct upload once its object is in storage.
+    The object is read back once to compute its digest, since it never passed
+    through the service on the way in.
+    """
+    current_user_id = int(get_jwt_identity())
+
+    upload = find_upload(upload_id, current_user_id)
+    if not upload:
+        return jsonify({"msg": "Upload not found or access denied"}), 404
+
+    try:
+        headers = storage.head(upload.storage_path)
+    except ObjectNotFound:
+        return jsonify({"msg": "The file has not been uploaded yet"}), 409
+    except Exception as e:
+        return jsonify({"msg": f"Storage check failed: {e}"}), 500
+
+    if int(headers.get('content-length', -1)) != upload.size:
+        discard_direct_upload(upload)
+        return jsonify({"msg": "Uploaded file does not match the declared size"}), 400
+
+    # Checked again here: other uploads may have finished since this one started
+    if exceeds_quota(current_user_id, upload.size, upload.id):
+        discard_direct_upload(upload)
+        return jsonify({"msg": "Storage quota exceeded"}), 413
+
+    release_db_connection()
+
+    try:
+        sha256, size = object_sha256(upload.storage_path)
+    except Exception as e:
+        return jsonify({"msg": f"Storage check failed: {e}"}), 500
+
+    if size != upload.size:
+        discard_direct_upload(upload)
+        return jsonify({"msg": "Uploaded file does not match the declared size"}), 400
+
+    etag = headers.get('etag')
+    new_file = File(
+        owner_user_id=current_user_id,
+        filename=upload.filename,
+        content_type=upload.content_type,
+        size=upload.size,
+        storage_path=upload.storage_path,
+        etag=etag.strip('"') if etag else None,
+        sha256=sha256
+    )
+    db.session.add(new_file)
+    adjust_usage(current_user_id, new_file.status or 'active', new_file.size, 1)
+    UploadSession.query.filter_by(id=upload.id).delete()
+    db.session.commit()
+
+    return jsonify({
+        "msg": "File uploaded successfully",
+        "file": new_file.to_dict()
+    }), 201
+
+def discard_direct_upload(upload):
+    """Deletes a rejected direct upload: its object and its session."""
+    try:
+        storage.delete(upload.storage_path)
+    except ObjectNotFound:
+        pass
+    except Exception as e:
+        # Left for reconcile-storage, which treats it as an orphan once the session is gone
+        print(f"Error deleting from storage: {e}")
+    UploadSession.query.filter_by(id=upload.id).delete()
+    db.session.commit()
+
 @file_bp.route('/my-files', methods=['GET'])
 @jwt_required()
+@read_only
 def get_my_files():
-    """Fetches all files for the authenticated user."""
+    """
+    Fetches the authenticated user's files, newest first, one page at a time.
+    Optional query parameters: status, limit and cursor. When more files
+    remain, the cursor for the next page is returned in the X-Next-Cursor header.
+    """
     current_user_id = int(get_jwt_identity())
-    
-    files = File.query.filter_by(owner_user_id=current_user_id).order_by(File.created_at.desc()).all()
-    
-    return jsonify([file.to_dict() for file in files]), 200
+
+    filters = {"owner_user_id": current_user_id}
+    status = request.args.get('status')
+    if status:
+        if status not in FILE_STATUSES:
+            return jsonify({"msg": "Invalid status"}), 400
+        filters["status"] = status
+
+    limit = request.args.get('limit', MY_FILES_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MY_FILES_MAX_PAGE_SIZE))
+
+    query = File.query.filter_by(**filters)
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            created_at, last_id = decode_cursor(cursor)
+        except ValueError:
+            return jsonify({"msg": "Invalid cursor"}), 400
+        # Keyset pagination: continue strictly after the last row of the previous page
+        query = query.filter(db.tuple_(File.created_at, File.id) < (created_at, last_id))
+
+    # Fetch one extra row to learn whether there is a next page
+    files = query.order_by(File.created_at.desc(), File.id.desc()).limit(limit + 1).all()
+
+    headers = {}
+    if len(files) > limit:
+        files = files[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(files[-1])
+
+    return jsonify([file.to_dict() for file in files]), 200, headers
 
 @file_bp.route('/file/<string:file_id>/status', methods=['PUT'])
 @jwt_required()
@@ -95,17 +520,21 @@ def update_file_status(file_id):
     """Updates the status of a file (e.g., to 'trashed', 'archived', 'active')."""
     current_user_id = int(get_jwt_identity())
     
-    file_to_update = File.query.filter_by(id=file_id, owner_user_id=current_user_id).first()
+    file_to_update = File.query.filter_by(id=file_id, owner_user_id=current_user_id).with_for_update().first()
     
     if not file_to_update:
         return jsonify({"msg": "File not found or access denied"}), 404
         
     new_status = request.json.get('status')
-    if new_status not in ['active', 'trashed', 'archived']:
+    if new_status not in FILE_STATUSES:
         return jsonify({"msg": "Invalid status"}), 400
         
-    file_to_update.status = new_status
+    if file_to_update.status != new_status:
+        adjust_usage(current_user_id, file_to_update.status, -file_to_update.size, -1)
+        adjust_usage(current_user_id, new_status, file_to_update.size, 1)
+        file_to_update.status = new_status
     db.session.commit()
+    file_cache.invalidate(file_id)
     
     return jsonify(file_to_update.to_dict()), 200
 
@@ -115,7 +544,9 @@ def delete_file_permanently(file_id):
     """Permanently deletes a file record and its stored blob."""
     current_user_id = int(get_jwt_identity())
     
-    file_to_delete = File.query.filter_by(id=file_id, owner_user_id=current_user_id).first()
+    # Locked until the commit, so a concurrent restore can't slip in between
+    # the status check and the delete
+    file_to_delete = File.query.filter_by(id=file_id, owner_user_id=current_user_id).with_for_update().first()
 
     if not file_to_delete:
         return jsonify({"msg": "File not found or access denied"}), 404
@@ -124,68 +555,261 @@ def delete_file_permanently(file_id):
     if file_to_delete.status != 'trashed':
         return jsonify({"msg": "File must be in the trash to be deleted permanently"}), 403
 
-    conn = get_swift_conn()
     try:
-        conn.delete_object(SWIFT_CONTAINER, file_to_delete.storage_path)
+        storage.delete(file_to_delete.storage_path)
     except Exception as e:
-        print(f"Error deleting from Swift: {e}")
-        
-    # Delete the physical file from storage
-    # try:
-    #     if os.path.exists(file_to_delete.storage_path):
-    #         os.remove(file_to_delete.storage_path)
-    # except Exception as e:
-    #     # Log the error but proceed to delete the DB record
-    #     print(f"Error deleting physical file {file_to_delete.storage_path}: {e}")
+        # Log the error but proceed to delete the DB record
+        print(f"Error deleting from storage: {e}")
 
     # Delete the record from the database
     db.session.delete(file_to_delete)
+    adjust_usage(current_user_id, file_to_delete.status, -file_to_delete.size, -1)
     db.session.commit()
+    file_cache.invalidate(file_id)
 
     return jsonify({"msg": "File permanently deleted"}), 200
 
+@file_bp.route('/bulk/status', methods=['PUT'])
+@jwt_required()
+def bulk_update_file_status():
+    """
+    Changes the status of many files at once.
+    Ownership is checked in one query and the update is a single statement.
+    """
+    current_user_id = int(get_jwt_identity())
+    data = request.get_json() or {}
+
+    file_ids = get_bulk_file_ids(data)
+    if file_ids is None:
+        return jsonify({"msg": f"file_ids must be a list of 1 to {BULK_MAX_FILES} file IDs"}), 400
+
+    new_status = data.get('status')
+    if new_status not in FILE_STATUSES:
+        return jsonify({"msg": "Invalid status"}), 400
+
+    # The rows stay locked until the commit, so a concurrent status change
+    # waits for this one and the usage counters move by what really changed
+    owned = File.query.with_entities(File.id, File.status, File.size).filter(
+        File.id.in_(file_ids), File.owner_user_id == current_user_id
+    ).with_for_update().all()
+    owned_ids = {row.id for row in owned}
+    changed = [row for row in owned if row.status != new_status]
+
+    if changed:
+        File.query.filter(File.id.in_([row.id for row in changed])).update(
+            {File.status: new_status}, synchronize_session=False
+        )
+        adjust_usage_for_files(current_user_id, changed, -1)
+        adjust_usage(current_user_id, new_status, sum(row.size for row in changed), len(changed))
+        db.session.commit()
+        file_cache.invalidate_many([row.id for row in changed])
+
+    results = [
+        {"id": file_id, "result": "updated" if file_id in owned_ids else "not_found"}
+        for file_id in file_ids
+    ]
+    return jsonify({"results": results}), 200
+
+@file_bp.route('/bulk/delete', methods=['POST'])
+@jwt_required()
+def bulk_delete_files_permanently():
+    """
+    Permanently deletes many trashed files and their blobs.
+    Blobs are deleted in parallel; a record is only removed once its blob is
+    gone, so failures can simply be retried.
+    """
+    current_user_id = int(get_jwt_identity())
+    data = request.get_json() or {}
+
+    file_ids = get_bulk_file_ids(data)
+    if file_ids is None:
+        return jsonify({"msg": f"file_ids must be a list of 1 to {BULK_MAX_FILES} file IDs"}), 400
+
+    # Locked until the commit, like the status changes, so usage is adjusted
+    # by the status the rows really have
+    owned = {row.id: row for row in File.query.with_entities(File.id, File.status, File.size, File.storage_path).filter(
+        File.id.in_(file_ids), File.owner_user_id == current_user_id
+    ).with_for_update()}
+    trashed = [row for row in owned.values() if row.status == 'trashed']
+
+    errors = storage.delete_many([row.storage_path for row in trashed])
+    deleted_ids = [row.id for row in trashed if errors[row.storage_path] is None]
+    for row in trashed:
+        if errors[row.storage_path] is not None:
+            print(f"Error deleting from storage: {errors[row.storage_path]}")
+
+    if deleted_ids:
+        File.query.filter(File.id.in_(deleted_ids), File.status == 'trashed').delete(synchronize_session=False)
+        adjust_usage_for_files(current_user_id, [owned[file_id] for file_id in deleted_ids], -1)
+        db.session.commit()
+        file_cache.invalidate_many(deleted_ids)
+
+    deleted = set(deleted_ids)
+    results = []
+    for file_id in file_ids:
+        if file_id not in owned:
+            result = "not_found"
+        elif owned[file_id].status != 'trashed':
+            result = "not_trashed"
+        elif file_id in deleted:
+            result = "deleted"
+        else:
+            result = "storage_error"
+        results.append({"id": file_id, "result": result})
+
+    return jsonify({"results": results}), 200
+
+@file_bp.route('/usage', methods=['GET'])
+@jwt_required()
+@read_only
+def get_my_usage():
+    """Bytes and file counts the authenticated user stores, per status, and their quota."""
+    current_user_id = int(get_jwt_identity())
+
+    by_status = get_usage(current_user_id)
+    for status in FILE_STATUSES:
+        by_status.setdefault(status, {"bytes": 0, "files": 0})
+
+    return jsonify({
+        "quota": USER_QUOTA_BYTES or None,
+        "total": {
+            "bytes": sum(usage["bytes"] for usage in by_status.values()),
+            "files": sum(usage["files"] for usage in by_status.values())
+        },
+        "by_status": by_status
+    }), 200
+
 @file_bp.route('/public-meta/<string:file_id>', methods=['GET'])
+@rate_limiter.limit('public-meta')
+@read_only
 def get_public_meta(file_id):
     """
     Public endpoint to get basic, non-sensitive file metadata for the download page.
     """
-    file_record = File.query.filter_by(id=file_id).first()
-    if not file_record:
+    file_meta = get_file_meta(file_id)
+    if not file_meta:
         return jsonify({"msg": "File not found"}), 404
     
     return jsonify({
-        "filename": file_record.filename,
-        "size": file_record.size
+        "filename": file_meta['filename'],
+        "size": file_meta['size']
+    }), 200
+
+@file_bp.route('/download-url/<string:file_id>', methods=['GET'])
+@rate_limiter.limit('download')
+@read_only
+def get_download_url(file_id):
+    """
+    Public endpoint returning a short-lived signed URL to download the
+    encrypted blob straight from object storage, bypassing this service.
+    """
+    file_meta = get_file_meta(file_id)
+    if not file_meta:
+        return jsonify({"msg": "File not found"}), 404
+
+    url = storage.temp_url(file_meta['storage_path'], 'GET', SWIFT_TEMPURL_TTL, filename=file_meta['filename'])
+    if url is None:
+        return jsonify({"msg": "Direct downloads are not supported by this storage backend"}), 501
+
+    return jsonify({"url": url, "expires_in": SWIFT_TEMPURL_TTL}), 200
+
+@file_bp.route('/internal/share-meta/<string:file_id>', methods=['GET'])
+@internal_only
+@read_only
+def get_share_meta(file_id):
+    """
+    Internal endpoint for access_service: metadata of a shared file plus a
+    signed download URL when the backend supports one, so a share link can
+    be resolved in a single request from the browser.
+    """
+    file_meta = get_file_meta(file_id)
+    if not file_meta:
+        return jsonify({"msg": "File not found"}), 404
+
+    return jsonify({
+        "id": file_meta['id'],
+        "filename": file_meta['filename'],
+        "size": file_meta['size'],
+        "content_type": file_meta['content_type'],
+        "sha256": file_meta.get('sha256'),
+        "download_url": storage.temp_url(
+            file_meta['storage_path'], 'GET', SWIFT_TEMPURL_TTL, filename=file_meta['filename']
+        )
     }), 200
 
 @file_bp.route('/download/<string:file_id>', methods=['GET'])
+@rate_limiter.limit('download')
+@read_only
 def download_file(file_id):
     """
     Public endpoint to download the raw, encrypted file blob.
+    Supports single byte ranges (Range / If-Range) so downloads can be
+    resumed or split into parallel requests; the range is passed through
+    to the storage backend so only the requested bytes leave object storage.
+    Blobs are immutable, so responses carry a strong ETag and long-lived
+    caching headers, and revalidations are answered with 304.
     """
-    file_record = File.query.filter_by(id=file_id).first()
-    if not file_record:
+    file_meta = get_file_meta(file_id)
+    if not file_meta:
         return jsonify({"msg": "File not found"}), 404
-    
-    conn = get_swift_conn()
+
+    etag = file_meta.get('etag')
+    last_modified = datetime.fromisoformat(file_meta['created_at']) if file_meta.get('created_at') else None
+
+    # The client's copy is current: answer without touching storage at all
+    if (etag or last_modified) and not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return Response(status=304, headers=download_cache_headers(file_meta, etag))
+
+    # Only a single range is passed on: the Content-Range of the one part we
+    # stream can't describe several, so multi-range requests get the whole object
+    range_header = request.headers.get('Range') if request.range and len(request.range.ranges) == 1 else None
+    # If-Range: only honour the range if the client's copy is still current,
+    # otherwise send the whole object.
+    if range_header and request.if_range and not if_range_matches(request.if_range, etag, last_modified):
+        range_header = None
+
     try:
-        headers, file_bytes = conn.get_object(SWIFT_CONTAINER, file_record.storage_path)
+        # Backends that can hand the file to the kernel or nginx do so here
+        response = storage.serve(file_meta['storage_path'], file_meta['content_type'], file_meta['filename'], etag=etag)
+        if response is not None:
+            extra_headers = download_cache_headers(file_meta, etag)
+            for name in ('Cache-Control', 'Repr-Digest'):
+                if name in extra_headers:
+                    response.headers[name] = extra_headers[name]
+            return response
+
+        status, headers, body = storage.get(file_meta['storage_path'], range_header)
+    except ObjectNotFound:
+        return jsonify({"msg": "File content not found"}), 404
+    except RangeNotSatisfiable:
+        return jsonify({"msg": "Requested range not satisfiable"}), 416
     except Exception as e:
-        return jsonify({"msg": f"Swift download failed: {e}"}), 500
-    
-    # Extract the directory and the filename from the stored path
-    # directory = os.path.dirname(file_record.storage_path)
-    # filename = os.path.basename(file_record.storage_path)
-    
-    
-    # Use Flask's send_from_directory to securely serve the file
-    # return send_from_directory(directory, filename, as_attachment=True)
-    
-    return (
-        file_bytes,
-        200,
-        {
-            "Content-Type": file_record.content_type,
-            "Content-Disposition": f"attachment; filename={file_record.filename}"
-        }
+        return jsonify({"msg": f"Storage download failed: {e}"}), 500
+
+    # Files uploaded before etags were stored fall back to the storage etag
+    if not etag and headers.get('etag'):
+        etag = headers['etag'].strip('"')
+        if not is_resource_modified(request.environ, etag=etag):
+            body.close()
+            return Response(status=304, headers=download_cache_headers(file_meta, etag))
+
+    response_headers = download_cache_headers(file_meta, etag)
+    response_headers.update({
+        "Content-Disposition": f"attachment; filename={file_meta['filename']}",
+        "Accept-Ranges": "bytes"
+    })
+    for name in ('Content-Length', 'Content-Range'):
+        if headers.get(name.lower()):
+            response_headers[name] = headers[name.lower()]
+
+    response = Response(
+        stream_body(body),
+        status=status,
+        headers=response_headers,
+        content_type=file_meta['content_type'],
+        direct_passthrough=True
     )
+    # A HEAD response is never iterated, so stream_body's finally never runs;
+    # closing the body (twice is harmless) gives back its Swift connection
+    response.call_on_close(body.close)
+    return response
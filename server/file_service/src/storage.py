@@ -0,0 +1,473 @@
+import hashlib
+import json
+import os
+import tempfile
+from urllib.parse import urlencode, urlparse
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from flask import Response, send_file
+from swiftclient.exceptions import ClientException
+from swiftclient.utils import generate_temp_url
+from werkzeug.http import http_date, parse_range_header
+from werkzeug.security import safe_join
+from src.swift import SwiftConnectionManager
+
+# What a backend returns when an object is opened for reading.
+# headers is a dict with lower-case names (content-length, content-range, etag, last-modified)
+# and body is an iterable of byte chunks with a close() method.
+StoredObject = namedtuple('StoredObject', ['status', 'headers', 'body'])
+
+# One entry of an object listing; last_modified is a naive UTC datetime.
+ListedObject = namedtuple('ListedObject', ['name', 'last_modified'])
+
+
+class StorageError(Exception):
+    """Base class for storage backend errors."""
+
+
+class ObjectNotFound(StorageError):
+    """The requested object does not exist in the backend."""
+
+
+class RangeNotSatisfiable(StorageError):
+    """The requested byte range lies outside the object."""
+
+
+class StorageBackend:
+    """
+    Interface every storage backend implements.
+    Objects are addressed by name (File.storage_path); names may contain '/'.
+    """
+
+    def put(self, name, stream, content_length=None, content_type=None):
+        """Stores the stream under name and returns its etag."""
+        raise NotImplementedError
+
+    def put_manifest(self, name, segments, content_type=None):
+        """Joins already stored segments, a list of (name, etag, size), into one object."""
+        raise NotImplementedError
+
+    def get(self, name, range_header=None):
+        """Opens an object, or a single byte range of it, and returns a StoredObject."""
+        raise NotImplementedError
+
+    def delete(self, name):
+        """Deletes an object (and its segments, for joined objects)."""
+        raise NotImplementedError
+
+    def exists(self, name):
+        """Returns True if the object exists."""
+        raise NotImplementedError
+
+    def head(self, name):
+        """Returns an object's headers (lower-case names, as for get) without its body."""
+        raise NotImplementedError
+
+    def list_objects(self, prefix=None):
+        """Yields a ListedObject for every stored object, sorted by name, a page at a time."""
+        raise NotImplementedError
+
+    def delete_many(self, names):
+        """
+        Deletes several objects and returns {name: None or the exception raised}.
+        An object that is already gone counts as deleted.
+        """
+        return {name: self._try_delete(name) for name in names}
+
+    def _try_delete(self, name):
+        try:
+            self.delete(name)
+        except ObjectNotFound:
+            pass
+        except Exception as e:
+            return e
+        return None
+
+    def serve(self, name, content_type, filename, etag=None):
+        """
+        Returns a response that lets something other than Python send the bytes
+        (sendfile, a proxy handoff), or None to have the caller stream get().
+        """
+        return None
+
+    def temp_url(self, name, method, ttl, filename=None):
+        """
+        Returns a signed URL that lets a client PUT or GET the object directly
+        for ttl seconds, or None if the backend can't do that.
+        """
+        return None
+
+
+class SwiftStorage(StorageBackend):
+    """Stores blobs in an OpenStack Swift container."""
+
+    def __init__(self, swift, container, chunk_size, delete_concurrency=8, temp_url_key=None, public_url=None):
+        self.swift = swift
+        self.container = container
+        self.chunk_size = chunk_size
+        self.delete_concurrency = delete_concurrency
+        self.temp_url_key = temp_url_key
+        self.public_url = public_url
+        self._delete_pool = None
+
+    def put(self, name, stream, content_length=None, content_type=None):
+        with self.swift.connection() as conn:
+            return conn.put_object(
+                self.container,
+                name,
+                contents=stream,
+                content_length=content_length,
+                content_type=content_type
+            )
+
+    def put_manifest(self, name, segments, content_type=None):
+        manifest = [
+            {"path": f"/{self.container}/{segment_name}", "etag": etag, "size_bytes": size}
+            for segment_name, etag, size in segments
+        ]
+        with self.swift.connection() as conn:
+            return conn.put_object(
+                self.container,
+                name,
+                contents=json.dumps(manifest),
+                content_type=content_type,
+                query_string='multipart-manifest=put'
+            )
+
+    def get(self, name, range_header=None):
+        # The lazy body reads from the connection's socket, so the connection
+        # stays checked out until the body is closed
+        conn = self.swift.checkout()
+        response_dict = {}
+        try:
+            # With resp_chunk_size set, Swift returns a lazy body instead of the whole blob
+            headers, body = conn.get_object(
+                self.container,
+                name,
+                resp_chunk_size=self.chunk_size,
+                headers={'Range': range_header} if range_header else None,
+                response_dict=response_dict
+            )
+        except ClientException as e:
+            self.swift.checkin(conn)
+            if e.http_status == 404:
+                raise ObjectNotFound(name) from e
+            if e.http_status == 416:
+                raise RangeNotSatisfiable(name) from e
+            raise
+        except Exception:
+            self.swift.checkin(conn)
+            raise
+        return StoredObject(response_dict.get('status', 200), headers, PooledBody(body, lambda: self.swift.checkin(conn)))
+
+    def delete(self, name):
+        try:
+            with self.swift.connection() as conn:
+                # Also removes the segments when the object is an SLO manifest
+                conn.delete_object(self.container, name, query_string='multipart-manifest=delete')
+        except ClientException as e:
+            if e.http_status == 404:
+                raise ObjectNotFound(name) from e
+            raise
+
+    def exists(self, name):
+        try:
+            with self.swift.connection() as conn:
+                conn.head_object(self.container, name)
+        except ClientException as e:
+            if e.http_status == 404:
+                return False
+            raise
+        return True
+
+    def head(self, name):
+        try:
+            with self.swift.connection() as conn:
+                return conn.head_object(self.container, name)
+        except ClientException as e:
+            if e.http_status == 404:
+                raise ObjectNotFound(name) from e
+            raise
+
+    def temp_url(self, name, method, ttl, filename=None):
+        if not self.temp_url_key:
+            return None
+        # The signature covers /v1/<account>/<container>/<object>, taken from the storage URL
+        with self.swift.connection() as conn:
+            storage_url = urlparse(conn.url)
+        path = generate_temp_url(
+            f"{storage_url.path}/{self.container}/{name}", ttl, self.temp_url_key, method
+        )
+        base = self.public_url or f"{storage_url.scheme}://{storage_url.netloc}"
+        url = base.rstrip('/') + path
+        if filename:
+            # Swift then sends Content-Disposition: attachment with this name
+            url += '&' + urlencode({'filename': filename})
+        return url
+
+    def list_objects(self, prefix=None, page_size=10000):
+        marker = ''
+        while True:
+            with self.swift.connection() as conn:
+                _, objects = conn.get_container(self.container, marker=marker, limit=page_size, prefix=prefix)
+            if not objects:
+                return
+            for obj in objects:
+                yield ListedObject(obj['name'], datetime.fromisoformat(obj['last_modified']))
+            marker = objects[-1]['name']
+
+    def delete_many(self, names):
+        # Swift's bulk-delete middleware doesn't expand SLO manifests, so use a
+        # bounded pool of per-object deletes. The pool lives as long as the
+        # worker; its threads borrow connections from the Swift pool.
+        if self._delete_pool is None:
+            self._delete_pool = ThreadPoolExecutor(
+                max_workers=self.delete_concurrency,
+                thread_name_prefix='swift-delete'
+            )
+        return dict(zip(names, self._delete_pool.map(self._try_delete, names)))
+
+
+class PooledBody:
+    """Wraps a Swift object body; gives its connection back to the pool once closed."""
+
+    def __init__(self, body, release):
+        self.body = body
+        self.release = release
+
+    def __iter__(self):
+        return iter(self.body)
+
+    def close(self):
+        try:
+            self.body.close()
+        finally:
+            if self.release is not None:
+                release, self.release = self.release, None
+                release()
+
+
+class FileBody:
+    """Iterates over (part of) an open file in fixed-size chunks."""
+
+    def __init__(self, file, length, chunk_size):
+        self.file = file
+        self.remaining = length
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.remaining <= 0:
+            raise StopIteration
+        chunk = self.file.read(min(self.chunk_size, self.remaining))
+        if not chunk:
+            raise StopIteration
+        self.remaining -= len(chunk)
+        return chunk
+
+    def close(self):
+        self.file.close()
+
+
+class LocalStorage(StorageBackend):
+    """
+    Stores blobs in a directory on local disk.
+    Downloads are served with sendfile (via send_file and the WSGI file
+    wrapper) or, when accel_prefix is set, handed to nginx with
+    X-Accel-Redirect, so the bytes never pass through Python.
+    """
+
+    def __init__(self, root, chunk_size, accel_prefix=None):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.accel_prefix = accel_prefix
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, name):
+        path = safe_join(self.root, name)
+        if path is None:
+            raise StorageError(f"Invalid object name: {name}")
+        return path
+
+    @staticmethod
+    def _etag(stat):
+        # Stored blobs are never modified in place, so mtime and size identify the content
+        return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+    def _write(self, path, chunks):
+        """Writes chunks to a temp file next to path and renames it into place."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        md5 = hashlib.md5()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    md5.update(chunk)
+                    f.write(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return md5.hexdigest()
+
+    def _read_chunks(self, stream):
+        while True:
+            chunk = stream.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def put(self, name, stream, content_length=None, content_type=None):
+        return self._write(self._path(name), self._read_chunks(stream))
+
+    def put_manifest(self, name, segments, content_type=None):
+        def joined():
+            for segment_name, _, _ in segments:
+                with open(self._path(segment_name), 'rb') as f:
+                    yield from self._read_chunks(f)
+
+        try:
+            etag = self._write(self._path(name), joined())
+        except FileNotFoundError as e:
+            raise ObjectNotFound(e.filename) from e
+
+        for segment_name, _, _ in segments:
+            os.remove(self._path(segment_name))
+        return etag
+
+    def get(self, name, range_header=None):
+        try:
+            f = open(self._path(name), 'rb')
+        except FileNotFoundError as e:
+            raise ObjectNotFound(name) from e
+
+        stat = os.fstat(f.fileno())
+        size = stat.st_size
+        headers = {
+            'content-length': str(size),
+            'etag': self._etag(stat),
+            'last-modified': http_date(stat.st_mtime)
+        }
+
+        # Like Swift, serve a single range and ignore anything we can't parse
+        requested = parse_range_header(range_header) if range_header else None
+        if requested is None or len(requested.ranges) != 1:
+            return StoredObject(200, headers, FileBody(f, size, self.chunk_size))
+
+        bounds = requested.range_for_length(size)
+        if bounds is None:
+            f.close()
+            raise RangeNotSatisfiable(name)
+
+        start, stop = bounds
+        f.seek(start)
+        headers['content-length'] = str(stop - start)
+        headers['content-range'] = f"bytes {start}-{stop - 1}/{size}"
+        return StoredObject(206, headers, FileBody(f, stop - start, self.chunk_size))
+
+    def delete(self, name):
+        path = self._path(name)
+        if not os.path.exists(path):
+            raise ObjectNotFound(name)
+        os.remove(path)
+
+    def exists(self, name):
+        return os.path.isfile(self._path(name))
+
+    def head(self, name):
+        try:
+            stat = os.stat(self._path(name))
+        except FileNotFoundError as e:
+            raise ObjectNotFound(name) from e
+        return {
+            'content-length': str(stat.st_size),
+            'etag': self._etag(stat),
+            'last-modified': http_date(stat.st_mtime)
+        }
+
+    def list_objects(self, prefix=None):
+        for obj in self._walk(self.root, ''):
+            if prefix is None or obj.name.startswith(prefix):
+                yield obj
+
+    def _walk(self, directory, name_prefix):
+        # Sorting directories as "name/" keeps the full names in the same
+        # (byte-wise) order Swift lists them in, one directory in memory at a time.
+        with os.scandir(directory) as it:
+            entries = sorted(it, key=lambda e: e.name + '/' if e.is_dir() else e.name)
+        for entry in entries:
+            if entry.is_dir():
+                yield from self._walk(entry.path, f"{name_prefix}{entry.name}/")
+            else:
+                mtime = datetime.fromtimestamp(entry.stat().st_mtime, timezone.utc).replace(tzinfo=None)
+                yield ListedObject(f"{name_prefix}{entry.name}", mtime)
+
+    def serve(self, name, content_type, filename, etag=None):
+        path = self._path(name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError as e:
+            raise ObjectNotFound(name) from e
+
+        if self.accel_prefix:
+            # nginx serves the file from an `internal` location, including Range
+            # requests; the validators are the same ones send_file would set
+            return Response(status=200, content_type=content_type, headers={
+                "Content-Disposition": f"attachment; filename={filename}",
+                "ETag": f'"{etag or self._etag(stat)}"',
+                "Last-Modified": http_date(stat.st_mtime),
+                "X-Accel-Redirect": f"{self.accel_prefix.rstrip('/')}/{name}"
+            })
+
+        # conditional=True handles Range, If-Range and validators for us
+        return send_file(
+            path,
+            mimetype=content_type,
+            as_attachment=True,
+            download_name=filename,
+            conditional=True,
+            etag=etag or self._etag(stat)
+        )
+
+
+class Storage:
+    """
+    Flask extension that picks the storage backend named by STORAGE_BACKEND
+    and forwards calls to it.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('STORAGE_BACKEND', 'swift')
+        chunk_size = app.config.get('STORAGE_CHUNK_SIZE', 64 * 1024)
+
+        if backend == 'swift':
+            self.backend = SwiftStorage(
+                SwiftConnectionManager(app),
+                app.config.get('SWIFT_CONTAINER'),
+                chunk_size,
+                app.config.get('STORAGE_DELETE_CONCURRENCY', 8),
+                app.config.get('SWIFT_TEMPURL_KEY'),
+                app.config.get('SWIFT_PUBLIC_URL')
+            )
+        elif backend == 'local':
+            self.backend = LocalStorage(
+                app.config.get('LOCAL_STORAGE_PATH'),
+                chunk_size,
+                app.config.get('LOCAL_STORAGE_ACCEL_PREFIX')
+            )
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+        app.extensions['storage'] = self
+
+    def __getattr__(self, name):
+        # Only called for attributes not found on the extension itself
+        return getattr(self.__dict__.get('backend'), name)
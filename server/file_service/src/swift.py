@@ -0,0 +1,212 @@
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+import click
+import swiftclient
+from flask import current_app
+from flask.cli import with_appcontext
+from swiftclient.exceptions import ClientException
+
+
+class SwiftPoolExhausted(Exception):
+    """No Swift connection became free within SWIFT_POOL_TIMEOUT seconds."""
+
+
+class SwiftConnectionManager:
+    """
+    Lends out authenticated Swift connections from a bounded pool and shares
+    the auth token between connections and worker processes.
+
+    swiftclient.Connection is not thread-safe, so a connection (and its
+    keep-alive HTTP socket) is used by one thread or greenlet at a time:
+    it is checked out for a request to Swift and given back afterwards.
+    The pool holds at most SWIFT_POOL_SIZE connections and is last in,
+    first out, so the same few warm connections serve most requests, and
+    a burst of greenlets can't open a connection each. The token the
+    connections use is cached in memory and in a small file, so a freshly
+    started worker reuses the token of its siblings instead of
+    authenticating again. Retries with backoff on 401s and connection
+    resets are done by swiftclient itself; we only configure them here.
+    """
+
+    def __init__(self, app=None):
+        self._pool = None
+        self._issued_tokens = {}  # connection -> token it was last handed out with
+        self._lock = threading.Lock()
+        self._token = None  # (storage_url, token, expires_at)
+        self.config = {}
+        if app is not None:
+            self.init_app(app)
+
+    def resize(self, size):
+        """Starts a new, empty pool of at most size connections."""
+        self._pool = queue.LifoQueue(maxsize=size)
+        # Free slots are None until a connection is opened in them
+        for _ in range(size):
+            self._pool.put(None)
+        self._issued_tokens = {}
+
+    def init_app(self, app):
+        self.config = {
+            'authurl': app.config.get('SWIFT_AUTH_URL'),
+            'user': app.config.get('SWIFT_USER'),
+            'key': app.config.get('SWIFT_KEY'),
+            'container': app.config.get('SWIFT_CONTAINER'),
+            'retries': app.config.get('SWIFT_RETRIES', 5),
+            'starting_backoff': app.config.get('SWIFT_STARTING_BACKOFF', 1),
+            'max_backoff': app.config.get('SWIFT_MAX_BACKOFF', 16),
+            'timeout': app.config.get('SWIFT_TIMEOUT'),
+            'token_ttl': app.config.get('SWIFT_TOKEN_TTL', 3600),
+            'token_cache_file': app.config.get('SWIFT_TOKEN_CACHE_FILE'),
+            'tempurl_key': app.config.get('SWIFT_TEMPURL_KEY'),
+            'cors_allow_origin': app.config.get('SWIFT_CORS_ALLOW_ORIGIN'),
+            'pool_timeout': app.config.get('SWIFT_POOL_TIMEOUT', 30),
+        }
+        self.resize(app.config.get('SWIFT_POOL_SIZE', 100))
+        app.extensions['swift'] = self
+
+    def ensure_container(self, retries=None, timeout=None):
+        """
+        Creates the configured container if it does not exist yet, and keeps
+        its TempURL key and CORS metadata in line with the configuration.
+        Run once per deploy by 'ensure-swift-container', on a connection of
+        its own, so it can use fewer retries and a shorter timeout than requests.
+        """
+        conn = self._prime(self._new_connection(retries, timeout))
+        try:
+            wanted = {}
+            if self.config.get('tempurl_key'):
+                wanted['x-container-meta-temp-url-key'] = self.config['tempurl_key']
+            if self.config.get('cors_allow_origin'):
+                wanted['x-container-meta-access-control-allow-origin'] = self.config['cors_allow_origin']
+                wanted['x-container-meta-access-control-expose-headers'] = 'etag'
+
+            try:
+                headers = conn.head_container(self.config['container'])
+            except ClientException as e:
+                if e.http_status != 404:
+                    raise
+                conn.put_container(self.config['container'], headers=wanted)
+                return
+
+            if any(headers.get(name) != value for name, value in wanted.items()):
+                conn.post_container(self.config['container'], wanted)
+        finally:
+            self._issued_tokens.pop(conn, None)
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Lends a connection for the duration of a with block."""
+        conn = self.checkout()
+        try:
+            yield conn
+        finally:
+            self.checkin(conn)
+
+    def checkout(self):
+        """
+        Takes a connection from the pool, primed with a valid shared token,
+        waiting while they are all in use. It must be given back with checkin.
+        """
+        try:
+            conn = self._pool.get(timeout=self.config.get('pool_timeout'))
+        except queue.Empty:
+            raise SwiftPoolExhausted() from None
+        try:
+            return self._prime(conn)
+        except Exception:
+            self._pool.put(conn)
+            raise
+
+    def checkin(self, conn):
+        """Gives a connection back to the pool."""
+        self._pool.put(conn)
+
+    def _new_connection(self, retries=None, timeout=None):
+        return swiftclient.Connection(
+            authurl=self.config['authurl'],
+            user=self.config['user'],
+            key=self.config['key'],
+            auth_version="1",
+            retries=self.config['retries'] if retries is None else retries,
+            starting_backoff=self.config['starting_backoff'],
+            max_backoff=self.config['max_backoff'],
+            timeout=self.config['timeout'] if timeout is None else timeout
+        )
+
+    def _prime(self, conn):
+        if conn is None:
+            conn = self._new_connection()
+
+        # The connection re-authenticated on its own (e.g. after a 401) since
+        # we last handed it out, so its token is the freshest one around.
+        if conn.token and conn.token != self._issued_tokens.get(conn):
+            self._store_token(conn.url, conn.token)
+
+        cached = self._load_token()
+        if cached is None:
+            url, token = conn.get_auth()
+            self._store_token(url, token)
+            cached = (url, token)
+
+        conn.url, conn.token = cached
+        self._issued_tokens[conn] = conn.token
+        return conn
+
+    def _load_token(self):
+        now = time.time()
+        with self._lock:
+            if self._token and self._token[2] > now:
+                return self._token[:2]
+
+        path = self.config.get('token_cache_file')
+        if not path:
+            return None
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('expires_at', 0) <= now:
+            return None
+
+        with self._lock:
+            self._token = (data['url'], data['token'], data['expires_at'])
+        return data['url'], data['token']
+
+    def _store_token(self, url, token):
+        expires_at = time.time() + self.config['token_ttl']
+        with self._lock:
+            self._token = (url, token, expires_at)
+
+        path = self.config.get('token_cache_file')
+        if not path:
+            return
+        # Write to a private temp file and rename it so other workers never
+        # read a half-written token.
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({"url": url, "token": token, "expires_at": expires_at}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error caching Swift token: {e}")
+
+
+@click.command('ensure-swift-container')
+@click.option('--retries', default=1, show_default=True, help='Retries per Swift request.')
+@click.option('--timeout', default=10.0, show_default=True, help='Seconds to wait on each Swift request.')
+@with_appcontext
+def ensure_swift_container_command(retries, timeout):
+    """Create the Swift container if needed and apply its TempURL key and CORS settings."""
+    swift = current_app.extensions.get('swift')
+    if swift is None or not swift.config.get('authurl'):
+        click.echo("Swift is not configured; nothing to do.")
+        return
+    swift.ensure_container(retries, timeout)
+    click.echo(f"Container {swift.config['container']} is ready.")
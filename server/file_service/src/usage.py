@@ -0,0 +1,65 @@
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from src import db
+from src.models import StorageUsage, UploadSession
+
+
+def adjust_usage(owner_user_id, status, bytes_delta, count_delta):
+    """
+    Adds the deltas to a user's usage row for one status, creating it if needed.
+    Runs on the current session, so it commits (or rolls back) with the file change.
+    """
+    insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    statement = insert(StorageUsage).values(
+        owner_user_id=owner_user_id,
+        status=status,
+        bytes=bytes_delta,
+        file_count=count_delta
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=['owner_user_id', 'status'],
+        set_={
+            'bytes': StorageUsage.bytes + statement.excluded.bytes,
+            'file_count': StorageUsage.file_count + statement.excluded.file_count
+        }
+    )
+    db.session.execute(statement)
+
+
+def adjust_usage_for_files(owner_user_id, files, sign):
+    """Applies adjust_usage for many files at once, one statement per status."""
+    totals = defaultdict(lambda: [0, 0])
+    for file in files:
+        totals[file.status][0] += file.size
+        totals[file.status][1] += 1
+    for status, (size, count) in totals.items():
+        adjust_usage(owner_user_id, status, sign * size, sign * count)
+
+
+def get_usage(owner_user_id):
+    """Returns a user's usage as {status: {"bytes": ..., "files": ...}}."""
+    rows = StorageUsage.query.filter_by(owner_user_id=owner_user_id).all()
+    return {row.status: {"bytes": row.bytes, "files": row.file_count} for row in rows}
+
+
+def total_bytes(owner_user_id):
+    """Bytes a user stores across all statuses (at most three rows to add up)."""
+    total = db.session.query(func.coalesce(func.sum(StorageUsage.bytes), 0)) \
+        .filter(StorageUsage.owner_user_id == owner_user_id).scalar()
+    return int(total)
+
+
+
+def pending_upload_bytes(owner_user_id, exclude_upload_id=None):
+    """
+    Bytes a user has reserved in unexpired upload sessions. Their segments
+    are stored before any file row exists, so quota checks count them too.
+    """
+    query = db.session.query(func.coalesce(func.sum(UploadSession.size), 0)) \
+        .filter(UploadSession.owner_user_id == owner_user_id,
+                UploadSession.expires_at > datetime.utcnow())
+    if exclude_upload_id is not None:
+        query = query.filter(UploadSession.id != exclude_upload_id)
+    return int(query.scalar())
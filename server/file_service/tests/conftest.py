@@ -1,4 +1,6 @@
 import pytest
+from datetime import datetime
+from unittest.mock import MagicMock
 from src import create_app
 
 @pytest.fixture(scope='module')
@@ -23,3 +25,19 @@ def test_client(test_app):
     A new client is created for each test function to ensure isolation.
     """
     return test_app.test_client()
+
+@pytest.fixture(scope='function')
+def stored_file(mocker):
+    """
+    A File row (a mock) that every File.query.filter_by(...).first() lookup
+    returns. Tests change its attributes to describe the file they need.
+    """
+    mock_file = MagicMock()
+    mock_file.storage_path = 'blob.enc'
+    mock_file.content_type = 'application/octet-stream'
+    mock_file.filename = 'report.pdf'
+    mock_file.etag = None
+    mock_file.sha256 = None
+    mock_file.created_at = datetime(2024, 1, 1)
+    mocker.patch('src.models.File.query').filter_by.return_value.first.return_value = mock_file
+    return mock_file
@@ -0,0 +1,54 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+from src.cache import FileMetadataCache
+
+
+def make_cache(redis=None):
+    app = SimpleNamespace(config={'METADATA_CACHE_ENABLED': True}, extensions={})
+    cache = FileMetadataCache()
+    cache.init_app(app, redis=redis)
+    return cache
+
+
+def test_hits_are_served_without_the_loader():
+    """
+    GIVEN a metadata cache without Redis
+    WHEN the same file (or the same unknown file) is looked up repeatedly
+    THEN the loader (the database) should only be called once per file.
+    """
+    cache = make_cache()
+    loader = MagicMock(side_effect=lambda file_id: {"id": file_id} if file_id == 'known' else None)
+
+    assert cache.get('known', loader) == {"id": "known"}
+    assert cache.get('known', loader) == {"id": "known"}
+    assert cache.get('unknown', loader) is None
+    assert cache.get('unknown', loader) is None
+
+    assert loader.call_count == 2
+
+
+def test_redis_tier_is_read_through_and_invalidated():
+    """
+    GIVEN a metadata cache backed by Redis
+    WHEN a file is looked up, then invalidated after a write
+    THEN Redis should be filled on the miss and cleared by the invalidation.
+    """
+    redis = MagicMock()
+    redis.get.return_value = None
+    cache = make_cache(redis=redis)
+    loader = MagicMock(return_value={"id": "file123", "filename": "a.txt"})
+
+    cache.get('file123', loader)
+    redis.set.assert_called_once_with('file-meta:file123', json.dumps({"id": "file123", "filename": "a.txt"}), ex=300)
+
+    # Another worker finds the entry in Redis and never touches the database
+    other_worker = make_cache(redis=MagicMock(**{'get.return_value': redis.set.call_args.args[1]}))
+    other_loader = MagicMock()
+    assert other_worker.get('file123', other_loader)['filename'] == 'a.txt'
+    other_loader.assert_not_called()
+
+    cache.invalidate('file123')
+    redis.delete.assert_called_once_with('file-meta:file123')
+    cache.get('file123', loader)
+    assert loader.call_count == 2
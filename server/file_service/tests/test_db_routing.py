@@ -0,0 +1,69 @@
+from flask import Flask, jsonify
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required
+from flask_sqlalchemy import SQLAlchemy
+from src.db_routing import RoutingSession, ReplicaRouter, read_only, read_or_primary
+
+
+def make_app(tmp_path):
+    """A minimal app with a primary and one replica (two sqlite files) and a routing session."""
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path}/primary.db",
+        SQLALCHEMY_BINDS={'replica_0': f"sqlite:///{tmp_path}/replica.db"},
+        JWT_SECRET_KEY='test-secret-key-that-is-long-enough'
+    )
+    db = SQLAlchemy(app, session_options={"class_": RoutingSession})
+    JWTManager(app)
+    ReplicaRouter().init_app(app)
+
+    class Item(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        name = db.Column(db.String(20))
+
+    @app.route('/items/<int:item_id>', methods=['PUT'])
+    @jwt_required()
+    def write(item_id):
+        db.session.merge(Item(id=item_id, name='primary'))
+        db.session.commit()
+        return jsonify(ok=True)
+
+    @app.route('/items/<int:item_id>')
+    @jwt_required()
+    @read_only
+    def read(item_id):
+        item = read_or_primary(lambda: db.session.get(Item, item_id))
+        return jsonify(name=item.name if item else None)
+
+    with app.app_context():
+        db.create_all()
+        db.metadata.create_all(db.engines['replica_0'])
+        with db.engines['replica_0'].begin() as conn:
+            conn.execute(Item.__table__.insert(), [{"id": 1, "name": "replica"}])
+        with db.engines[None].begin() as conn:
+            conn.execute(Item.__table__.insert(), [{"id": 1, "name": "primary"}, {"id": 2, "name": "primary"}])
+    return app
+
+
+def test_reads_go_to_replica_except_after_own_writes(tmp_path):
+    """
+    GIVEN a primary and a replica holding different versions of a row
+    WHEN read-only views are called before and after a user writes
+    THEN reads should use the replica, except for the writer right after their commit,
+    and rows missing on the replica should be looked up on the primary.
+    """
+    app = make_app(tmp_path)
+    client = app.test_client()
+    with app.app_context():
+        alice = {'Authorization': f'Bearer {create_access_token(identity="1")}'}
+        bob = {'Authorization': f'Bearer {create_access_token(identity="2")}'}
+
+    # 1. Reads come from the replica
+    assert client.get('/items/1', headers=alice).json['name'] == 'replica'
+
+    # 2. A row not replicated yet is found on the primary
+    assert client.get('/items/2', headers=bob).json['name'] == 'primary'
+
+    # 3. After Alice writes, her reads stick to the primary; Bob's don't
+    assert client.put('/items/3', headers=alice).status_code == 200
+    assert client.get('/items/1', headers=alice).json['name'] == 'primary'
+    assert client.get('/items/1', headers=bob).json['name'] == 'replica'
@@ -0,0 +1,66 @@
+import base64
+import hashlib
+import io
+import os
+from flask_jwt_extended import create_access_token
+from src import db, storage
+from src.models import File
+from src.storage import LocalStorage
+
+
+def upload(test_client, contents, size):
+    headers = {'Authorization': f'Bearer {create_access_token(identity="11")}'}
+    return test_client.post('/files/upload', headers=headers, content_type='multipart/form-data', data={
+        'file': (io.BytesIO(contents), 'f.bin'), 'filename': 'f.bin',
+        'contentType': 'application/octet-stream', 'size': str(size)
+    })
+
+
+def test_upload_stores_digest_and_rejects_size_mismatch(test_app, test_client, tmp_path, mocker):
+    """
+    GIVEN a local storage backend
+    WHEN a file is uploaded with the right size, and another with a wrong declared size
+    THEN the first should be stored with its SHA-256 (also sent on download) and the second refused and removed.
+    """
+    backend = LocalStorage(str(tmp_path), 4)
+    mocker.patch.object(storage, 'backend', backend)
+    contents = b'ciphertext bytes'
+
+    # 1. Matching size: digest stored, returned and served
+    response = upload(test_client, contents, len(contents))
+    assert response.status_code == 201
+    sha256 = hashlib.sha256(contents).hexdigest()
+    assert response.json['file']['sha256'] == sha256
+
+    download = test_client.get(f"/files/download/{response.json['file']['id']}")
+    assert download.headers['Repr-Digest'] == f"sha-256=:{base64.b64encode(hashlib.sha256(contents).digest()).decode()}:"
+
+    # 2. Mismatching size: rejected, and no blob is left behind
+    response = upload(test_client, contents, len(contents) + 1)
+    assert response.status_code == 400
+    assert len(list(backend.list_objects())) == 1
+
+
+def test_verify_storage_reports_corrupt_and_missing(test_app, tmp_path, mocker):
+    """
+    GIVEN stored files whose blobs are intact, altered, and gone
+    WHEN the 'verify-storage' command runs
+    THEN it should report the altered and missing blobs and exit with an error.
+    """
+    backend = LocalStorage(str(tmp_path), 4)
+    mocker.patch.object(storage, 'backend', backend)
+    for name in ['ok.enc', 'bad.enc', 'gone.enc']:
+        backend.put(name, io.BytesIO(b'payload'))
+        db.session.add(File(owner_user_id=12, filename=name, content_type='x', size=7,
+                            storage_path=name, sha256=hashlib.sha256(b'payload').hexdigest()))
+    db.session.commit()
+    with open(os.path.join(str(tmp_path), 'bad.enc'), 'wb') as f:
+        f.write(b'pAyload')
+    backend.delete('gone.enc')
+
+    result = test_app.test_cli_runner().invoke(args=['verify-storage', '--workers', '2', '--batch-size', '2'])
+
+    assert result.exit_code == 1
+    assert 'corrupt:' in result.output and '(bad.enc)' in result.output
+    assert 'missing:' in result.output and '(gone.enc)' in result.output
+    assert '(ok.enc)' not in result.output
@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta
+from sqlalchemy import inspect, text
+from src import db
+from src.models import UploadSession
+
+
+def test_migrate_db_restores_indexes_and_backfills(test_app):
+    """
+    GIVEN a database missing an index, with an upload session from before sessions expired
+    WHEN the 'migrate-db' command runs (twice)
+    THEN the index should be created, the session given an expiry, and the second run change nothing.
+    """
+    created_at = datetime(2024, 1, 1)
+    upload = UploadSession(owner_user_id=51, filename='f', content_type='x', size=1,
+                           segment_count=1, storage_path='legacy.enc', created_at=created_at)
+    db.session.add(upload)
+    db.session.commit()
+    db.session.execute(text('DROP INDEX ix_upload_sessions_expires_at'))
+    db.session.execute(text("UPDATE upload_sessions SET expires_at = NULL WHERE storage_path = 'legacy.enc'"))
+    db.session.commit()
+
+    for _ in range(2):
+        result = test_app.test_cli_runner().invoke(args=['migrate-db'])
+        assert result.exit_code == 0, result.output
+
+    indexes = {index['name'] for index in inspect(db.engine).get_indexes('upload_sessions')}
+    assert 'ix_upload_sessions_expires_at' in indexes
+    db.session.refresh(upload)
+    assert upload.expires_at == created_at + timedelta(days=1)
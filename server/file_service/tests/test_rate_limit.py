@@ -0,0 +1,39 @@
+import fakeredis
+from src import rate_limiter
+
+
+def test_public_endpoints_are_rate_limited_per_ip(test_app, test_client, mocker):
+    """
+    GIVEN a limit of 2 public-meta requests per minute, counted per IP
+    WHEN one client makes a third request, and another client its first
+    THEN the third request should get a 429 with Retry-After, and the other client should get through.
+    """
+    mocker.patch.object(rate_limiter, 'redis', fakeredis.FakeRedis())
+    mocker.patch.dict(test_app.config, {'RATE_LIMIT_PUBLIC_META': '2/60', 'RATE_LIMIT_PUBLIC_META_BY': 'ip'})
+    mocker.patch('src.routes.get_file_meta', return_value=None)
+
+    statuses = [test_client.get('/files/public-meta/f1').status_code for _ in range(3)]
+    assert statuses == [404, 404, 429]
+
+    response = test_client.get('/files/public-meta/f1')
+    assert response.status_code == 429
+    assert 0 < int(response.headers['Retry-After']) <= 30
+
+    other = test_client.get('/files/public-meta/f1', environ_base={'REMOTE_ADDR': '10.0.0.2'})
+    assert other.status_code == 404
+
+
+def test_rate_limit_fails_open_without_redis(test_app, test_client, mocker):
+    """
+    GIVEN a download limit and a Redis that errors on every call
+    WHEN a file is downloaded
+    THEN the request should go through rather than fail.
+    """
+    broken = mocker.MagicMock()
+    broken.register_script.side_effect = ConnectionError("Redis is down")
+    mocker.patch.object(rate_limiter, 'redis', broken)
+    mocker.patch.dict(test_app.config, {'RATE_LIMIT_DOWNLOAD': '1/60'})
+    mocker.patch('src.routes.get_file_meta', return_value=None)
+
+    assert test_client.get('/files/download/f1').status_code == 404
+    assert test_client.get('/files/download/f1').status_code == 404
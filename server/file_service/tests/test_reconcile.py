@@ -0,0 +1,99 @@
+import io
+import os
+import time
+from datetime import datetime, timedelta
+from src import db, storage
+from src.models import File, UploadSession
+from src.reconcile import Reconciler
+from src.storage import LocalStorage
+
+
+def setup_storage_and_rows(tmp_path, mocker):
+    """
+    Builds a small, inconsistent world on a fresh local backend:
+    one healthy file, orphaned/fresh objects and segments, dangling/fresh rows,
+    and objects and segments of live and expired upload sessions.
+    """
+    backend = LocalStorage(str(tmp_path), 64 * 1024)
+    mocker.patch.object(storage, 'backend', backend)
+
+    old = time.time() - 3600
+    for name in ['a.enc', 'orphan.enc', 'fresh.enc', 'segments/a.enc/00000001',
+                 'segments/gone.enc/00000001', 'segments/inflight.enc/00000001',
+                 'segments/stale.enc/00000001', 'pending.enc', 'stale.enc']:
+        backend.put(name, io.BytesIO(b'x'))
+        if name != 'fresh.enc':
+            os.utime(os.path.join(str(tmp_path), name), (old, old))
+
+    long_ago = datetime.utcnow() - timedelta(hours=1)
+    for path, created_at in [('a.enc', long_ago), ('missing.enc', long_ago), ('new-row.enc', datetime.utcnow())]:
+        db.session.add(File(owner_user_id=1, filename=path, content_type='x', size=1,
+                            storage_path=path, created_at=created_at))
+    db.session.add(UploadSession(owner_user_id=1, filename='f', content_type='x', size=1,
+                                 segment_count=1, storage_path='inflight.enc'))
+    db.session.add(UploadSession(owner_user_id=1, filename='f', content_type='x', size=1,
+                                 segment_count=1, storage_path='stale.enc', expires_at=long_ago))
+    db.session.add(UploadSession(owner_user_id=1, filename='f', content_type='x', size=1,
+                                 segment_count=1, storage_path='pending.enc'))
+    db.session.commit()
+    return backend
+
+
+def test_reconcile_reports_then_repairs(test_app, tmp_path, mocker):
+    """
+    GIVEN objects without rows and rows without objects, some inside the grace period
+    WHEN the 'reconcile-storage' command runs, first as a report and then with --repair
+    THEN only the old orphans and dangling rows should be reported and removed.
+    """
+    backend = setup_storage_and_rows(tmp_path, mocker)
+
+    # 1. Report only: nothing changes
+    result = test_app.test_cli_runner().invoke(args=['reconcile-storage', '--grace-minutes', '10'])
+    assert result.exit_code == 0
+    assert 'orphaned object: orphan.enc' in result.output
+    assert 'orphaned object: segments/gone.enc/00000001' in result.output
+    assert 'orphaned object: segments/stale.enc/00000001' in result.output
+    assert 'orphaned object: stale.enc' in result.output
+    assert 'pending.enc' not in result.output
+    assert 'dangling row' in result.output and 'missing.enc' in result.output
+    assert 'fresh.enc' not in result.output and 'new-row.enc' not in result.output
+    assert backend.exists('orphan.enc')
+
+    # 2. Repair
+    stats = Reconciler(timedelta(minutes=10), repair=True, batch_size=2).run()
+    assert stats['orphaned_objects'] == 4
+    assert stats['dangling_rows'] == 1
+
+    assert not backend.exists('orphan.enc')
+    assert not backend.exists('segments/gone.enc/00000001')
+    assert not backend.exists('segments/stale.enc/00000001')
+    assert not backend.exists('stale.enc')
+    assert backend.exists('pending.enc')
+    assert backend.exists('fresh.enc')
+    assert backend.exists('segments/inflight.enc/00000001')
+    assert sorted(f.storage_path for f in File.query.all()) == ['a.enc', 'new-row.enc']
+
+
+def test_clean_uploads_deletes_expired_sessions(test_app, tmp_path, mocker):
+    """
+    GIVEN an expired segmented upload, an expired direct upload and a live upload
+    WHEN the 'clean-uploads' command runs
+    THEN the expired sessions and everything they stored should be deleted, and the live one kept.
+    """
+    backend = LocalStorage(str(tmp_path), 64 * 1024)
+    mocker.patch.object(storage, 'backend', backend)
+    long_ago = datetime.utcnow() - timedelta(hours=1)
+    for path, expires_at in [('old-parts.enc', long_ago), ('old-direct.enc', long_ago), ('live.enc', None)]:
+        db.session.add(UploadSession(owner_user_id=2, filename='f', content_type='x', size=2,
+                                     segment_count=2, storage_path=path, expires_at=expires_at))
+    db.session.commit()
+    for name in ['segments/old-parts.enc/00000001', 'segments/old-parts.enc/00000002',
+                 'old-direct.enc', 'segments/live.enc/00000001']:
+        backend.put(name, io.BytesIO(b'x'))
+
+    result = test_app.test_cli_runner().invoke(args=['clean-uploads', '--batch-size', '1'])
+
+    assert result.exit_code == 0
+    assert 'old-parts.enc' in result.output and 'old-direct.enc' in result.output
+    assert [obj.name for obj in backend.list_objects()] == ['segments/live.enc/00000001']
+    assert [u.storage_path for u in UploadSession.query.filter_by(owner_user_id=2)] == ['live.enc']
@@ -1,6 +1,21 @@
 import io
+import os
+from datetime import datetime, timedelta
+import json
 from unittest.mock import MagicMock, patch
 from flask_jwt_extended import create_access_token
+from swiftclient.exceptions import ClientException
+from src import storage
+from src.storage import SwiftStorage
+
+
+def use_swift_backend(mocker):
+    """Points the storage layer at Swift and returns the mocked Swift connection."""
+    swift = MagicMock()
+    conn = swift.checkout.return_value
+    swift.connection.return_value.__enter__.return_value = conn
+    mocker.patch.object(storage, 'backend', SwiftStorage(swift, 'files', 64 * 1024))
+    return conn
 
 def test_upload_file_success(test_client, mocker):
     """
@@ -10,8 +25,6 @@ def test_upload_file_success(test_client, mocker):
     """
     # 1. Mock external dependencies
     mock_db_session = mocker.patch('src.db.session')
-    mock_file_save = mocker.patch('werkzeug.datastructures.FileStorage.save')
-
 
     mock_file_instance = MagicMock()
     mock_file_instance.to_dict.return_value = {
@@ -20,7 +33,7 @@ def test_upload_file_success(test_client, mocker):
         # ... other fields as needed for the response
     }
     # When `File(...)` is called in the route, it will return our mock_file_instance
-    mocker.patch('src.routes.File', return_value=mock_file_instance)
+    mock_file_cls = mocker.patch('src.routes.File', return_value=mock_file_instance)
 
     # 2. Create a dummy access token and headers
     user_id = 1
@@ -34,7 +47,7 @@ def test_upload_file_success(test_client, mocker):
         'file': (io.BytesIO(b"my file contents"), 'test.txt'),
         'filename': 'test.txt',
         'contentType': 'text/plain',
-        'size': '17'
+        'size': '16'
     }
 
     # 4. Make the request
@@ -49,12 +62,38 @@ def test_upload_file_success(test_client, mocker):
     assert response.json['file']['filename'] == 'test.txt'
     
     # 6. Assert that our mocks were called correctly
-    mock_file_save.assert_called_once()
+    # The blob was written by the (local, in tests) storage backend
+    storage_path = mock_file_cls.call_args.kwargs['storage_path']
+    with open(os.path.join(storage.root, storage_path), 'rb') as f:
+        assert f.read() == b"my file contents"
     # Check that the session tried to add the instance we created
     mock_db_session.add.assert_called_once_with(mock_file_instance)
     mock_db_session.commit.assert_called_once()
 
 
+def test_upload_metadata_is_validated_before_storage(test_client, mocker):
+    """
+    GIVEN upload requests whose size or segment count isn't a non-negative integer
+    WHEN they are sent to the upload endpoints
+    THEN they should be refused with 400 before anything is written to storage.
+    """
+    headers = {'Authorization': f'Bearer {create_access_token(identity="41")}'}
+    put = mocker.spy(storage.backend, 'put')
+
+    response = test_client.post('/files/upload', headers=headers, content_type='multipart/form-data', data={
+        'file': (io.BytesIO(b'secret'), 'f.bin'), 'filename': 'f.bin',
+        'contentType': 'application/octet-stream', 'size': 'six'
+    })
+    assert response.status_code == 400
+    put.assert_not_called()
+
+    for body in [{'size': '-5', 'segmentCount': 2}, {'size': 10, 'segmentCount': 'two'},
+                 {'size': 10, 'segmentCount': 1.5}]:
+        response = test_client.post('/files/uploads', headers=headers,
+                                    json={'filename': 'big.bin', 'contentType': 'x', **body})
+        assert response.status_code == 400
+
+
 def test_get_my_files(test_client, mocker):
     """
     GIVEN an authenticated user
@@ -71,7 +110,7 @@ def test_get_my_files(test_client, mocker):
     # 2. Mock database query
     mock_file = MagicMock()
     mock_file.to_dict.return_value = {"id": "file123", "filename": "mydoc.pdf"}
-    mocker.patch('src.models.File.query').filter_by.return_value.order_by.return_value.all.return_value = [mock_file]
+    mocker.patch('src.models.File.query').filter_by.return_value.order_by.return_value.limit.return_value.all.return_value = [mock_file]
 
     # 3. Make the request with headers
     response = test_client.get('/files/my-files', headers=headers)
@@ -103,9 +142,10 @@ def test_delete_file_permanently(test_client, mocker):
     
     mock_file_to_delete = MagicMock()
     mock_file_to_delete.status = 'trashed'
-    mock_file_to_delete.storage_path = '/fake/path/to/file.enc'
+    mock_file_to_delete.storage_path = 'file.enc'
+    expected_path = os.path.join(storage.root, 'file.enc')
     
-    mocker.patch('src.models.File.query').filter_by.return_value.first.return_value = mock_file_to_delete
+    mocker.patch('src.models.File.query').filter_by.return_value.with_for_update.return_value.first.return_value = mock_file_to_delete
 
     # 3. Make the request with headers
     response = test_client.delete('/files/file/file123', headers=headers)
@@ -115,8 +155,470 @@ def test_delete_file_permanently(test_client, mocker):
     assert response.json['msg'] == "File permanently deleted"
 
     # 5. Assert mocks were called
-    mock_os_path_exists.assert_called_once_with('/fake/path/to/file.enc')
-    mock_os_remove.assert_called_once_with('/fake/path/to/file.enc')
+    mock_os_path_exists.assert_called_once_with(expected_path)
+    mock_os_remove.assert_called_once_with(expected_path)
     mock_db_session.delete.assert_called_once_with(mock_file_to_delete)
     mock_db_session.commit.assert_called_once()
 
+
+
+def test_download_file_streams_in_chunks(test_client, stored_file, mocker):
+    """
+    GIVEN a file stored in Swift
+    WHEN the '/files/download/<file_id>' endpoint is hit
+    THEN it should stream the blob chunk by chunk and close the Swift body afterwards.
+    """
+    # 1. Mock Swift to return a lazy body made of several chunks
+    mock_body = MagicMock()
+    mock_body.__iter__.return_value = iter([b'chunk-1', b'chunk-2', b'chunk-3'])
+    mock_conn = use_swift_backend(mocker)
+    mock_conn.get_object.return_value = ({'content-length': '21'}, mock_body)
+
+    # 2. Make the request
+    response = test_client.get('/files/download/file123')
+
+    # 3. Assert the outcome
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.data == b'chunk-1chunk-2chunk-3'
+    assert response.headers['Content-Length'] == '21'
+
+    # 4. Assert Swift was read in chunks and the body was released
+    _, kwargs = mock_conn.get_object.call_args
+    assert kwargs['resp_chunk_size'] > 0
+    mock_body.close.assert_called_once()
+
+
+def test_segmented_upload_flow(test_client, mocker):
+    """
+    GIVEN an authenticated user uploading a file in two segments
+    WHEN the segments are sent out of order and the upload is completed
+    THEN it should report progress, write an SLO manifest and create the File record.
+    """
+    # 1. Only Swift is mocked; the session bookkeeping uses the test database
+    mock_conn = use_swift_backend(mocker)
+    mock_conn.put_object.side_effect = ['etag-2', 'etag-1', 'manifest-etag']
+
+    access_token = create_access_token(identity='1')
+    headers = {'Authorization': f'Bearer {access_token}'}
+
+    # 2. Start the upload
+    response = test_client.post('/files/uploads', headers=headers, json={
+        'filename': 'big.bin', 'contentType': 'application/octet-stream', 'size': 10, 'segmentCount': 2
+    })
+    assert response.status_code == 201
+    upload_id = response.json['id']
+
+    # 3. Send segment 2 first and check what the server has received
+    response = test_client.put(f'/files/uploads/{upload_id}/segments/2', headers=headers, data=b'6789!')
+    assert response.status_code == 200
+    assert test_client.get(f'/files/uploads/{upload_id}', headers=headers).json['received_segments'] == [2]
+
+    # 4. Completing now must fail and name the missing segment
+    response = test_client.post(f'/files/uploads/{upload_id}/complete', headers=headers)
+    assert response.status_code == 409
+    assert response.json['missing_segments'] == [1]
+
+    # 5. Send segment 1 and complete
+    test_client.put(f'/files/uploads/{upload_id}/segments/1', headers=headers, data=b'12345')
+    response = test_client.post(f'/files/uploads/{upload_id}/complete', headers=headers)
+
+    assert response.status_code == 201
+    assert response.json['file']['filename'] == 'big.bin'
+    assert response.json['file']['size'] == 10
+
+    # 6. The manifest lists the segments in order
+    _, kwargs = mock_conn.put_object.call_args
+    assert kwargs['query_string'] == 'multipart-manifest=put'
+    manifest = json.loads(kwargs['contents'])
+    assert [segment['etag'] for segment in manifest] == ['etag-1', 'etag-2']
+
+    # 7. The session is gone once the File exists
+    assert test_client.get(f'/files/uploads/{upload_id}', headers=headers).status_code == 404
+
+
+def test_download_file_byte_range(test_client, stored_file, mocker):
+    """
+    GIVEN a file stored in Swift
+    WHEN the '/files/download/<file_id>' endpoint is hit with a Range header
+    THEN it should pass the range to Swift and answer 206 with Content-Range.
+    """
+    # 1. A file with a stored etag, and a ranged GET on Swift
+    stored_file.etag = 'abc123'
+
+    mock_body = MagicMock()
+    mock_body.__iter__.return_value = iter([b'01234'])
+
+    def ranged_get(container, obj, resp_chunk_size=None, headers=None, response_dict=None):
+        response_dict['status'] = 206
+        return {'content-length': '5', 'content-range': 'bytes 10-14/100', 'etag': 'abc123'}, mock_body
+
+    mock_conn = use_swift_backend(mocker)
+    mock_conn.get_object.side_effect = ranged_get
+
+    # 2. Make the request
+    response = test_client.get('/files/download/file123', headers={'Range': 'bytes=10-14', 'If-Range': '"abc123"'})
+
+    # 3. Assert the outcome
+    assert response.status_code == 206
+    assert response.data == b'01234'
+    assert response.headers['Content-Range'] == 'bytes 10-14/100'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    _, kwargs = mock_conn.get_object.call_args
+    assert kwargs['headers'] == {'Range': 'bytes=10-14'}
+
+
+def test_download_file_multiple_ranges_gets_whole_object(test_client, stored_file, mocker):
+    """
+    GIVEN a file stored in Swift
+    WHEN the '/files/download/<file_id>' endpoint is hit with a multi-range Range header
+    THEN it should ask Swift for the whole object and answer 200 without Content-Range.
+    """
+    stored_file.etag = 'abc123'
+
+    mock_body = MagicMock()
+    mock_body.__iter__.return_value = iter([b'0123456789'])
+    mock_conn = use_swift_backend(mocker)
+    mock_conn.get_object.return_value = ({'content-length': '10', 'etag': 'abc123'}, mock_body)
+
+    response = test_client.get('/files/download/file123', headers={'Range': 'bytes=0-1,5-6'})
+
+    assert response.status_code == 200
+    assert response.data == b'0123456789'
+    assert 'Content-Range' not in response.headers
+    _, kwargs = mock_conn.get_object.call_args
+    assert kwargs['headers'] is None
+
+
+def test_download_file_from_local_storage(test_client, stored_file, mocker):
+    """
+    GIVEN a file stored by the local-disk backend
+    WHEN the '/files/download/<file_id>' endpoint is hit, with and without a Range header
+    THEN it should be served by send_file (sendfile-capable) with range support.
+    """
+    # 1. Store a blob on disk for the file
+    storage.put('local-blob.enc', io.BytesIO(b"0123456789"))
+    stored_file.storage_path = 'local-blob.enc'
+    stored_file.filename = 'notes.txt'
+
+    # 2. Full download
+    response = test_client.get('/files/download/file123')
+    assert response.status_code == 200
+    assert response.data == b"0123456789"
+    assert 'attachment' in response.headers['Content-Disposition']
+
+    # 3. Ranged download
+    response = test_client.get('/files/download/file123', headers={'Range': 'bytes=2-4'})
+    assert response.status_code == 206
+    assert response.data == b"234"
+    assert response.headers['Content-Range'] == 'bytes 2-4/10'
+
+    # 4. Handed to nginx, with the same validators send_file sets
+    full = test_client.get('/files/download/file123')
+    mocker.patch.object(storage.backend, 'accel_prefix', '/protected')
+    response = test_client.get('/files/download/file123')
+    assert response.headers['X-Accel-Redirect'] == '/protected/local-blob.enc'
+    assert response.headers['ETag'] == full.headers['ETag']
+    assert response.headers['Last-Modified'] == full.headers['Last-Modified']
+
+
+def test_get_my_files_keyset_pagination(test_client):
+    """
+    GIVEN a user with more files than fit on one page, in several statuses
+    WHEN '/files/my-files' is paged through with a status filter and small limit
+    THEN each page should continue after the previous one, newest first, without overlap.
+    """
+    # 1. Create files in the test database (same timestamp for some, to exercise the id tiebreak)
+    from src import db
+    from src.models import File
+    base = datetime(2024, 1, 1)
+    for i in range(5):
+        db.session.add(File(owner_user_id=42, filename=f'f{i}.bin', content_type='x', size=1,
+                            storage_path=f'p{i}', status='active', created_at=base + timedelta(minutes=i // 2)))
+    db.session.add(File(owner_user_id=42, filename='old.bin', content_type='x', size=1,
+                        storage_path='t', status='trashed', created_at=base))
+    db.session.commit()
+
+    headers = {'Authorization': f'Bearer {create_access_token(identity="42")}'}
+
+    # 2. Walk the pages
+    seen, cursor = [], None
+    while True:
+        params = {'status': 'active', 'limit': 2}
+        if cursor:
+            params['cursor'] = cursor
+        response = test_client.get('/files/my-files', headers=headers, query_string=params)
+        assert response.status_code == 200
+        seen.extend(file['filename'] for file in response.json)
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+
+    # 3. All active files, each once, newest first
+    assert sorted(seen) == [f'f{i}.bin' for i in range(5)]
+    assert seen[0] == 'f4.bin' and seen[-1] in ('f0.bin', 'f1.bin')
+
+    # 4. Bad input is rejected
+    assert test_client.get('/files/my-files?cursor=garbage', headers=headers).status_code == 400
+    assert test_client.get('/files/my-files?status=deleted', headers=headers).status_code == 400
+
+
+def test_bulk_status_and_delete(test_client):
+    """
+    GIVEN a user's files in the test database and local storage, plus someone else's file
+    WHEN files are trashed and then permanently deleted through the bulk endpoints
+    THEN each item should report its own outcome and only the caller's trashed files be removed.
+    """
+    # 1. Create the files and their blobs
+    from src import db
+    from src.models import File
+    mine = []
+    for i in range(3):
+        storage.put(f'bulk-{i}.enc', io.BytesIO(b'blob'))
+        file = File(owner_user_id=7, filename=f'b{i}', content_type='x', size=4, storage_path=f'bulk-{i}.enc')
+        db.session.add(file)
+        mine.append(file)
+    others = File(owner_user_id=8, filename='other', content_type='x', size=4, storage_path='other.enc')
+    db.session.add(others)
+    db.session.commit()
+    mine_ids = [file.id for file in mine]
+
+    headers = {'Authorization': f'Bearer {create_access_token(identity="7")}'}
+
+    # 2. Trash two of my files and try to trash someone else's
+    response = test_client.put('/files/bulk/status', headers=headers, json={
+        'file_ids': mine_ids[:2] + [others.id], 'status': 'trashed'
+    })
+    assert response.status_code == 200
+    assert [r['result'] for r in response.json['results']] == ['updated', 'updated', 'not_found']
+
+    # 3. Permanently delete all three of mine; the untrashed one is refused
+    response = test_client.post('/files/bulk/delete', headers=headers, json={'file_ids': mine_ids})
+    assert response.status_code == 200
+    assert [r['result'] for r in response.json['results']] == ['deleted', 'deleted', 'not_trashed']
+
+    # 4. Rows and blobs are gone for the deleted files only
+    assert File.query.filter(File.id.in_(mine_ids)).count() == 1
+    assert not storage.exists('bulk-0.enc')
+    assert storage.exists('bulk-2.enc')
+    assert db.session.get(File, others.id).status == 'active'
+
+    # 5. Malformed requests are rejected
+    assert test_client.post('/files/bulk/delete', headers=headers, json={'file_ids': []}).status_code == 400
+
+
+def test_download_file_conditional_requests(test_client, stored_file, mocker):
+    """
+    GIVEN a file whose etag was stored at upload time
+    WHEN it is downloaded, then revalidated with If-None-Match or If-Modified-Since
+    THEN the first response should carry cache headers and the revalidations get 304 without touching storage.
+    """
+    # 1. Mock the database lookup and Swift
+    stored_file.etag = 'abc123'
+
+    mock_body = MagicMock()
+    mock_body.__iter__.return_value = iter([b'ciphertext'])
+    mock_conn = use_swift_backend(mocker)
+    mock_conn.get_object.return_value = ({'content-length': '10'}, mock_body)
+
+    # 2. First download
+    response = test_client.get('/files/download/file123')
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"abc123"'
+    assert 'immutable' in response.headers['Cache-Control']
+    last_modified = response.headers['Last-Modified']
+
+    # 3. Revalidations
+    mock_conn.get_object.reset_mock()
+    response = test_client.get('/files/download/file123', headers={'If-None-Match': '"abc123"'})
+    assert response.status_code == 304
+    response = test_client.get('/files/download/file123', headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 304
+    mock_conn.get_object.assert_not_called()
+
+
+def test_usage_accounting_and_quota(test_client, mocker):
+    """
+    GIVEN a user with a storage quota
+    WHEN files are uploaded, trashed and deleted, and an upload would exceed the quota
+    THEN '/files/usage' should track bytes and counts per status and the oversized upload be refused with 413.
+    """
+    mocker.patch('src.routes.USER_QUOTA_BYTES', 10000)
+    headers = {'Authorization': f'Bearer {create_access_token(identity="9")}'}
+
+    def upload(size):
+        return test_client.post('/files/upload', headers=headers, content_type='multipart/form-data', data={
+            'file': (io.BytesIO(b'x' * size), 'f.bin'), 'filename': 'f.bin',
+            'contentType': 'application/octet-stream', 'size': str(size)
+        })
+
+    # 1. Two uploads are counted as active
+    first = upload(1000).json['file']
+    upload(2000)
+    usage = test_client.get('/files/usage', headers=headers).json
+    assert usage['quota'] == 10000
+    assert usage['by_status']['active'] == {"bytes": 3000, "files": 2}
+    assert usage['total'] == {"bytes": 3000, "files": 2}
+
+    # 2. Trashing moves the file between statuses; deleting removes it
+    test_client.put(f"/files/file/{first['id']}/status", headers=headers, json={'status': 'trashed'})
+    usage = test_client.get('/files/usage', headers=headers).json
+    assert usage['by_status']['active'] == {"bytes": 2000, "files": 1}
+    assert usage['by_status']['trashed'] == {"bytes": 1000, "files": 1}
+
+    test_client.delete(f"/files/file/{first['id']}", headers=headers)
+    usage = test_client.get('/files/usage', headers=headers).json
+    assert usage['by_status']['trashed'] == {"bytes": 0, "files": 0}
+    assert usage['total'] == {"bytes": 2000, "files": 1}
+
+    # 3. Uploads that don't fit are refused before anything is stored
+    put = mocker.spy(storage.backend, 'put')
+    assert upload(9000).status_code == 413
+    put.assert_not_called()
+    response = test_client.post('/files/uploads', headers=headers, json={
+        'filename': 'big.bin', 'contentType': 'x', 'size': 9000, 'segmentCount': 2
+    })
+    assert response.status_code == 413
+
+
+def test_upload_sessions_reserve_quota_until_they_expire(test_client, mocker):
+    """
+    GIVEN a user with a storage quota and an unfinished upload session
+    WHEN more space is requested, and again after the session has expired
+    THEN the session's size should count against the quota until it expires, after which it is gone.
+    """
+    from src import db
+    from src.models import UploadSession
+    mocker.patch('src.routes.USER_QUOTA_BYTES', 10000)
+    headers = {'Authorization': f'Bearer {create_access_token(identity="31")}'}
+
+    def start(size):
+        return test_client.post('/files/uploads', headers=headers, json={
+            'filename': 'big.bin', 'contentType': 'x', 'size': size, 'segmentCount': 2
+        })
+
+    # 1. An open session reserves its size
+    response = start(6000)
+    assert response.status_code == 201
+    upload_id = response.json['id']
+    assert response.json['expires_at'] is not None
+    assert start(6000).status_code == 413
+
+    # 2. Once expired, the session is refused and no longer reserves anything
+    UploadSession.query.filter_by(id=upload_id).first().expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    assert test_client.get(f'/files/uploads/{upload_id}', headers=headers).status_code == 404
+    assert test_client.put(f'/files/uploads/{upload_id}/segments/1', headers=headers, data=b'x').status_code == 404
+    assert start(6000).status_code == 201
+
+
+def test_direct_upload_and_download_urls(test_client, mocker):
+    """
+    GIVEN Swift with a TempURL key configured
+    WHEN a direct upload is started, confirmed, and a download URL is requested
+    THEN signed PUT/GET URLs valid for Swift's tempurl middleware should be issued and the File created on confirm.
+    """
+    import hmac
+    import hashlib
+    from urllib.parse import urlparse, parse_qs
+    from src.models import File
+
+    # 1. Swift with a TempURL key; the storage URL comes from the (mocked) connection
+    swift = MagicMock()
+    conn = swift.connection.return_value.__enter__.return_value
+    swift.checkout.return_value = conn
+    conn.url = 'http://swift.local:8080/v1/AUTH_test'
+    mocker.patch.object(storage, 'backend', SwiftStorage(swift, 'files', 64 * 1024, temp_url_key='s3cret'))
+    headers = {'Authorization': f'Bearer {create_access_token(identity="21")}'}
+
+    def assert_signed(url, method):
+        parsed = urlparse(url)
+        query = parse_qs(parsed.query)
+        expires = query['temp_url_expires'][0]
+        expected = hmac.new(b's3cret', f"{method}\n{expires}\n{parsed.path}".encode(), hashlib.sha256).hexdigest()
+        assert parsed.netloc == 'swift.local:8080'
+        assert parsed.path.startswith('/v1/AUTH_test/files/')
+        assert query['temp_url_sig'][0] == expected
+        return parsed, query
+
+    # 2. Start a direct upload
+    response = test_client.post('/files/direct-uploads', headers=headers, json={
+        'filename': 'direct.bin', 'contentType': 'application/octet-stream', 'size': 10
+    })
+    assert response.status_code == 201
+    upload_id = response.json['upload']['id']
+    parsed, _ = assert_signed(response.json['upload_url'], 'PUT')
+    storage_path = parsed.path.rsplit('/', 1)[1]
+
+    # 3. Confirming before the object exists is refused
+    conn.head_object.side_effect = ClientException('not found', http_status=404)
+    assert test_client.post(f'/files/uploads/{upload_id}/confirm', headers=headers).status_code == 409
+
+    # 4. Once it's there, confirm reads it back to hash it and creates the file
+    conn.head_object.side_effect = None
+    conn.head_object.return_value = {'content-length': '10', 'etag': '"abc"'}
+    body = MagicMock()
+    body.__iter__.return_value = iter([b'01234', b'56789'])
+    conn.get_object.return_value = ({'content-length': '10'}, body)
+    response = test_client.post(f'/files/uploads/{upload_id}/confirm', headers=headers)
+    assert response.status_code == 201
+    file_record = File.query.filter_by(id=response.json['file']['id']).first()
+    assert file_record.storage_path == storage_path and file_record.etag == 'abc'
+    assert file_record.sha256 == hashlib.sha256(b'0123456789').hexdigest()
+    assert test_client.post(f'/files/uploads/{upload_id}/confirm', headers=headers).status_code == 404
+
+    # 5. A signed GET URL for the file, with the download filename
+    response = test_client.get(f'/files/download-url/{file_record.id}')
+    assert response.status_code == 200
+    _, query = assert_signed(response.json['url'], 'GET')
+    assert query['filename'] == ['direct.bin']
+
+    # 6. An upload that no longer fits the quota on confirm is deleted with its session
+    mocker.patch('src.routes.USER_QUOTA_BYTES', 15)
+    response = test_client.post('/files/direct-uploads', headers=headers, json={
+        'filename': 'late.bin', 'contentType': 'application/octet-stream', 'size': 5
+    })
+    upload_id = response.json['upload']['id']
+    storage_path = urlparse(response.json['upload_url']).path.rsplit('/', 1)[1]
+    mocker.patch('src.routes.USER_QUOTA_BYTES', 12)
+    conn.head_object.return_value = {'content-length': '5', 'etag': '"def"'}
+    assert test_client.post(f'/files/uploads/{upload_id}/confirm', headers=headers).status_code == 413
+    assert conn.delete_object.call_args[0][1] == storage_path
+    assert test_client.get(f'/files/uploads/{upload_id}', headers=headers).status_code == 404
+
+
+def test_direct_transfers_unsupported_on_local_storage(test_client):
+    """
+    GIVEN the local storage backend
+    WHEN a direct upload is requested
+    THEN it should answer 501 so the client falls back to uploading through the service.
+    """
+    headers = {'Authorization': f'Bearer {create_access_token(identity="22")}'}
+    response = test_client.post('/files/direct-uploads', headers=headers, json={
+        'filename': 'direct.bin', 'contentType': 'application/octet-stream', 'size': 10
+    })
+    assert response.status_code == 501
+
+
+def test_internal_share_meta_requires_token(test_client, mocker):
+    """
+    GIVEN a file and the internal API token
+    WHEN '/files/internal/share-meta/<id>' is called with and without the token
+    THEN only the call carrying the token should get the metadata.
+    """
+    from src import db
+    from src.models import File
+    mocker.patch('src.routes.INTERNAL_API_TOKEN', 'internal-secret')
+    file_record = File(owner_user_id=31, filename='shared.bin', content_type='x', size=5, storage_path='shared.enc')
+    db.session.add(file_record)
+    db.session.commit()
+
+    url = f'/files/internal/share-meta/{file_record.id}'
+    assert test_client.get(url).status_code == 403
+    assert test_client.get(url, headers={'X-Internal-Token': 'wrong'}).status_code == 403
+
+    response = test_client.get(url, headers={'X-Internal-Token': 'internal-secret'})
+    assert response.status_code == 200
+    assert response.json['filename'] == 'shared.bin' and response.json['size'] == 5
+    # The local backend can't sign URLs; access_service falls back to /files/download
+    assert response.json['download_url'] is None
@@ -0,0 +1,186 @@
+import threading
+from unittest.mock import MagicMock
+import pytest
+from swiftclient.exceptions import ClientException
+from src.swift import SwiftConnectionManager, SwiftPoolExhausted
+
+
+def make_manager(tmp_path, mocker, token_ttl=3600, pool_size=4):
+    """Builds a manager whose swiftclient.Connection is a mock that authenticates on demand."""
+    connection_cls = mocker.patch('src.swift.swiftclient.Connection')
+
+    def new_connection(**kwargs):
+        conn = MagicMock()
+        conn.url = conn.token = None
+        conn.get_auth.return_value = ('http://swift/v1/AUTH_test', f'token-{connection_cls.call_count}')
+        return conn
+
+    connection_cls.side_effect = new_connection
+
+    manager = SwiftConnectionManager()
+    manager.config = {
+        'authurl': 'http://swift/auth/v1.0', 'user': 'test:tester', 'key': 'testing',
+        'container': 'files', 'retries': 5, 'starting_backoff': 1, 'max_backoff': 16,
+        'timeout': None, 'token_ttl': token_ttl,
+        'token_cache_file': str(tmp_path / 'swift-token.json'), 'pool_timeout': 1,
+    }
+    manager.resize(pool_size)
+    return manager, connection_cls
+
+
+def test_connections_are_reused_and_bounded(tmp_path, mocker):
+    """
+    GIVEN a pool of two connections
+    WHEN connections are checked out one after another, then three at once
+    THEN the warm connection should be reused, and the third borrower should wait until one is given back.
+    """
+    manager, connection_cls = make_manager(tmp_path, mocker, pool_size=2)
+
+    with manager.connection() as first:
+        pass
+    with manager.connection() as second:
+        pass
+    assert first is second
+    assert connection_cls.call_count == 1
+    first.get_auth.assert_called_once()
+
+    held = [manager.checkout(), manager.checkout()]
+    with pytest.raises(SwiftPoolExhausted):
+        manager.checkout()
+
+    result = {}
+    waiter = threading.Thread(target=lambda: result.update(conn=manager.checkout()))
+    waiter.start()
+    manager.checkin(held[1])
+    waiter.join()
+
+    assert result['conn'] is held[1]
+    assert connection_cls.call_count == 2
+
+
+def test_token_is_shared_between_threads_and_workers(tmp_path, mocker):
+    """
+    GIVEN a token obtained by one thread, which still holds its connection
+    WHEN another thread, or another worker reading the token file, needs a connection
+    THEN it should reuse the cached token instead of authenticating again.
+    """
+    manager, _ = make_manager(tmp_path, mocker)
+    first = manager.checkout()
+
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(conn=manager.checkout()))
+    thread.start()
+    thread.join()
+
+    assert result['conn'] is not first
+    assert result['conn'].token == first.token
+    result['conn'].get_auth.assert_not_called()
+
+    # A new worker process only has the token file to go on
+    other_worker, _ = make_manager(tmp_path, mocker)
+    other_worker.config['token_cache_file'] = manager.config['token_cache_file']
+    assert other_worker.checkout().token == first.token
+
+
+def test_expired_or_refreshed_tokens_are_replaced(tmp_path, mocker):
+    """
+    GIVEN a cached token
+    WHEN it expires, or a connection re-authenticates by itself after a 401
+    THEN the manager should fetch or publish the new token.
+    """
+    manager, _ = make_manager(tmp_path, mocker, token_ttl=-1)
+    with manager.connection() as conn:
+        pass
+    with manager.connection():
+        pass
+    assert conn.get_auth.call_count == 2
+
+    manager, _ = make_manager(tmp_path, mocker)
+    with manager.connection() as conn:
+        conn.token = 'token-from-401-retry'
+
+    with manager.connection() as conn:
+        assert conn.token == 'token-from-401-retry'
+    assert manager._load_token()[1] == 'token-from-401-retry'
+
+
+def test_download_holds_its_connection_until_the_body_is_closed(tmp_path, mocker):
+    """
+    GIVEN a pool of one connection
+    WHEN an object is opened for streaming
+    THEN the connection should stay checked out until the body is closed.
+    """
+    from src.storage import SwiftStorage
+    manager, _ = make_manager(tmp_path, mocker, pool_size=1)
+    with manager.connection() as conn:
+        swift_body = MagicMock()
+        swift_body.__iter__.return_value = iter([b'abc'])
+        conn.get_object.return_value = ({'content-length': '3'}, swift_body)
+
+    _, _, body = SwiftStorage(manager, 'files', 64 * 1024).get('blob')
+    with pytest.raises(SwiftPoolExhausted):
+        manager.checkout()
+
+    assert list(body) == [b'abc']
+    body.close()
+    swift_body.close.assert_called_once()
+    assert manager.checkout() is conn
+
+
+def test_head_download_gives_its_connection_back(test_client, stored_file, tmp_path, mocker):
+    """
+    GIVEN a file stored in Swift behind a pool of two connections
+    WHEN its download is requested with HEAD, which never reads the body, and then with GET
+    THEN both should answer, and the pool should be full again after each.
+    """
+    from src import storage
+    from src.storage import SwiftStorage
+    manager, _ = make_manager(tmp_path, mocker, pool_size=2)
+    with manager.connection() as conn:
+        conn.get_object.side_effect = lambda *args, **kwargs: ({'content-length': '3'}, MagicMock(__iter__=lambda self: iter([b'abc'])))
+    mocker.patch.object(storage, 'backend', SwiftStorage(manager, 'files', 64 * 1024))
+    stored_file.etag = 'abc123'
+
+    # The WSGI server closes each response once it is sent, as the test client does on close()
+    for _ in range(3):
+        response = test_client.head('/files/download/file123')
+        assert response.status_code == 200
+        response.close()
+        assert manager._pool.qsize() == 2
+    response = test_client.get('/files/download/file123')
+    assert response.data == b'abc'
+    response.close()
+    assert manager._pool.qsize() == 2
+
+
+def test_container_is_checked_by_a_one_shot_command(tmp_path, mocker):
+    """
+    GIVEN a Swift-backed app whose container doesn't exist yet
+    WHEN the app starts, and then 'ensure-swift-container' runs
+    THEN starting should not contact Swift, and the command should create the
+    container on a connection of its own with short retries and timeout.
+    """
+    from flask import Flask
+    from src.swift import ensure_swift_container_command
+    manager, connection_cls = make_manager(tmp_path, mocker)
+    app = Flask(__name__)
+    app.config.update(SWIFT_AUTH_URL='http://swift/auth/v1.0', SWIFT_CONTAINER='files',
+                      SWIFT_TEMPURL_KEY='s3cret', SWIFT_TOKEN_CACHE_FILE=str(tmp_path / 'swift-token.json'))
+    manager.init_app(app)
+    connection_cls.assert_not_called()
+
+    app.cli.add_command(ensure_swift_container_command)
+    connection_cls.side_effect = None
+    conn = connection_cls.return_value
+    conn.token = None
+    conn.get_auth.return_value = ('http://swift/v1/AUTH_test', 'token-1')
+    conn.head_container.side_effect = ClientException('not found', http_status=404)
+
+    with app.app_context():
+        result = app.test_cli_runner().invoke(args=['ensure-swift-container', '--timeout', '5'])
+
+    assert result.exit_code == 0, result.output
+    _, kwargs = connection_cls.call_args
+    assert kwargs['retries'] == 1 and kwargs['timeout'] == 5
+    conn.put_container.assert_called_once_with('files', headers={'x-container-meta-temp-url-key': 's3cret'})
+    conn.close.assert_called_once()